@@ -0,0 +1,272 @@
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from google import genai
+from google.genai import types
+from llama_index.core import Settings
+from llama_index.llms.google_genai import GoogleGenAI
+from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+from embedding_cache import CachedEmbedding
+from query_router import QueryRouter, ROUTE_SQL, ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE, RETRIEVAL_ROUTES
+from sql_guard import SQLTimeoutError, statement_deadline
+from sql_rows import sql_rows_context
+from tool_executor import ToolExecutor
+from latency_metrics import metrics
+from tools import get_current_weather
+
+# --- Configuration ---
+MODEL_NAME = "gemini-2.5-flash"
+REQUEST_TIMEOUT_S = 60.0       # whole turn: routing + retrieval + generation
+RETRIEVAL_TIMEOUT_S = 20.0     # one retriever; a slow one degrades to "unavailable" instead of failing the turn
+MAX_CONCURRENT_REQUESTS = 256  # admitted turns per worker; the rest wait for a slot
+RETRIEVAL_LIMITS = {ROUTE_SQL: 8, ROUTE_RAG: 32}  # concurrent calls per backend (DB pool size, vector store)
+MAX_SESSIONS = 10_000
+SESSION_IDLE_S = 1800.0
+
+
+# --- 1. TOOL DEFINITION (Function Calling) ---
+# get_current_weather is shared by all agents; see tools.py for its TTL cache policy (per normalized city)
+
+
+def _query_until(engine, prompt: str, deadline: float):
+    """engine.query in a worker thread; SQL statements are cancelled by the driver at the deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()   # queued behind other lookups until the caller gave up
+    with statement_deadline(remaining):
+        return engine.query(prompt)
+
+
+# --- 2. PER-USER SESSION ---
+class Session:
+    """One conversation: an async chat plus a lock so its turns stay in order."""
+
+    def __init__(self, chat):
+        self.chat = chat
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+# --- 3. ASYNC FAN-OUT AGENT ---
+class AsyncUltimateAgent:
+    """
+    Serves many conversations from one event loop.
+    Each turn is routed locally, the needed retrievals (SQL, vector) run concurrently with their own
+    timeouts, and the answer comes from the session's async chat (which still calls the tools).
+    Different sessions never wait on each other; turns of the same session are serialized.
+    """
+
+    def __init__(self, client: genai.Client, config: types.GenerateContentConfig, sql_engine=None,
+                 rag_engine=None, router: QueryRouter | None = None, tool_executor: ToolExecutor | None = None,
+                 model: str = MODEL_NAME,
+                 request_timeout_s: float = REQUEST_TIMEOUT_S, retrieval_timeout_s: float = RETRIEVAL_TIMEOUT_S,
+                 max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS):
+        self.client = client
+        self.config = config
+        self.model = model
+        self.router = router
+        self.tool_executor = tool_executor  # runs a turn's function calls in parallel (config must disable AFC)
+        self.request_timeout_s = request_timeout_s
+        self.retrieval_timeout_s = retrieval_timeout_s
+        self.retrievers = {}
+        if sql_engine is not None:
+            self.retrievers[ROUTE_SQL] = sql_engine
+        if rag_engine is not None:
+            self.retrievers[ROUTE_RAG] = rag_engine
+        self._limits = {route: asyncio.Semaphore(RETRIEVAL_LIMITS.get(route, 8)) for route in self.retrievers}
+        # Own pool for the blocking SQL path, sized like its limit, so it never competes with
+        # asyncio.to_thread work (routing) for the loop's default executor
+        self._sql_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_LIMITS[ROUTE_SQL], thread_name_prefix="sql-retrieval") \
+            if ROUTE_SQL in self.retrievers else None
+        self._admission = asyncio.Semaphore(max_concurrent_requests)
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self.stats = {"requests": 0, "timeouts": 0, "cancelled": 0, "errors": 0, "retrieval_timeouts": 0}
+
+    # --- Sessions ---
+    def session(self, session_id: str) -> Session:
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(self.client.aio.chats.create(model=self.model, config=self.config))
+            self._sessions[session_id] = session
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        # Oldest sessions first: drop idle ones, and the least recently used beyond the cap
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= MAX_SESSIONS and now - oldest.last_used < SESSION_IDLE_S:
+                break
+            if oldest.lock.locked():
+                break
+            del self._sessions[oldest_id]
+        return session
+
+    def end_session(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def shutdown(self) -> None:
+        if self._sql_executor is not None:
+            self._sql_executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Retrieval ---
+    async def _retrieve(self, route: str, prompt: str) -> str:
+        engine = self.retrievers[route]
+        async with self._limits[route]:
+            try:
+                with metrics.span(route, "async_agent"):
+                    if route == ROUTE_SQL:
+                        # DB drivers (pyodbc) block, and the SQL cache / schema-retrieval wrappers are sync-only.
+                        # wait_for cannot stop the thread, so a BoundedSQLDatabase statement carries the same deadline.
+                        deadline = time.monotonic() + self.retrieval_timeout_s
+                        response = await asyncio.wait_for(
+                            asyncio.get_running_loop().run_in_executor(
+                                self._sql_executor, _query_until, engine, prompt, deadline),
+                            self.retrieval_timeout_s)
+                    else:
+                        response = await asyncio.wait_for(engine.aquery(prompt), self.retrieval_timeout_s)
+            except (asyncio.TimeoutError, SQLTimeoutError):
+                self.stats["retrieval_timeouts"] += 1
+                print(f"({route.upper()} retrieval timed out after {self.retrieval_timeout_s:.0f}s.)")
+                return f"{route.upper()} DATA UNAVAILABLE: the lookup timed out."
+            except Exception as e:
+                print(f"({route.upper()} retrieval failed: {e.__class__.__name__})")
+                return f"{route.upper()} DATA UNAVAILABLE: Error: {e.__class__.__name__}"
+        if route == ROUTE_SQL and "result" in (response.metadata or {}):
+            return sql_rows_context(response.metadata)
+        return response.response.strip()
+
+    async def _routes(self, prompt: str) -> list[str]:
+        if self.router is None:
+            return list(self.retrievers)
+        # Routing may embed the prompt (one network call), so keep it off the event loop
+        decision = await asyncio.to_thread(self.router.route, prompt)
+        return decision.routes
+
+    async def _answer(self, session_id: str, prompt: str) -> str:
+        routes = await self._routes(prompt)
+        wanted = [r for r in routes if r in self.retrievers]
+        # Independent retrievals run concurrently; cancellation of the turn cancels all of them
+        contexts = await asyncio.gather(*(self._retrieve(r, prompt) for r in wanted))
+
+        if wanted:
+            data_context = "\n\n".join(f"[{r.upper()}]\n{c}" for r, c in zip(wanted, contexts))
+            message = (
+                f"DATA CONTEXT: {data_context}\n\n"
+                f"Based ONLY on the DATA CONTEXT and your available tools, answer the user's question: {prompt}"
+            )
+        elif any(r in RETRIEVAL_ROUTES for r in routes):
+            message = (
+                "DATA CONTEXT: DATA UNAVAILABLE. No retriever is configured for this question.\n\n"
+                f"Answer the user's question if your available tools allow it: {prompt}"
+            )
+        else:
+            message = prompt  # tool-only / general question: no retrieval at all
+
+        session = self.session(session_id)
+        async with session.lock:
+            if self.tool_executor is not None:
+                response = await self.tool_executor.asend_message(session.chat, message, site="async_agent")
+            else:
+                response = await metrics.asend_message(session.chat, message, "async_agent")
+        return response.text.strip()
+
+    async def run_ultimate_query(self, prompt: str, session_id: str = "default") -> str:
+        """
+        Answers one user turn. Raises asyncio.TimeoutError after request_timeout_s;
+        cancelling the calling task cancels retrieval and generation in flight.
+        """
+        async with self._admission:
+            self.stats["requests"] += 1
+            try:
+                return await asyncio.wait_for(self._answer(session_id, prompt), self.request_timeout_s)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except asyncio.CancelledError:
+                self.stats["cancelled"] += 1
+                raise
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+
+
+# --- 4. DEMO: several concurrent conversations on one event loop ---
+async def main():
+    from sqlalchemy import MetaData, Table, Column, String, Integer
+    from db_engines import create_sql_engine
+    from sql_guard import BoundedSQLDatabase
+    from llama_index.core import SQLDatabase
+    from llama_index.core.query_engine import NLSQLTableQueryEngine
+    from ingestion import sync_index, VECTOR_BACKEND
+
+    Settings.llm = GoogleGenAI(model=MODEL_NAME)
+    Settings.embed_model = CachedEmbedding(GoogleGenAIEmbedding(model_name="models/embedding-001"))
+    client = genai.Client()
+
+    # In-memory demo database; the factory's StaticPool shares the one connection with the worker threads
+    engine = create_sql_engine("sqlite:///:memory:")
+    metadata_obj = MetaData()
+    employee_table = Table(
+        'employee_info',
+        metadata_obj,
+        Column('employee_id', Integer, primary_key=True),
+        Column('name', String(50)),
+        Column('department', String(50)),
+        Column('salary', Integer),
+    )
+    metadata_obj.create_all(engine)
+    with engine.connect() as connection:
+        connection.execute(employee_table.insert(), [
+            {'name': 'Alice Johnson', 'department': 'Marketing', 'salary': 65000},
+            {'name': 'Bob Smith', 'department': 'Sales', 'salary': 92000},
+            {'name': 'David Lee', 'department': 'Sales', 'salary': 88000},
+        ])
+        connection.commit()
+    sql_engine = NLSQLTableQueryEngine(
+        sql_database=BoundedSQLDatabase(SQLDatabase(engine, include_tables=['employee_info']),
+                                        timeout_s=RETRIEVAL_TIMEOUT_S),
+        tables=['employee_info'],
+        llm=Settings.llm,
+        synthesize_response=False,  # raw rows go straight into the chat turn
+    )
+
+    rag_engine = None
+    try:
+        index = await asyncio.to_thread(sync_index, "./data", "./chroma_db", backend=VECTOR_BACKEND)
+        rag_engine = index.as_query_engine()
+    except Exception as e:
+        print(f"RAG Indexing Failed: {e.__class__.__name__}. RAG functionality disabled.")
+
+    tool_executor = ToolExecutor([get_current_weather])
+    config = tool_executor.config(
+        system_instruction="You are a highly professional Corporate Information Assistant. Maintain a formal, concise tone.",
+    )
+    agent = AsyncUltimateAgent(
+        client, config, sql_engine=sql_engine, rag_engine=rag_engine,
+        router=QueryRouter(Settings.embed_model, routes=[ROUTE_SQL, ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE]),
+        tool_executor=tool_executor,
+    )
+
+    questions = {
+        "user-1": "Who has the highest salary in the Sales department?",
+        "user-2": "What is the mileage reimbursement rate?",
+        "user-3": "What are the current weather conditions in Boston?",
+        "user-4": "What is the remote work policy, and how many employees are in Sales?",
+    }
+    start = time.perf_counter()
+    answers = await asyncio.gather(
+        *(agent.run_ultimate_query(q, session_id=s) for s, q in questions.items()), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    for (session_id, question), answer in zip(questions.items(), answers):
+        print(f"\n[{session_id}] User: {question}\nAgent: {answer}")
+    print(f"\n{len(questions)} concurrent turns in {elapsed:.2f}s. Stats: {agent.stats}")
+    print(f"Tool latency: {tool_executor.stats()}")
+    tool_executor.shutdown()
+    agent.shutdown()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
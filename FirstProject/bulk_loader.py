@@ -0,0 +1,222 @@
+import os
+import csv
+import json
+import time
+import itertools
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from sqlalchemy import MetaData, Table, Column, String, Integer, Float, Date, Index, ForeignKey
+
+# --- Configuration ---
+BATCH_SIZE = {"mssql": 10_000, "sqlite": 50_000}   # rows per executemany call
+DEFAULT_BATCH_SIZE = 10_000
+# Safe for throwaway demo / load-test databases only: a crash mid-load can corrupt the file
+SQLITE_BULK_PRAGMAS = {"synchronous": "OFF", "journal_mode": "MEMORY", "temp_store": "MEMORY", "cache_size": "-262144"}
+
+
+# --- 1. STREAMING READERS ---
+def _batched(rows, batch_size: int):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch
+
+
+def read_batches(source, columns: list[str], batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Yields lists of row tuples in `columns` order from a CSV / JSONL / Parquet path, or from an
+    iterable of tuples or dicts. Files are streamed; at most one batch is held in memory.
+    """
+    if not isinstance(source, str):
+        for batch in _batched(source, batch_size):
+            if batch and isinstance(batch[0], dict):
+                batch = [tuple(row.get(c) for c in columns) for row in batch]
+            yield batch
+        return
+
+    ext = os.path.splitext(source)[1].lower()
+    if ext == ".parquet":
+        import pyarrow.parquet as pq   # optional dependency, only needed for Parquet input
+
+        for record_batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size, columns=columns):
+            yield list(zip(*(record_batch.column(c).to_pylist() for c in columns)))
+    elif ext == ".csv":
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            positions = [header.index(c) for c in columns]
+            # Empty CSV fields are NULLs, not empty strings
+            rows = (tuple(row[p] if row[p] != "" else None for p in positions) for row in reader)
+            yield from _batched(rows, batch_size)
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            rows = (tuple(obj.get(c) for c in columns) for obj in map(json.loads, f) if obj)
+            yield from _batched(rows, batch_size)
+
+
+# --- 2. BULK LOADER ---
+@contextmanager
+def _sqlite_bulk_mode(connection):
+    """Relaxed durability for the load, restored afterwards (journal_mode cannot change inside a transaction)."""
+    previous = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_BULK_PRAGMAS}
+    for name, value in SQLITE_BULK_PRAGMAS.items():
+        connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+    connection.commit()
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+        connection.commit()
+
+
+class BulkLoader:
+    """
+    Loads large row streams into a table: one DBAPI executemany per batch of plain tuples
+    (fast_executemany on mssql+pyodbc, see db_engines.create_sql_engine), the whole load in a single
+    transaction with bulk pragmas on SQLite, and the table's secondary indexes dropped before and
+    built once after the load instead of being maintained row by row.
+    """
+
+    def __init__(self, engine, batch_size: int | None = None):
+        self.engine = engine
+        self.dialect = engine.dialect
+        self.batch_size = batch_size or BATCH_SIZE.get(self.dialect.name, DEFAULT_BATCH_SIZE)
+
+    def _insert_sql(self, table: Table, columns: list[str]) -> str:
+        quote = self.dialect.identifier_preparer.quote
+        marker = {"qmark": "?", "format": "%s", "pyformat": "%s"}.get(self.dialect.paramstyle)
+        if marker is None:
+            raise ValueError(f"Unsupported DBAPI paramstyle for bulk loading: {self.dialect.paramstyle}")
+        return (f"INSERT INTO {self.dialect.identifier_preparer.format_table(table)} "
+                f"({', '.join(quote(c) for c in columns)}) VALUES ({', '.join([marker] * len(columns))})")
+
+    def load(self, table: Table, source, columns: list[str] | None = None) -> dict:
+        """
+        Creates `table` if needed and appends every row of `source` (see read_batches).
+        Returns:
+            {"table", "rows", "load_s", "index_s", "rows_per_s"}
+        """
+        columns = columns or [c.name for c in table.columns]
+        insert_sql = self._insert_sql(table, columns)
+        table_name = self.dialect.identifier_preparer.format_table(table)
+        # Explicit ids into a SQL Server IDENTITY column need IDENTITY_INSERT for the duration of the load
+        identity = self.dialect.name == "mssql" and table.autoincrement_column is not None \
+            and table.autoincrement_column.name in columns
+        rows, start = 0, time.perf_counter()
+        with self.engine.connect() as connection:
+            bulk_mode = _sqlite_bulk_mode(connection) if self.dialect.name == "sqlite" else nullcontext()
+            with bulk_mode:
+                with connection.begin():
+                    table.create(connection, checkfirst=True)
+                    for index in table.indexes:
+                        index.drop(connection, checkfirst=True)
+                    if identity:
+                        connection.exec_driver_sql(f"SET IDENTITY_INSERT {table_name} ON")
+                    for batch in read_batches(source, columns, self.batch_size):
+                        connection.exec_driver_sql(insert_sql, batch)
+                        rows += len(batch)
+                    if identity:
+                        connection.exec_driver_sql(f"SET IDENTITY_INSERT {table_name} OFF")
+                    load_s = time.perf_counter() - start
+                    for index in table.indexes:
+                        index.create(connection)
+        index_s = time.perf_counter() - start - load_s
+        stats = {"table": table.name, "rows": rows, "load_s": load_s, "index_s": index_s,
+                 "rows_per_s": rows / max(load_s + index_s, 1e-9)}
+        print(f"(Bulk loader: {rows:,} row(s) into {table.name} in {load_s:.2f}s + {index_s:.2f}s indexes, "
+              f"{stats['rows_per_s']:,.0f} rows/s.)")
+        return stats
+
+
+# --- 3. SYNTHETIC DEMO DATABASE (load tests / text-to-SQL benchmarks) ---
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "David", "Emily", "Fatima", "George", "Hana", "Ivan", "Julia",
+               "Kenji", "Laura", "Mohammed", "Nina", "Oscar", "Priya", "Quentin", "Rosa", "Sam", "Tara"]
+LAST_NAMES = ["Johnson", "Smith", "Brown", "Lee", "Davis", "Khan", "Garcia", "Müller", "Tanaka", "Rossi",
+              "Nguyen", "Okafor", "Silva", "Kowalski", "Dubois", "Cohen", "Larsen", "Patel", "Wright", "Moreau"]
+DEPARTMENTS = ["Marketing", "Sales", "Finance", "Engineering", "HR", "Legal", "Operations", "Support"]
+CATEGORIES = ["Laptops", "Monitors", "Phones", "Tablets", "Accessories", "Audio", "Networking", "Storage"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+
+def demo_tables(metadata_obj: MetaData | None = None) -> dict[str, Table]:
+    """employee_info (as in the agents) plus Product_Catalog and Sales_Data for the SQL Server agent."""
+    metadata_obj = metadata_obj or MetaData()
+    return {
+        "employee_info": Table(
+            "employee_info", metadata_obj,
+            Column("employee_id", Integer, primary_key=True),
+            Column("name", String(50)),
+            Column("department", String(50)),
+            Column("salary", Integer),
+            Index("ix_employee_info_department", "department"),
+        ),
+        "Product_Catalog": Table(
+            "Product_Catalog", metadata_obj,
+            Column("product_id", Integer, primary_key=True),
+            Column("product_name", String(100)),
+            Column("category", String(50)),
+            Column("unit_price", Float),
+            Index("ix_product_catalog_category", "category"),
+        ),
+        "Sales_Data": Table(
+            "Sales_Data", metadata_obj,
+            Column("sale_id", Integer, primary_key=True),
+            Column("product_id", Integer, ForeignKey("Product_Catalog.product_id")),
+            Column("employee_id", Integer, ForeignKey("employee_info.employee_id")),
+            Column("sale_date", Date),
+            Column("region", String(20)),
+            Column("quantity", Integer),
+            Column("amount", Float),
+            Index("ix_sales_data_sale_date", "sale_date"),
+            Index("ix_sales_data_product_id", "product_id"),
+            Index("ix_sales_data_employee_id", "employee_id"),
+        ),
+    }
+
+
+def synthetic_rows(table_name: str, count: int, seed: int = 0, products: int = 2_000, employees: int = 10_000,
+                   batch_size: int = DEFAULT_BATCH_SIZE):
+    """Row tuples for a demo table, generated column-wise with NumPy one batch at a time."""
+    rng = np.random.default_rng(seed)
+    start_date = np.datetime64("2020-01-01")
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        ids = range(offset + 1, offset + n + 1)
+        if table_name == "employee_info":
+            first = rng.integers(len(FIRST_NAMES), size=n)
+            last = rng.integers(len(LAST_NAMES), size=n)
+            names = [f"{FIRST_NAMES[f]} {LAST_NAMES[l]}" for f, l in zip(first.tolist(), last.tolist())]
+            departments = [DEPARTMENTS[d] for d in rng.integers(len(DEPARTMENTS), size=n).tolist()]
+            salaries = (rng.lognormal(11.2, 0.3, size=n) // 100 * 100).astype(int).tolist()
+            yield from zip(ids, names, departments, salaries)
+        elif table_name == "Product_Catalog":
+            categories = rng.integers(len(CATEGORIES), size=n).tolist()
+            names = [f"{CATEGORIES[c]} Model {i:05d}" for c, i in zip(categories, ids)]
+            prices = np.round(rng.lognormal(5.0, 0.8, size=n), 2).tolist()
+            yield from zip(ids, names, (CATEGORIES[c] for c in categories), prices)
+        elif table_name == "Sales_Data":
+            dates = (start_date + rng.integers(0, 5 * 365, size=n)).astype("datetime64[D]").astype(str).tolist()
+            quantities = rng.integers(1, 20, size=n)
+            amounts = np.round(quantities * rng.lognormal(5.0, 0.8, size=n), 2).tolist()
+            yield from zip(ids, rng.integers(1, products + 1, size=n).tolist(),
+                           rng.integers(1, employees + 1, size=n).tolist(), dates,
+                           (REGIONS[r] for r in rng.integers(len(REGIONS), size=n).tolist()),
+                           quantities.tolist(), amounts)
+        else:
+            raise ValueError(f"No synthetic data for table {table_name}")
+
+
+def build_demo_database(engine, employees: int = 10_000, products: int = 2_000, sales: int = 1_000_000,
+                        seed: int = 0) -> list[dict]:
+    """
+    Fills employee_info, Product_Catalog and Sales_Data with realistic synthetic rows.
+    Example (a file-backed benchmark database):
+        build_demo_database(create_sql_engine("sqlite:///./cache/demo_sales.db"), sales=5_000_000)
+    """
+    tables = demo_tables()
+    loader = BulkLoader(engine)
+    counts = {"employee_info": employees, "Product_Catalog": products, "Sales_Data": sales}
+    return [
+        loader.load(tables[name], synthetic_rows(name, count, seed, products, employees, loader.batch_size))
+        for name, count in counts.items()
+    ]
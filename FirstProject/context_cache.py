@@ -0,0 +1,201 @@
+import time
+import atexit
+import inspect
+import threading
+from dataclasses import dataclass
+from google.genai import types
+from semantic_cache import fingerprint
+from token_estimator import get_estimator
+
+# --- Configuration ---
+CACHE_TTL_S = 3600
+RENEW_MARGIN_S = 300          # extend a handle's TTL once it is this close to expiring
+RENEW_INTERVAL_S = 60         # background renewal check
+# Explicit caching is only accepted above a per-model prompt size
+MIN_CACHE_TOKENS = {"gemini-2.5-flash": 1024, "gemini-2.5-pro": 4096}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+
+@dataclass
+class CacheHandle:
+    name: str
+    model: str
+    key: str
+    expire_at: float      # epoch seconds
+    tokens: int           # estimated size of the cached prefix
+
+
+def tool_declaration(tool):
+    """Python callables become FunctionDeclarations (cached content cannot hold callables)."""
+    if callable(tool):
+        return types.Tool(function_declarations=[types.FunctionDeclaration.from_callable_with_api_option(callable=tool)])
+    return tool
+
+
+def tool_signature(tool) -> str:
+    if callable(tool):
+        return f"{tool.__name__}{inspect.signature(tool)}{tool.__doc__ or ''}"
+    return str(tool)
+
+
+# --- 1. BACKENDS ---
+class GeminiCacheBackend:
+    """client.caches (explicit context caching)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model: str, system_instruction, tools, contents, ttl_s: int, display_name: str) -> tuple[str, float]:
+        cached = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=system_instruction,
+                tools=[tool_declaration(t) for t in tools] or None,
+                contents=contents or None,
+                ttl=f"{ttl_s}s",
+            ),
+        )
+        return cached.name, cached.expire_time.timestamp()
+
+    def renew(self, name: str, ttl_s: int) -> float:
+        cached = self.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl_s}s"))
+        return cached.expire_time.timestamp()
+
+    def delete(self, name: str) -> None:
+        self.client.caches.delete(name=name)
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for offline tests: same calls, no network, records what happened."""
+
+    def __init__(self):
+        self.caches: dict[str, dict] = {}
+        self.calls = {"create": 0, "renew": 0, "delete": 0}
+
+    def create(self, model: str, system_instruction, tools, contents, ttl_s: int, display_name: str) -> tuple[str, float]:
+        self.calls["create"] += 1
+        name = f"cachedContents/fake-{self.calls['create']}"
+        self.caches[name] = {"model": model, "display_name": display_name, "expire_at": time.time() + ttl_s,
+                             "system_instruction": system_instruction, "tools": tools, "contents": contents}
+        return name, self.caches[name]["expire_at"]
+
+    def renew(self, name: str, ttl_s: int) -> float:
+        self.calls["renew"] += 1
+        if name not in self.caches or self.caches[name]["expire_at"] < time.time():
+            raise KeyError(f"{name} not found")
+        self.caches[name]["expire_at"] = time.time() + ttl_s
+        return self.caches[name]["expire_at"]
+
+    def delete(self, name: str) -> None:
+        self.calls["delete"] += 1
+        self.caches.pop(name, None)
+
+
+# --- 2. CACHE MANAGER ---
+class ContextCacheManager:
+    """
+    Creates and reuses cached-content handles for the stable prefix of every request
+    (system instruction, tool declarations, fixed documents). Handles are keyed by model + content hash,
+    extended before they expire, re-created if they vanished, and deleted on shutdown.
+    Prefixes below the model's minimum cacheable size are not cached (callers keep their plain config).
+    """
+
+    def __init__(self, backend, ttl_s: int = CACHE_TTL_S, renew_margin_s: int = RENEW_MARGIN_S):
+        self.backend = backend
+        self.ttl_s = ttl_s
+        self.renew_margin_s = renew_margin_s
+        self.handles: dict[str, CacheHandle] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._renewer = None
+        self.stats = {"created": 0, "reused": 0, "renewed": 0, "recreated": 0, "too_small": 0, "errors": 0}
+        atexit.register(self.close)
+
+    def _key(self, model: str, system_instruction, tools, contents) -> str:
+        return fingerprint(model, str(system_instruction or ""), *(tool_signature(t) for t in tools),
+                           *(str(c) for c in contents))
+
+    def get(self, model: str, system_instruction=None, tools: list | None = None, contents: list | None = None) -> str | None:
+        """Cached-content name for this prefix, or None when it is too small to cache (or caching failed)."""
+        tools, contents = list(tools or []), list(contents or [])
+        key = self._key(model, system_instruction, tools, contents)
+        with self._lock:
+            handle = self.handles.get(key)
+            now = time.time()
+            if handle is not None:
+                if handle.expire_at - now > self.renew_margin_s:
+                    self.stats["reused"] += 1
+                    return handle.name
+                if self._renew(handle):
+                    return handle.name
+                del self.handles[key]
+                self.stats["recreated"] += 1
+
+            estimator = get_estimator(model)
+            tokens = estimator.count(system_instruction) + estimator.count(contents) + \
+                sum(estimator.count(tool_signature(t)) for t in tools)
+            if tokens < MIN_CACHE_TOKENS.get(model, DEFAULT_MIN_CACHE_TOKENS):
+                self.stats["too_small"] += 1
+                return None
+            try:
+                name, expire_at = self.backend.create(model, system_instruction, tools, contents, self.ttl_s,
+                                                      display_name=f"prefix-{key[:16]}")
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"(Context cache: create failed ({e.__class__.__name__}); sending the prefix uncached.)")
+                return None
+            self.handles[key] = CacheHandle(name, model, key, expire_at, tokens)
+            self.stats["created"] += 1
+            print(f"(Context cache: created {name} for ~{tokens} prefix tokens, TTL {self.ttl_s}s.)")
+            return name
+
+    def _renew(self, handle: CacheHandle) -> bool:
+        try:
+            handle.expire_at = self.backend.renew(handle.name, self.ttl_s)
+        except Exception:
+            return False   # expired or deleted server-side: the caller re-creates it
+        self.stats["renewed"] += 1
+        return True
+
+    def config_for(self, model: str, config: types.GenerateContentConfig, contents: list | None = None) -> types.GenerateContentConfig:
+        """
+        `config` with its system instruction and tools (plus `contents`) moved into a cached prefix.
+        Requests that use cached content must not repeat those fields, so they are removed from the copy.
+        Returns `config` unchanged when the prefix is not cached.
+        """
+        name = self.get(model, config.system_instruction, config.tools, contents)
+        if name is None:
+            return config
+        return config.model_copy(update={"cached_content": name, "system_instruction": None, "tools": None})
+
+    # --- Lifecycle ---
+    def renew_due(self) -> None:
+        with self._lock:
+            now = time.time()
+            for key, handle in list(self.handles.items()):
+                if handle.expire_at - now <= self.renew_margin_s and not self._renew(handle):
+                    del self.handles[key]   # re-created on next use
+
+    def start_auto_renew(self, interval_s: float = RENEW_INTERVAL_S) -> None:
+        """Keeps handles alive between requests (long-lived processes)."""
+        if self._renewer is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval_s):
+                self.renew_due()
+
+        self._renewer = threading.Thread(target=loop, daemon=True, name="context-cache-renew")
+        self._renewer.start()
+
+    def close(self) -> None:
+        """Deletes every handle this process created."""
+        self._stop.set()
+        with self._lock:
+            for handle in self.handles.values():
+                try:
+                    self.backend.delete(handle.name)
+                except Exception as e:
+                    print(f"(Context cache: delete of {handle.name} failed: {e.__class__.__name__})")
+            self.handles.clear()
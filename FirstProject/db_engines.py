@@ -0,0 +1,191 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, StaticPool
+from latency_metrics import metrics
+
+# --- Configuration ---
+# Per worker process: every process that imports an agent gets its own pool of this size
+POOL_SIZE = 5
+MAX_OVERFLOW = 10               # extra connections under bursts, closed again when returned
+POOL_TIMEOUT_S = 30.0           # wait for a free connection before failing the request
+POOL_RECYCLE_S = 1800           # reconnect before server / firewall idle timeouts drop the socket
+POOL_PRE_PING = True            # a stale connection is replaced at checkout instead of failing mid-query
+WARMUP_CONNECTIONS = 2          # opened at startup so the first queries skip the TLS/login handshake
+LOGIN_TIMEOUT_S = 15
+# SQLAlchemy pools the connections; ODBC driver-manager pooling underneath would keep a second,
+# invisible pool of the same sessions, so it is switched off before the first connect.
+ODBC_POOLING = False
+
+
+# --- 1. INSTRUMENTED POOL ---
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_samples: list[float] = []
+        self.counters = {"checkouts": 0, "checkins": 0, "connects": 0, "invalidated": 0, "timeouts": 0}
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            # Only pool exhaustion; a failed connect (bad credentials, server down) is not a timeout
+            with self._stats_lock:
+                self.counters["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_samples.append(waited)
+                if len(self.wait_samples) > 10_000:
+                    del self.wait_samples[:5_000]
+            metrics.observe_stage("pool_wait", self.logging_name or "sql", waited)
+
+    def recreate(self):
+        # engine.dispose() re-creates the pool (pre-ping only replaces single connections);
+        # the counters belong to the engine, so carry them over
+        pool = super().recreate()
+        pool.wait_samples, pool.counters, pool._stats_lock = self.wait_samples, self.counters, self._stats_lock
+        return pool
+
+
+def _count(pool, name: str) -> None:
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            pool.counters[name] += 1
+
+
+# --- 2. ENGINE FACTORY ---
+def create_sql_engine(url, name: str = "sql", pool_size: int = POOL_SIZE, max_overflow: int = MAX_OVERFLOW,
+                      pool_timeout: float = POOL_TIMEOUT_S, pool_recycle: int = POOL_RECYCLE_S,
+                      pre_ping: bool = POOL_PRE_PING, warmup: int = WARMUP_CONNECTIONS):
+    """
+    The engine every SQL agent uses: sized, pre-pinged, recycled pool with checkout metrics,
+    fast_executemany for mssql+pyodbc, and `warmup` connections opened before the first request.
+    In-memory SQLite gets a StaticPool instead, so all threads see the same database.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+    kwargs = {}
+    if url.get_driver_name() == "pyodbc":
+        import pyodbc
+        pyodbc.pooling = ODBC_POOLING
+        kwargs["fast_executemany"] = True
+        kwargs["connect_args"] = {"timeout": LOGIN_TIMEOUT_S}
+    elif url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+
+    engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pre_ping,
+        pool_logging_name=name,
+        **kwargs,
+    )
+    event.listen(engine, "checkout", lambda *_: _count(engine.pool, "checkouts"))
+    event.listen(engine, "checkin", lambda *_: _count(engine.pool, "checkins"))
+    event.listen(engine, "connect", lambda *_: _count(engine.pool, "connects"))
+    event.listen(engine, "invalidate", lambda *_: _count(engine.pool, "invalidated"))
+    if warmup:
+        warm_up(engine, min(warmup, pool_size))
+    return engine
+
+
+def warm_up(engine, connections: int) -> None:
+    """Opens `connections` pooled connections in parallel (one round trip each) and returns them to the pool."""
+    start = time.perf_counter()
+
+    # Held concurrently, otherwise the pool would hand the same connection back every time
+    barrier = threading.Barrier(connections)
+
+    def open_and_hold(i):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+                barrier.wait(timeout=POOL_TIMEOUT_S)
+        except Exception:
+            # Release the threads already holding a connection instead of leaving them to the barrier timeout
+            barrier.abort()
+            raise
+
+    try:
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(open_and_hold, range(connections)))
+        print(f"(DB pool '{engine.pool.logging_name}': warmed {connections} connection(s) in "
+              f"{time.perf_counter() - start:.2f}s.)")
+    except Exception as e:
+        # A cold pool still works; the first requests just pay the handshake
+        print(f"(DB pool warm-up failed: {e.__class__.__name__}. Connecting on demand.)")
+
+
+def read_only_url(url):
+    """
+    The URL for read-only work. On SQL Server availability groups, ApplicationIntent=ReadOnly on the
+    listener is routed to a readable secondary; other backends use READ_REPLICA_URL instead.
+    """
+    url = make_url(url)
+    if url.get_driver_name() == "pyodbc":
+        return url.update_query_dict({"ApplicationIntent": "ReadOnly"})
+    return url
+
+
+# --- 3. PRIMARY / REPLICA ROUTING ---
+class EngineRouter:
+    """
+    Primary engine for writes (loading data), replica engine for read-only text-to-SQL queries.
+    Without a replica both roles use the primary.
+    """
+
+    def __init__(self, primary_url, replica_url=None, name: str = "sql", **pool_kwargs):
+        self.primary = create_sql_engine(primary_url, name=f"{name}-primary", **pool_kwargs)
+        self.replica = create_sql_engine(replica_url, name=f"{name}-replica", **pool_kwargs) if replica_url else None
+
+    @property
+    def read(self):
+        return self.replica or self.primary
+
+    @property
+    def write(self):
+        return self.primary
+
+    def stats(self) -> dict:
+        engines = {"primary": self.primary}
+        if self.replica is not None:
+            engines["replica"] = self.replica
+        return {role: pool_stats(engine) for role, engine in engines.items()}
+
+    def dispose(self) -> None:
+        self.primary.dispose()
+        if self.replica is not None:
+            self.replica.dispose()
+
+
+def pool_stats(engine) -> dict:
+    """Checkout counters, wait-time percentiles and current pool occupancy."""
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {"pool": pool.__class__.__name__}
+    with pool._stats_lock:
+        waits = sorted(pool.wait_samples)
+        report = dict(pool.counters)
+    report.update({"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()})
+    if waits:
+        report.update({
+            "wait_p50_ms": 1000 * waits[len(waits) // 2],
+            "wait_p95_ms": 1000 * waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            "wait_max_ms": 1000 * waits[-1],
+        })
+    return report
@@ -0,0 +1,202 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Any
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+
+# --- Configuration ---
+EMBED_CACHE_PATH = "./cache/embeddings.sqlite3"
+DEFAULT_MAX_ENTRIES = 500_000
+SQLITE_MAX_VARIABLES = 900  # stay below SQLite's host-parameter limit per IN (...) query
+
+
+# --- 1. ON-DISK STORE ---
+class EmbeddingCacheStore:
+    """
+    Size-bounded SQLite store for embedding vectors with LRU eviction.
+    Vectors are stored as packed float32 blobs; `last_used` drives eviction.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, Embedding]:
+        """Looks up a whole batch of keys with one query per SQLITE_MAX_VARIABLES keys."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                chunk = keys[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: dict[str, Embedding]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, array("f", v).tobytes(), now) for k, v in items.items()],
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        # Evict down to 90% so we don't pay for an eviction on every single insert.
+        excess = self._size - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- 2. CACHING EMBED MODEL WRAPPER ---
+class CachedEmbedding(BaseEmbedding):
+    """
+    Drop-in replacement for Settings.embed_model that serves repeated texts from disk.
+    Cache keys cover (model name, task type, output dimensionality, text hash), so
+    switching any of those never returns an incompatible vector.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingCacheStore = PrivateAttr()
+    _key_prefix: str = PrivateAttr()
+    _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, cache_path: str = EMBED_CACHE_PATH,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            **kwargs,
+        )
+        self._inner = inner
+        self._store = EmbeddingCacheStore(cache_path, max_entries)
+        task_type = getattr(inner, "task_type", None)
+        dimensionality = getattr(inner, "output_dimensionality", None)
+        embedding_config = getattr(inner, "embedding_config", None)
+        if embedding_config is not None:
+            task_type = getattr(embedding_config, "task_type", task_type)
+            dimensionality = getattr(embedding_config, "output_dimensionality", dimensionality)
+        self._key_prefix = f"{inner.model_name}|{task_type}|{dimensionality}"
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _key(self, role: str, text: str) -> str:
+        # Queries and documents are embedded with different task types by Gemini models.
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{self._key_prefix}|{role}|{text_hash}".encode("utf-8")).hexdigest()
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._stats_lock:
+            self._hits += hits
+            self._misses += misses
+
+    def stats(self) -> dict:
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / total if total else 0.0,
+            "entries": len(self._store),
+        }
+
+    # --- Lookup helpers shared by the sync and async paths ---
+    def _split(self, role: str, texts: list[str]) -> tuple[list[str], dict[str, Embedding], list[int]]:
+        keys = [self._key(role, t) for t in texts]
+        cached = self._store.get_many(list(dict.fromkeys(keys)))
+        # One upstream request per distinct uncached text, even if it repeats within the batch.
+        first_index = {}
+        for i, k in enumerate(keys):
+            if k not in cached:
+                first_index.setdefault(k, i)
+        missing = list(first_index.values())
+        self._count(len(texts) - len(missing), len(missing))
+        return keys, cached, missing
+
+    def _merge(self, keys: list[str], cached: dict[str, Embedding], missing: list[int],
+               new_vectors: list[Embedding]) -> list[Embedding]:
+        fresh = {keys[i]: v for i, v in zip(missing, new_vectors)}
+        self._store.put_many(fresh)
+        cached.update(fresh)
+        return [cached[k] for k in keys]
+
+    # --- BaseEmbedding interface ---
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._split("query", [query])
+        new_vectors = [self._inner.get_query_embedding(query)] if missing else []
+        return self._merge(keys, cached, missing, new_vectors)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._split("query", [query])
+        new_vectors = [await self._inner.aget_query_embedding(query)] if missing else []
+        return self._merge(keys, cached, missing, new_vectors)[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._split("document", texts)
+        new_vectors = []
+        if missing:
+            new_vectors = self._inner.get_text_embedding_batch([texts[i] for i in missing])
+        return self._merge(keys, cached, missing, new_vectors)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._split("document", texts)
+        new_vectors = []
+        if missing:
+            new_vectors = await self._inner.aget_text_embedding_batch([texts[i] for i in missing])
+        return self._merge(keys, cached, missing, new_vectors)
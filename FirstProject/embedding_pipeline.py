@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from llama_index.core import SimpleDirectoryReader, Settings
+from llama_index.core.schema import BaseNode, Document, MetadataMode, NodeRelationship
+
+# --- Configuration ---
+EMBED_BATCH_SIZE = 100         # Gemini accepts up to 100 texts per batch embedding request
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+MAX_RETRIES = 8
+PROGRESS_INTERVAL_S = 5.0
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+CHUNKER_VERSION = 2            # bump when chunk boundaries or chunk metadata change: forces a re-ingest
+# "SECTION 2: TRAVEL EXPENSE" (policy manuals) or a Markdown heading starts a new section
+SECTION_RE = re.compile(r"^[ \t]*(?:SECTION\s+\d+[.:]\s*(?P<title>.+?)|#{1,6}\s+(?P<heading>.+?))[ \t]*$", re.MULTILINE)
+YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+# --- 1. ADAPTIVE CONCURRENCY (AIMD) ---
+def is_throttle_error(exc: BaseException) -> bool:
+    """True for quota / overload errors (HTTP 429 or 503) that should trigger a back-off."""
+    for attr in ("code", "status_code", "status"):
+        if getattr(exc, attr, None) in (429, 503):
+            return True
+    message = str(exc)
+    return any(marker in message for marker in ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE"))
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight requests.
+    Every full window of successes raises the limit by one; a throttle error halves it
+    and pauses new requests for an exponentially growing, jittered back-off.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = MIN_CONCURRENCY, maximum: int = MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.throttle_events = 0
+        self._backoff_s = 1.0
+        self._resume_at = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            while True:
+                delay = self._resume_at - time.monotonic()
+                if delay <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                # wait() releases the lock, so finishing requests can still release() meanwhile
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=delay if delay > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._backoff_s = max(1.0, self._backoff_s / 2)
+
+    def on_throttle(self) -> float:
+        """Shrinks the window and returns how long the caller should wait before retrying."""
+        self.throttle_events += 1
+        self.limit = max(float(self.minimum), self.limit / 2)
+        delay = self._backoff_s * (0.5 + random.random())
+        self._backoff_s = min(60.0, self._backoff_s * 2)
+        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        return delay
+
+
+# --- 2. CHECKPOINT (resume after a crash) ---
+def truncate_torn_tail(path: str) -> None:
+    """
+    Cuts an append-only JSONL file back to its last newline. A crash mid-write leaves a partial
+    last line; without this, the next append would be glued onto it and both lines lost.
+    """
+    try:
+        with open(path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            if pos != end:
+                f.truncate(pos)
+    except FileNotFoundError:
+        pass
+
+
+class Checkpoint:
+    """
+    Append-only log of chunk ids already written to the vector store.
+    Chunk ids are content-derived, so the log stays valid even if the set of files changes
+    between the crashed run and the retry. Appending one line per batch keeps commits O(batch).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.committed: set[str] = set()
+        truncate_torn_tail(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.committed.update(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # a damaged line only loses its own batch, which is re-embedded
+        except FileNotFoundError:
+            pass
+
+    def commit(self, chunk_ids: list[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(chunk_ids) + "\n")
+        self.committed.update(chunk_ids)
+
+    def clear(self) -> None:
+        self.committed.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# --- 3. READ -> CHUNK -> BATCH ---
+def assign_stable_ids(nodes: list[BaseNode], rel_path: str, file_sha256: str) -> None:
+    """
+    Gives chunks ids derived from the file path, its content hash and the chunk position.
+    Re-running a batch after a crash then rewrites the same ids instead of duplicating vectors.
+    """
+    new_ids = {n.node_id: hashlib.sha256(f"{rel_path}:{file_sha256}:{i}".encode()).hexdigest()
+               for i, n in enumerate(nodes)}
+    for node in nodes:
+        node.id_ = new_ids[node.node_id]
+        for rel in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+            info = node.relationships.get(rel)
+            if info is not None and info.node_id in new_ids:
+                info.node_id = new_ids[info.node_id]
+
+
+def document_year(document: Document) -> int | None:
+    """The first year in the title line, else in the file name, else the file's modification year."""
+    title = document.text.lstrip().split("\n", 1)[0]
+    for source in (title, document.metadata.get("file_name", ""), document.metadata.get("last_modified_date") or ""):
+        match = YEAR_RE.search(source)
+        if match:
+            return int(match.group())
+    return None
+
+
+def split_sections(document: Document) -> list[Document]:
+    """
+    One Document per section, so chunks never straddle two sections and can be filtered on
+    `section` and `year` metadata. Text before the first heading gets section "".
+    """
+    year = document_year(document)
+    starts = [(m.start(), m.group("title") or m.group("heading")) for m in SECTION_RE.finditer(document.text)]
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, ""))
+    parts = []
+    for i, (start, section) in enumerate(starts):
+        text = document.text[start:starts[i + 1][0] if i + 1 < len(starts) else len(document.text)].strip()
+        if text:
+            parts.append(Document(
+                id_=f"{document.doc_id}:{i}", text=text,
+                metadata={**document.metadata, "section": section, "year": year},
+                excluded_embed_metadata_keys=document.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=document.excluded_llm_metadata_keys,
+            ))
+    return parts
+
+
+def chunk_file(data_dir: str, rel_path: str, file_sha256: str) -> list[BaseNode]:
+    documents = SimpleDirectoryReader(input_files=[os.path.join(data_dir, rel_path)]).load_data()
+    documents = [part for document in documents for part in split_sections(document)]
+    nodes = Settings.node_parser.get_nodes_from_documents(documents)
+    assign_stable_ids(nodes, rel_path, file_sha256)
+    return nodes
+
+
+@dataclass
+class Batch:
+    number: int
+    nodes: list[BaseNode]
+    files: list[str]  # rel_path of each node, same order as nodes
+
+
+# --- 4. THE PIPELINE ---
+class EmbeddingPipeline:
+    """
+    Streaming ingestion: files are read and chunked in a worker thread, chunks are embedded
+    in fixed-size batches with an AIMD-bounded number of concurrent requests, and a separate
+    writer task stores finished batches in the vector store while embedding continues.
+    """
+
+    def __init__(self, vector_store, embed_model=None, batch_size: int = EMBED_BATCH_SIZE,
+                 initial_concurrency: int = 4, max_concurrency: int = MAX_CONCURRENCY,
+                 checkpoint_path: str | None = None, on_file_done=None):
+        self.vector_store = vector_store
+        self.embed_model = embed_model or Settings.embed_model
+        self.batch_size = batch_size
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.checkpoint_path = checkpoint_path
+        self.on_file_done = on_file_done  # callback(rel_path, chunk_ids) once all its chunks are stored
+        self.chunks_done = 0
+        self.chunks_total = 0
+
+    async def run(self, data_dir: str, files: dict[str, str]) -> int:
+        """
+        Embeds and stores every chunk of `files` ({relative_path: sha256}).
+        Returns:
+            The number of chunks written (including ones restored from the checkpoint).
+        """
+        checkpoint = None
+        if self.checkpoint_path:
+            checkpoint = Checkpoint(self.checkpoint_path)
+            if checkpoint.committed:
+                print(f"Resuming ingestion: {len(checkpoint.committed)} chunk(s) already committed.")
+
+        controller = AIMDController(self.initial_concurrency, maximum=self.max_concurrency)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        file_chunks: dict[str, list[str]] = {}
+        file_pending: dict[str, int] = {}
+        embed_tasks: set[asyncio.Task] = set()
+        failures: list[BaseException] = []
+        start = time.perf_counter()
+
+        def mark_stored(rel_paths: list[str]) -> None:
+            self.chunks_done += len(rel_paths)
+            for rel_path in rel_paths:
+                file_pending[rel_path] -= 1
+                if file_pending[rel_path] == 0 and self.on_file_done:
+                    self.on_file_done(rel_path, file_chunks[rel_path])
+
+        async def embed_batch(batch: Batch) -> None:
+            texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in batch.nodes]
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    try:
+                        vectors = await self.embed_model.aget_text_embedding_batch(texts)
+                        controller.on_success()
+                        break
+                    except Exception as e:
+                        if not is_throttle_error(e) or attempt == MAX_RETRIES:
+                            raise
+                        delay = controller.on_throttle()
+                        print(f"(Embedding throttled: {e.__class__.__name__}. Concurrency -> "
+                              f"{int(controller.limit)}, retrying in {delay:.1f}s.)")
+                        await asyncio.sleep(delay)
+            finally:
+                await controller.release()
+            for node, vector in zip(batch.nodes, vectors):
+                node.embedding = vector
+            await write_queue.put(batch)
+
+        async def writer() -> None:
+            while True:
+                batch = await write_queue.get()
+                if batch is None:
+                    return
+                await asyncio.to_thread(self.vector_store.add, batch.nodes)
+                if checkpoint:
+                    checkpoint.commit([n.node_id for n in batch.nodes])
+                mark_stored(batch.files)
+
+        async def reporter() -> None:
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL_S)
+                elapsed = time.perf_counter() - start
+                print(f"  ... {self.chunks_done}/{self.chunks_total} chunks stored, "
+                      f"{self.chunks_done / elapsed:.1f} chunks/s, concurrency {int(controller.limit)}")
+
+        writer_task = asyncio.create_task(writer())
+        reporter_task = asyncio.create_task(reporter())
+        try:
+            batch_no = 0
+            pending: list[tuple[BaseNode, str]] = []
+
+            async def dispatch(items: list[tuple[BaseNode, str]]) -> None:
+                nonlocal batch_no
+                batch = Batch(batch_no, [n for n, _ in items], [p for _, p in items])
+                batch_no += 1
+                await controller.acquire()
+                task = asyncio.create_task(embed_batch(batch))
+                embed_tasks.add(task)
+                task.add_done_callback(on_embed_done)
+
+            def on_embed_done(task: asyncio.Task) -> None:
+                embed_tasks.discard(task)
+                if not task.cancelled() and task.exception() is not None:
+                    failures.append(task.exception())
+
+            def raise_failures() -> None:
+                if failures:
+                    raise failures[0]
+                if writer_task.done():
+                    writer_task.result()
+
+            for rel_path, sha256 in sorted(files.items()):
+                nodes = await asyncio.to_thread(chunk_file, data_dir, rel_path, sha256)
+                file_chunks[rel_path] = [n.node_id for n in nodes]
+                self.chunks_total += len(nodes)
+                if checkpoint:
+                    restored = [n for n in nodes if n.node_id in checkpoint.committed]
+                    nodes = [n for n in nodes if n.node_id not in checkpoint.committed]
+                    self.chunks_done += len(restored)
+                file_pending[rel_path] = len(nodes)
+                if not nodes and self.on_file_done:
+                    self.on_file_done(rel_path, file_chunks[rel_path])
+                for node in nodes:
+                    pending.append((node, rel_path))
+                    if len(pending) == self.batch_size:
+                        await dispatch(pending)
+                        pending = []
+                # Surface embedding/write failures early instead of after reading every file
+                raise_failures()
+            if pending:
+                await dispatch(pending)
+
+            while embed_tasks:
+                await asyncio.wait(embed_tasks | {writer_task}, return_when=asyncio.FIRST_COMPLETED)
+                raise_failures()
+            raise_failures()
+            await write_queue.put(None)
+            await writer_task
+        finally:
+            reporter_task.cancel()
+            for task in embed_tasks:
+                task.cancel()
+            writer_task.cancel()
+
+        if checkpoint:
+            checkpoint.clear()
+        elapsed = time.perf_counter() - start
+        print(f"Embedded {self.chunks_done} chunk(s) in {elapsed:.1f}s "
+              f"({self.chunks_done / max(elapsed, 1e-9):.1f} chunks/s, "
+              f"{controller.throttle_events} throttle event(s)).")
+        return self.chunks_done
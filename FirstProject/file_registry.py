@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import hashlib
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from google.genai import types
+
+# --- Configuration ---
+REGISTRY_PATH = "./cache/file_registry.json"
+FILE_TTL_S = 47 * 3600          # uploads expire after 48h; entries without an expiration use this
+EXPIRY_MARGIN_S = 600           # re-upload rather than hand out a file about to expire
+MAX_FILES = 200                 # unreferenced uploads beyond these limits are deleted, least recently used first
+MAX_BYTES = 2 * 1024 ** 3
+UPLOAD_WORKERS = 8
+PROCESSING_POLL_S = 1.0
+PROCESSING_TIMEOUT_S = 300.0
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_missing_file_error(exc: Exception) -> bool:
+    """The Files API answers 403/404 for uploads that expired or were deleted."""
+    return getattr(exc, "code", None) in (403, 404)
+
+
+# --- CONTENT-ADDRESSED UPLOAD REGISTRY ---
+class FileRegistry:
+    """
+    Maps file content (SHA-256 + MIME type) to an uploaded Gemini file, persisted in a local JSON file.
+    The same bytes are uploaded once and reused until the upload expires; expired or missing uploads
+    are re-uploaded transparently. Uploads are deleted by LRU eviction of unreferenced entries,
+    not after every question.
+    """
+
+    def __init__(self, client, path: str = REGISTRY_PATH, max_files: int = MAX_FILES, max_bytes: int = MAX_BYTES):
+        self.client = client
+        self.path = path
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._refs: dict[str, int] = {}      # in-process references (files used by a request in flight)
+        self.entries, self.hashes = self._load()   # hashes: abs path -> [size, mtime_ns, sha256]
+        self._dirty = False                        # in-memory state differs from the file
+        self.stats = {"reused": 0, "uploaded": 0, "reuploaded": 0, "evicted": 0}
+
+    # --- Persistence ---
+    def _load(self) -> tuple[dict, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("files", {}), data.get("hashes", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}, {}
+
+    def _save(self) -> None:
+        """Writes the registry if anything changed since the last write."""
+        if not self._dirty:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.entries, "hashes": self.hashes}, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    # --- Lookup / upload ---
+    @staticmethod
+    def _as_file(entry: dict) -> types.File:
+        return types.File(name=entry["name"], uri=entry["uri"], mime_type=entry["mime_type"])
+
+    def _upload(self, path: str, mime_type: str, display_name: str | None) -> types.File:
+        uploaded = self.client.files.upload(
+            file=path,
+            config={"display_name": display_name or os.path.basename(path), "mime_type": mime_type},
+        )
+        # Large PDFs / video are processed before they can be referenced
+        deadline = time.monotonic() + PROCESSING_TIMEOUT_S
+        while uploaded.state is not None and uploaded.state.name == "PROCESSING" and time.monotonic() < deadline:
+            time.sleep(PROCESSING_POLL_S)
+            uploaded = self.client.files.get(name=uploaded.name)
+        if uploaded.state is not None and uploaded.state.name == "FAILED":
+            raise RuntimeError(f"Processing of {path} failed: {uploaded.error}")
+        return uploaded
+
+    def content_hash(self, path: str) -> str:
+        """SHA-256 of the file, re-read only when its size or mtime changed."""
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            known = self.hashes.get(abs_path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        sha = file_sha256(path)
+        with self._lock:
+            self.hashes[abs_path] = [stat.st_size, stat.st_mtime_ns, sha]
+            self._dirty = True
+        return sha
+
+    def get(self, path: str, mime_type: str | None = None, display_name: str | None = None) -> types.File:
+        """The uploaded file for `path`'s current content, uploading only if no valid upload exists."""
+        mime_type = mime_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        key = f"{self.content_hash(path)}:{mime_type}"
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One upload per content even when several threads ask for it at once
+        with key_lock:
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry["expire_at"] - time.time() > EXPIRY_MARGIN_S:
+                    # Recency alone is not worth a write: it is saved with the next change (or evict())
+                    entry["last_used"] = time.time()
+                    self._dirty = True
+                    self.stats["reused"] += 1
+                    return self._as_file(entry)
+            uploaded = self._upload(path, mime_type, display_name)
+            expire_at = uploaded.expiration_time.timestamp() if uploaded.expiration_time else time.time() + FILE_TTL_S
+            with self._lock:
+                self.stats["reuploaded" if entry is not None else "uploaded"] += 1
+                self.entries[key] = {
+                    "name": uploaded.name, "uri": uploaded.uri, "mime_type": mime_type,
+                    "size": os.path.getsize(path), "source": os.path.abspath(path),
+                    "expire_at": expire_at, "last_used": time.time(),
+                }
+                self._dirty = True
+                self._save()
+                print(f"(File registry: uploaded {path} as {uploaded.name}.)")
+                return self._as_file(self.entries[key])
+
+    def get_many(self, paths: list[str]) -> list[types.File]:
+        """Uploads/reuses many files concurrently; results are in `paths` order."""
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, max(1, len(paths)))) as pool:
+            return list(pool.map(self.get, paths))
+
+    def invalidate(self, file: types.File) -> None:
+        """Forgets an upload the API no longer knows (404/403); the next get() re-uploads it."""
+        with self._lock:
+            for key, entry in list(self.entries.items()):
+                if entry["name"] == file.name:
+                    del self.entries[key]
+                    self._dirty = True
+            self._save()
+
+    # --- Reference counting + LRU cleanup ---
+    @contextmanager
+    def use(self, paths: list[str]):
+        """
+        Yields the uploaded files for `paths`, pinned (never evicted) until the block exits.
+        Example:
+            with registry.use(["report.pdf"]) as files:
+                client.models.generate_content(model=..., contents=[prompt, *files])
+        """
+        files = self.get_many(paths)
+        with self._lock:
+            for f in files:
+                self._refs[f.name] = self._refs.get(f.name, 0) + 1
+        try:
+            yield files
+        finally:
+            with self._lock:
+                for f in files:
+                    self._refs[f.name] -= 1
+                    if self._refs[f.name] <= 0:
+                        del self._refs[f.name]
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes expired entries, then unreferenced least-recently-used uploads beyond the limits,
+        and forgets the file hashes that no remaining upload uses.
+        """
+        with self._lock:
+            now = time.time()
+            for key, entry in list(self.entries.items()):
+                if entry["expire_at"] <= now:
+                    del self.entries[key]
+                    self._dirty = True
+            victims = []
+            ordered = sorted(self.entries.items(), key=lambda kv: kv[1]["last_used"])
+            count, total = len(ordered), sum(e["size"] for _, e in ordered)
+            for key, entry in ordered:
+                if count <= self.max_files and total <= self.max_bytes:
+                    break
+                if entry["name"] in self._refs:
+                    continue
+                victims.append(entry["name"])
+                del self.entries[key]
+                self._dirty = True
+                count, total = count - 1, total - entry["size"]
+            self._prune_hashes()
+            self._save()
+        for name in victims:
+            try:
+                self.client.files.delete(name=name)
+                self.stats["evicted"] += 1
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    print(f"(File registry: delete of {name} failed: {e.__class__.__name__})")
+
+    def _prune_hashes(self) -> None:
+        """Drops remembered hashes of content with no upload left, so the map shrinks with the entries. Lock held."""
+        live = {key.split(":", 1)[0] for key in self.entries}
+        for abs_path, known in list(self.hashes.items()):
+            if known[2] not in live:
+                del self.hashes[abs_path]
+                self._dirty = True
+
+    # --- Convenience ---
+    def generate_content(self, model: str, prompt, paths: list[str], **kwargs):
+        """
+        generate_content over `paths` with reused uploads; an upload that vanished server-side
+        is re-uploaded and the request retried once.
+        """
+        with self.use(paths) as files:
+            try:
+                return self.client.models.generate_content(model=model, contents=[prompt, *files], **kwargs)
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    raise
+                for f in files:
+                    self.invalidate(f)
+        with self.use(paths) as files:
+            return self.client.models.generate_content(model=model, contents=[prompt, *files], **kwargs)
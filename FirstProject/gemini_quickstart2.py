@@ -1,55 +1,46 @@
 import os
-import io # <--- New import for handling binary data
 from google import genai
-from google.genai import types
-from PIL import Image 
+from image_input import load_image_part
 
 # Initialize the client (assumes GEMINI_API_KEY environment variable is set)
 client = genai.Client()
 
 # --- Multimodal API Call ---
 image_path = 'image1.jpg'
-mime_type = 'image/jpeg' # Ensure this matches your image file type
 
-# 1. Open the image file using the Pillow library
+# 1. Load the image as a Part: the MIME type is sniffed from the file, compatible images are sent
+#    as their original bytes, and only images larger than the model uses are decoded and downscaled
 try:
-    img = Image.open(image_path)
-    
-    # 2. Convert the PIL Image object into raw bytes
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format=img.format or 'jpeg') # Save it to bytes
-    img_bytes = img_byte_arr.getvalue()
+    image_part, image_info = load_image_part(image_path)
+    print(f"(Image input: {image_info['sent_bytes']} bytes, {image_info['size']}, "
+          f"resized={image_info['resized']}, ~{image_info['tokens']} tokens)")
 
 except FileNotFoundError:
     print(f"\n[ERROR] Image file not found: {image_path}")
-    print("Please ensure you have a JPEG image named 'image1.jpg' in the current directory.")
+    print("Please ensure you have an image named 'image1.jpg' in the current directory.")
     exit()
 
-# 3. Define the multimodal contents using Part.from_bytes
+# 2. Define the multimodal contents
 multimodal_contents = [
-    # CORRECT WAY: Use from_bytes with the raw data and mime type
-    types.Part.from_bytes(
-        data=img_bytes, 
-        mime_type=mime_type
-    ), 
-    
+    image_part,
+
     # The text instruction for the model
     "Describe this image in detail and write a caption for it."
 ]
 
 print("Sending multimodal prompt (Image + Text) to Gemini...")
 
-# 4. Call the API
+# 3. Call the API
 try:
     multimodal_response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=multimodal_contents
     )
     
-    # 5. Print the model's response
+    # 4. Print the model's response
     print("\n--- MULTIMODAL RESPONSE ---")
     print(multimodal_response.text)
     print("---------------------------")
 
 except Exception as e:
-    print(f"\n[ERROR] API Call Failed: {e}")
\ No newline at end of file
+    print(f"\n[ERROR] API Call Failed: {e}")
@@ -0,0 +1,169 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from google.genai import types
+from token_estimator import get_estimator
+
+# --- Configuration ---
+HISTORY_TOKEN_BUDGET = 6000   # history tokens allowed before older turns are folded into the summary
+KEEP_TURNS = 4                # most recent user turns always kept verbatim
+SUMMARY_MODEL = "gemini-2.5-flash"
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_PREFIX = "SUMMARY OF THE EARLIER CONVERSATION:"
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and an assistant. Keep every fact, number, "
+    "name, decision and open question that later turns may refer to; drop greetings and filler. "
+    "Write at most 200 words of plain prose.\n\n"
+    "CURRENT SUMMARY:\n{summary}\n\nNEW TURNS:\n{transcript}\n\nUPDATED SUMMARY:"
+)
+
+
+def content_tokens(content: types.Content, model: str = SUMMARY_MODEL) -> int:
+    """Local estimate for one history entry (text, function calls/responses, inline media)."""
+    return get_estimator(model).count(content)
+
+
+def is_user_text(content: types.Content) -> bool:
+    """A new user turn starts with user text; user entries holding function responses continue the current turn."""
+    return content.role == "user" and any(p.text for p in content.parts or []) \
+        and not any(p.function_response for p in content.parts or [])
+
+
+def split_turns(history: list[types.Content]) -> list[list[types.Content]]:
+    """Groups history into turns: user text, then every model call / tool response up to the next user text."""
+    turns = []
+    for content in history:
+        if is_user_text(content) or not turns:
+            turns.append([content])
+        else:
+            turns[-1].append(content)
+    return turns
+
+
+def render_turns(turns: list[list[types.Content]]) -> str:
+    lines = []
+    for turn in turns:
+        for content in turn:
+            for part in content.parts or []:
+                if part.text:
+                    lines.append(f"{content.role.upper()}: {part.text}")
+                elif part.function_call:
+                    lines.append(f"TOOL CALL: {part.function_call.name}({json.dumps(part.function_call.args or {})})")
+                elif part.function_response:
+                    lines.append(f"TOOL RESULT: {part.function_response.name} -> "
+                                 f"{json.dumps(part.function_response.response or {}, default=str)}")
+    return "\n".join(lines)
+
+
+# --- TOKEN-BUDGETED CHAT SESSION ---
+class HistoryManager:
+    """
+    Owns a client.chats session and keeps its history under a token budget.
+    The system instruction (in the config) and the last `keep_turns` turns stay verbatim; older turns are
+    folded into a rolling summary by a background call, and the chat is re-created with
+    [summary, kept turns] once that summary is ready. Turns are never split, so every function call
+    keeps its function response.
+    """
+
+    def __init__(self, client, model: str, config: types.GenerateContentConfig | None = None,
+                 token_budget: int = HISTORY_TOKEN_BUDGET, keep_turns: int = KEEP_TURNS,
+                 summary_model: str = SUMMARY_MODEL, tool_executor=None):
+        self.client = client
+        self.model = model
+        self.config = config
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_model = summary_model
+        self.tool_executor = tool_executor  # optional ToolExecutor when automatic function calling is off
+        self.chat = client.chats.create(model=model, config=config)
+        self.estimator = get_estimator(model)  # local counts, calibrated from usage_metadata
+        self.summary = ""
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._pending = None          # (future, number of history entries being summarized)
+        self._lock = threading.Lock()
+        self.turn_input_tokens: list[int] = []   # prompt_token_count per turn, from usage_metadata
+        self.compactions = 0
+
+    # --- Budget ---
+    def history_tokens(self, history: list[types.Content] | None = None) -> int:
+        history = self.chat.get_history(curated=True) if history is None else history
+        return self.estimator.count(history)
+
+    def _summary_history(self) -> list[types.Content]:
+        if not self.summary:
+            return []
+        return [
+            types.Content(role="user", parts=[types.Part(text=f"{SUMMARY_PREFIX}\n{self.summary}")]),
+            types.Content(role="model", parts=[types.Part(text="Understood. I will use this summary as context.")]),
+        ]
+
+    def _summarize(self, turns: list[list[types.Content]]) -> str:
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "(none)", transcript=render_turns(turns))
+        response = self.client.models.generate_content(
+            model=self.summary_model,
+            contents=prompt,
+            config=types.GenerateContentConfig(max_output_tokens=SUMMARY_MAX_TOKENS),
+        )
+        return response.text.strip()
+
+    def _maybe_compact(self) -> None:
+        """Starts a background summary when the history is over budget (never blocks the turn)."""
+        if self._pending is not None:
+            return
+        history = self.chat.get_history(curated=True)
+        if self.history_tokens(history) <= self.token_budget:
+            return
+        offset = 2 if self.summary else 0   # the previous summary pair is folded into the new summary
+        turns = split_turns(history[offset:])
+        if len(turns) <= self.keep_turns:
+            return
+        old_turns = turns[:-self.keep_turns]
+        consumed = offset + sum(len(t) for t in old_turns)
+        self._pending = (self._summarizer.submit(self._summarize, old_turns), consumed)
+
+    def _apply_summary(self) -> None:
+        """Swaps in [summary, history after the summarized prefix] once the background summary is ready."""
+        if self._pending is None or not self._pending[0].done():
+            return
+        future, consumed = self._pending
+        self._pending = None
+        try:
+            self.summary = future.result()
+        except Exception as e:
+            print(f"(History summary failed: {e.__class__.__name__}; keeping full history for now.)")
+            return
+        # History only grows at the end, so the summarized prefix is still history[:consumed]
+        current = self.chat.get_history(curated=True)
+        self.estimator.forget(current[:consumed])
+        kept = current[consumed:]
+        self.chat = self.client.chats.create(model=self.model, config=self.config,
+                                             history=self._summary_history() + kept)
+        self.compactions += 1
+        print(f"(History compacted: {consumed} entries folded into the summary, ~{self.history_tokens()} tokens kept.)")
+
+    # --- Turns ---
+    def send_message(self, message):
+        with self._lock:
+            self._apply_summary()
+            # A copy: the SDK returns its live history list, which the turn extends in place
+            before = list(self.chat.get_history(curated=True))
+            if self.tool_executor is not None:
+                response = self.tool_executor.send_message(self.chat, message)
+            else:
+                response = self.chat.send_message(message)
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None and usage.prompt_token_count is not None:
+                self.turn_input_tokens.append(usage.prompt_token_count)
+                after = self.chat.get_history(curated=True)
+                # A plain turn (no tool round trips) sent exactly: old history + the new user entry
+                if len(after) == len(before) + 2:
+                    self.estimator.observe(before + [after[-2]], usage, self.config)
+            self._maybe_compact()
+            return response
+
+    def get_history(self, curated: bool = False) -> list[types.Content]:
+        return self.chat.get_history(curated=curated)
+
+    def close(self) -> None:
+        self._summarizer.shutdown(wait=False)
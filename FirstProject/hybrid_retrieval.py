@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+from llama_index.core import VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+from ingestion import PERSIST_DIR, load_manifest
+from latency_metrics import metrics
+from mmap_vector_store import matches_filters
+from token_estimator import estimate_tokens
+
+# --- Configuration ---
+KEYWORD_INDEX_FILE = "keyword_index.json"   # next to the ingestion manifest in persist_dir
+KEYWORD_INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60                   # reciprocal-rank fusion constant: 1 / (RRF_K + rank) per retriever
+CANDIDATES_PER_RETRIEVER = 20
+HYBRID_TOP_K = 3
+DEDUPE_JACCARD = 0.8         # word-shingle overlap above which a lower-ranked chunk is a near-duplicate
+SHINGLE_WORDS = 3
+MAX_CONTEXT_TOKENS = 1500    # chunk text handed to the LLM per question; lower-ranked chunks are dropped beyond it
+GET_NODES_BATCH = 500
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or our per so that "
+    "the their this to was we were what when where which who will with you your".split()
+)
+# Words, and numbers with their decimal / thousands separators ("$0.67" -> "0.67", "1,000")
+TERM_RE = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased terms without stopwords, with plurals folded ("expenses" -> "expense", "policies" -> "policy")."""
+    terms = []
+    for term in TERM_RE.findall(text.lower()):
+        if term in STOPWORDS:
+            continue
+        if len(term) > 4 and term.endswith("ies"):
+            term = term[:-3] + "y"
+        elif len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def metadata_filters(file_name=None, section=None, year=None) -> MetadataFilters | None:
+    """
+    Prefilter on the chunk metadata written at ingestion (see embedding_pipeline.split_sections).
+    A list value matches any of its items; None leaves that field unrestricted.
+    """
+    filters = []
+    for key, value in (("file_name", file_name), ("section", section), ("year", year)):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            filters.append(MetadataFilter(key=key, value=list(value), operator=FilterOperator.IN))
+        else:
+            filters.append(MetadataFilter(key=key, value=value, operator=FilterOperator.EQ))
+    return MetadataFilters(filters=filters) if filters else None
+
+
+# --- 1. INCREMENTAL BM25 INDEX ---
+class KeywordIndex:
+    """
+    In-memory inverted index with BM25 scoring, persisted as JSON.
+    Chunks are added and removed individually; postings and length statistics are kept up to date,
+    so syncing after an ingest only touches the chunks that changed.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.docs: dict[str, dict] = {}                   # node id -> {"tf": {term: count}, "length", "metadata"}
+        self.postings: dict[str, dict[str, int]] = {}     # term -> {node id: count}
+        self.total_length = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            return   # rebuilt from the vector store by the next sync
+        if data.get("version") != KEYWORD_INDEX_VERSION:
+            return
+        for node_id, doc in data["docs"].items():
+            self._insert(node_id, doc)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            payload = json.dumps({"version": KEYWORD_INDEX_VERSION, "docs": self.docs}, ensure_ascii=False)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _insert(self, node_id: str, doc: dict) -> None:
+        self.docs[node_id] = doc
+        self.total_length += doc["length"]
+        for term, count in doc["tf"].items():
+            self.postings.setdefault(term, {})[node_id] = count
+
+    def _drop(self, node_id: str) -> None:
+        doc = self.docs.pop(node_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in doc["tf"]:
+            posting = self.postings[term]
+            del posting[node_id]
+            if not posting:
+                del self.postings[term]
+
+    def add(self, node_id: str, text: str, metadata: dict | None = None) -> None:
+        terms = tokenize(text)
+        with self._lock:
+            self._drop(node_id)
+            self._insert(node_id, {"tf": dict(Counter(terms)), "length": len(terms), "metadata": metadata or {}})
+
+    def remove(self, node_id: str) -> None:
+        with self._lock:
+            self._drop(node_id)
+
+    def search(self, query: str, k: int, filters: MetadataFilters | None = None) -> list[tuple[str, float]]:
+        """Top-k (node id, BM25 score); chunks failing `filters` are excluded before scoring."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.docs)
+            if not n_docs or not terms:
+                return []
+            avg_length = self.total_length / n_docs
+            scores: dict[str, float] = {}
+            allowed: dict[str, bool] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for node_id, tf in posting.items():
+                    if filters is not None:
+                        if node_id not in allowed:
+                            allowed[node_id] = matches_filters(self.docs[node_id]["metadata"], filters)
+                        if not allowed[node_id]:
+                            continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[node_id]["length"] / avg_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def sync_keyword_index(vector_store, persist_dir: str = PERSIST_DIR) -> KeywordIndex:
+    """
+    Brings the keyword index in line with the ingestion manifest: chunks that are no longer listed
+    are removed, and only chunks it has not seen are fetched from the vector store and tokenized.
+    """
+    index = KeywordIndex(os.path.join(persist_dir, KEYWORD_INDEX_FILE))
+    manifest = load_manifest(persist_dir)
+    wanted = {cid for entry in manifest["files"].values() for cid in entry["chunk_ids"]}
+    stale = set(index.docs) - wanted
+    missing = sorted(wanted - set(index.docs))
+    for node_id in stale:
+        index.remove(node_id)
+    for start in range(0, len(missing), GET_NODES_BATCH):
+        for node in vector_store.get_nodes(node_ids=missing[start:start + GET_NODES_BATCH]):
+            index.add(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE), node.metadata)
+    if stale or missing:
+        index.save()
+        print(f"(Keyword index: +{len(missing)} / -{len(stale)} chunk(s), {len(index)} indexed.)")
+    return index
+
+
+# --- 2. FUSION + DEDUPE ---
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Merges ranked id lists by sum of 1 / (k + rank); ids found by several retrievers rise to the top."""
+    fused: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def _shingles(text: str) -> set[tuple]:
+    words = TERM_RE.findall(text.lower())
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+# --- 3. HYBRID RETRIEVER ---
+class HybridRetriever(BaseRetriever):
+    """
+    Dense (vector index) + sparse (BM25) retrieval fused with reciprocal-rank fusion.
+    Metadata filters restrict both retrievers before scoring; near-identical chunks are dropped
+    in favour of the higher-ranked copy, and the result is capped at top_k chunks and
+    max_context_tokens of text. Scores on the returned nodes are RRF scores.
+    Usage:
+        retriever = HybridRetriever(index, sync_keyword_index(index.vector_store, PERSIST_DIR))
+        query_engine = RetrieverQueryEngine.from_args(retriever)
+    """
+
+    def __init__(self, index: VectorStoreIndex, keyword_index: KeywordIndex, top_k: int = HYBRID_TOP_K,
+                 candidates: int = CANDIDATES_PER_RETRIEVER, filters: MetadataFilters | None = None,
+                 max_context_tokens: int = MAX_CONTEXT_TOKENS, site: str = "rag", **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+        self.keyword_index = keyword_index
+        self.top_k = top_k
+        self.candidates = candidates
+        self.filters = filters
+        self.max_context_tokens = max_context_tokens
+        self.site = site
+        self._vector_retriever = index.as_retriever(similarity_top_k=candidates, filters=filters)
+
+    def with_filters(self, file_name=None, section=None, year=None) -> "HybridRetriever":
+        """The same retriever restricted to the given metadata (shares the keyword index)."""
+        return HybridRetriever(self.index, self.keyword_index, self.top_k, self.candidates,
+                               metadata_filters(file_name, section, year), self.max_context_tokens, self.site)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        with metrics.span("vector", self.site):
+            dense = self._vector_retriever.retrieve(query_bundle)
+        with metrics.span("bm25", self.site):
+            sparse = self.keyword_index.search(query_bundle.query_str, self.candidates, self.filters)
+        fused = reciprocal_rank_fusion([[n.node.node_id for n in dense], [node_id for node_id, _ in sparse]])
+
+        # Walked in windows of 2 * top_k: keyword-only hits are loaded from the vector store one window
+        # at a time, so deeper candidates are only fetched when duplicates or missing nodes leave room
+        nodes = {n.node.node_id: n.node for n in dense}
+        results, kept_shingles, used_tokens = [], [], 0
+        window = 2 * self.top_k
+        for start in range(0, len(fused), window):
+            batch = fused[start:start + window]
+            missing = [node_id for node_id, _ in batch if node_id not in nodes]
+            if missing:
+                nodes.update((node.node_id, node) for node in self.index.vector_store.get_nodes(node_ids=missing))
+            for node_id, score in batch:
+                node = nodes.get(node_id)
+                if node is None:
+                    continue
+                text = node.get_content(metadata_mode=MetadataMode.NONE)
+                shingles = _shingles(text)
+                if any(_jaccard(shingles, kept) >= DEDUPE_JACCARD for kept in kept_shingles):
+                    continue
+                tokens = estimate_tokens(node.get_content(metadata_mode=MetadataMode.LLM))
+                if results and used_tokens + tokens > self.max_context_tokens:
+                    return results
+                results.append(NodeWithScore(node=node, score=score))
+                kept_shingles.append(shingles)
+                used_tokens += tokens
+                if len(results) >= self.top_k:
+                    return results
+        return results
@@ -0,0 +1,133 @@
+import io
+import os
+import mmap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from google.genai import types
+from token_estimator import image_size, image_tokens
+
+# --- Configuration ---
+MAX_IMAGE_SIDE = 3072          # longer side the model effectively uses; larger images are downscaled first
+MMAP_THRESHOLD = 1024 * 1024   # files above this are memory-mapped for header parsing instead of read up front
+RESIZE_JPEG_QUALITY = 90
+# Formats the API accepts as-is; anything else (GIF, BMP, TIFF, ...) is converted
+PASSTHROUGH_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+
+
+def sniff_mime(header: bytes) -> str | None:
+    """Image MIME type from the first bytes of the file (the extension is not trusted)."""
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    if header[:2] == b"BM":
+        return "image/bmp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    return None
+
+
+def _resize(data, max_side: int) -> tuple[bytes, str, tuple[int, int]]:
+    """Decodes, downscales so the longer side is <= max_side, and re-encodes (JPEG, or PNG with alpha)."""
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("RGB", (max_side, max_side))   # DCT-domain downscale while decoding: much less work
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha:
+        img.save(out, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=RESIZE_JPEG_QUALITY, optimize=True)
+        mime_type = "image/jpeg"
+    return out.getvalue(), mime_type, img.size
+
+
+# --- 1. SINGLE IMAGE ---
+def prepare_image(path: str, max_side: int = MAX_IMAGE_SIDE) -> tuple[bytes, str, dict]:
+    """
+    Returns (bytes_to_send, mime_type, info).
+    Compatible images within max_side are sent as their original bytes (no decode / re-encode);
+    only oversized or unsupported images are decoded and resized/converted.
+    """
+    size_bytes = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size_bytes >= MMAP_THRESHOLD:
+            # MIME and dimensions come from the headers; only the pages holding them are read
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+        try:
+            mime_type = sniff_mime(buffer[:16])
+            if mime_type is None:
+                raise ValueError(f"{path} is not a recognised image format")
+            dims = image_size(buffer)
+            oversized = dims is not None and max(dims) > max_side
+            if mime_type in PASSTHROUGH_MIME_TYPES and not oversized:
+                data = bytes(buffer) if isinstance(buffer, mmap.mmap) else buffer
+                info = {"path": path, "resized": False, "original_bytes": size_bytes, "sent_bytes": size_bytes,
+                        "size": dims, "tokens": image_tokens(*dims) if dims else None}
+                return data, mime_type, info
+            data, mime_type, new_dims = _resize(buffer, max_side)
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+    info = {"path": path, "resized": True, "original_bytes": size_bytes, "sent_bytes": len(data),
+            "size": new_dims, "original_size": dims, "tokens": image_tokens(*new_dims)}
+    return data, mime_type, info
+
+
+def load_image_part(path: str, max_side: int = MAX_IMAGE_SIDE) -> tuple[types.Part, dict]:
+    """A Part.from_bytes ready for generate_content, plus what was done to the image."""
+    data, mime_type, info = prepare_image(path, max_side)
+    return types.Part.from_bytes(data=data, mime_type=mime_type), info
+
+
+# --- 2. BATCH PREPROCESSING ---
+def _prepare_worker(args: tuple[str, int]) -> tuple[bytes, str, dict]:
+    path, max_side = args
+    try:
+        return prepare_image(path, max_side)
+    except Exception as e:
+        return b"", "", {"path": path, "error": f"{e.__class__.__name__}: {e}"}
+
+
+def preprocess_images(paths, max_side: int = MAX_IMAGE_SIDE, workers: int | None = None,
+                      max_in_flight: int | None = None):
+    """
+    Prepares many images on a process pool and yields (path, Part | None, info) in input order.
+    At most `max_in_flight` images are submitted or waiting to be consumed, so memory stays bounded
+    no matter how many paths are passed (paths may be a generator). Failed images yield Part None
+    with info["error"].
+    """
+    workers = workers or os.cpu_count() or 2
+    max_in_flight = max_in_flight or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path in paths:
+            pending.append((path, pool.submit(_prepare_worker, (path, max_side))))
+            if len(pending) >= max_in_flight:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def _collect(path: str, future) -> tuple[str, types.Part | None, dict]:
+    data, mime_type, info = future.result()
+    if "error" in info:
+        return path, None, info
+    return path, types.Part.from_bytes(data=data, mime_type=mime_type), info
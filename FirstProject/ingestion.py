@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from llama_index.core import VectorStoreIndex, Settings
+from embedding_pipeline import Checkpoint, EmbeddingPipeline, CHECKPOINT_FILE, CHUNKER_VERSION, EMBED_BATCH_SIZE
+
+# --- Configuration ---
+PERSIST_DIR = "./chroma_db"
+DATA_DIR = "./data"
+COLLECTION_NAME = "company_policy"
+VECTOR_BACKEND = "chroma"   # "chroma" | "mmap" (mmap_vector_store: in-process, no chromadb import or client startup)
+MMAP_DTYPE = "float32"      # "float32" | "float16" | "int8" for the mmap backend
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_SAVE_EVERY_FILES = 50    # during a sync the manifest is rewritten at most this often...
+MANIFEST_SAVE_INTERVAL_S = 5.0    # ...or this many seconds; the embedding checkpoint covers a crash in between
+
+
+# --- 1. MANIFEST HELPERS ---
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(persist_dir: str = PERSIST_DIR) -> str:
+    return os.path.join(persist_dir, MANIFEST_FILE)
+
+
+def load_manifest(persist_dir: str = PERSIST_DIR) -> dict:
+    """Loads the ingestion manifest, or returns an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path(persist_dir), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return {"version": MANIFEST_VERSION, "embed_model": None, "backend": None, "chunker": None, "files": {}}
+
+
+def save_manifest(manifest: dict, persist_dir: str = PERSIST_DIR) -> None:
+    """Writes the manifest atomically so a crash never leaves a half-written file."""
+    os.makedirs(persist_dir, exist_ok=True)
+    path = manifest_path(persist_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def scan_data_dir(data_dir: str = DATA_DIR) -> dict[str, os.stat_result]:
+    """Returns {relative_path: stat} for every non-hidden file under data_dir."""
+    found = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            full_path = os.path.join(root, name)
+            rel_path = os.path.relpath(full_path, data_dir).replace(os.sep, "/")
+            found[rel_path] = os.stat(full_path)
+    return found
+
+
+def plan_changes(data_dir: str, manifest: dict) -> tuple[dict[str, dict], list[str]]:
+    """
+    Compares data_dir against the manifest.
+    Returns:
+        (changed, removed): {relative_path: {"size", "mtime", "sha256"}} for files that need
+        (re-)embedding, and the relative paths whose vectors must be deleted.
+        The stat is taken before hashing, so a file edited after planning looks modified next time.
+    """
+    current = scan_data_dir(data_dir)
+    known = manifest["files"]
+    changed = {}
+
+    for rel_path, stat in sorted(current.items()):
+        entry = known.get(rel_path)
+        # Cheap check first: size + mtime unchanged means we skip hashing entirely.
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            continue
+        sha256 = file_sha256(os.path.join(data_dir, rel_path))
+        if entry and entry["sha256"] == sha256:
+            # Touched but not modified (e.g. copied or checked out again): just refresh the stat.
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            continue
+        changed[rel_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+    removed = sorted(set(known) - set(current))
+    return changed, removed
+
+
+# --- 2. INCREMENTAL INDEX SYNC ---
+def open_vector_store(persist_dir: str = PERSIST_DIR, collection_name: str = COLLECTION_NAME,
+                      backend: str = VECTOR_BACKEND):
+    """
+    Opens (or creates) the persistent vector store for LlamaIndex.
+    Returns:
+        (delete_ids, clear, vector_store): callables that delete chunks by id and delete every
+        chunk, and the store itself.
+    """
+    if backend == "mmap":
+        from mmap_vector_store import MmapVectorStore
+
+        vector_store = MmapVectorStore(os.path.join(persist_dir, f"{collection_name}.mmap"), dtype=MMAP_DTYPE)
+        return vector_store.delete_nodes, vector_store.clear, vector_store
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector backend: {backend}")
+    import chromadb
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
+    db = chromadb.PersistentClient(path=persist_dir)
+    chroma_collection = db.get_or_create_collection(collection_name)
+
+    def delete_ids(ids: list[str]) -> None:
+        if ids:   # Chroma rejects an empty id list
+            chroma_collection.delete(ids=ids)
+
+    def clear() -> None:
+        delete_ids(chroma_collection.get(include=[])["ids"])
+
+    return delete_ids, clear, ChromaVectorStore(chroma_collection=chroma_collection)
+
+
+def sync_index(data_dir: str = DATA_DIR, persist_dir: str = PERSIST_DIR,
+               collection_name: str = COLLECTION_NAME, batch_size: int = EMBED_BATCH_SIZE,
+               backend: str = VECTOR_BACKEND) -> VectorStoreIndex:
+    """
+    Brings the vector index (Chroma or mmap backend) in line with data_dir and returns it.
+    Only new or modified files are embedded; vectors of removed files are deleted.
+    When nothing changed, this only stats the files and opens the existing collection.
+    """
+    delete_ids, clear, vector_store = open_vector_store(persist_dir, collection_name, backend)
+    index = VectorStoreIndex.from_vector_store(vector_store)
+    manifest = load_manifest(persist_dir)
+
+    # Vectors from a different embedding model are not comparable, a freshly selected backend
+    # holds none of the manifest's chunks, and a new chunker changes every chunk: re-embed
+    # everything (mostly embedding-cache hits). Older manifests were Chroma and chunker 1.
+    embed_model_name = getattr(Settings.embed_model, "model_name", None)
+    if (manifest["embed_model"] != embed_model_name or manifest.get("backend", "chroma") != backend
+            or manifest.get("chunker", 1) != CHUNKER_VERSION):
+        if manifest.get("backend", "chroma") != backend:
+            # The manifest lists the other backend's chunks; this store may still hold vectors
+            # from an earlier run on it that no manifest tracks any more.
+            clear()
+        else:
+            stale_ids = [cid for entry in manifest["files"].values() for cid in entry["chunk_ids"]]
+            if stale_ids:
+                delete_ids(stale_ids)
+        # Chunk ids do not encode the model or backend, so a leftover checkpoint would skip chunks
+        Checkpoint(os.path.join(persist_dir, CHECKPOINT_FILE)).clear()
+        manifest = {"version": MANIFEST_VERSION, "embed_model": embed_model_name, "backend": backend,
+                    "chunker": CHUNKER_VERSION, "files": {}}
+
+    changed, removed = plan_changes(data_dir, manifest)
+    if not changed and not removed:
+        save_manifest(manifest, persist_dir)  # persists any refreshed mtimes
+        print(f"Vector index is up to date ({len(manifest['files'])} file(s), nothing to embed).")
+        return index
+
+    # 2a. Drop vectors for files that disappeared or are about to be re-embedded
+    for rel_path in removed + list(changed):
+        entry = manifest["files"].pop(rel_path, None)
+        if entry and entry["chunk_ids"]:
+            delete_ids(entry["chunk_ids"])
+    save_manifest(manifest, persist_dir)
+
+    # 2b. Stream new/changed files through the batched, rate-adaptive embedding pipeline.
+    # A file's manifest entry is added only once all of its chunks are stored. The manifest is
+    # written in batches: after a crash, files missing from it are planned again and their
+    # chunks restored from the checkpoint instead of being re-embedded.
+    unsaved = 0
+    last_save = time.monotonic()
+    committed = 0
+
+    def commit_file(rel_path: str, chunk_ids: list[str]) -> None:
+        nonlocal unsaved, last_save, committed
+        manifest["files"][rel_path] = {**changed[rel_path], "chunk_ids": chunk_ids}
+        unsaved += 1
+        committed += 1
+        # The last file is saved before the pipeline discards its checkpoint
+        if (committed == len(changed) or unsaved >= MANIFEST_SAVE_EVERY_FILES
+                or time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL_S):
+            save_manifest(manifest, persist_dir)
+            unsaved, last_save = 0, time.monotonic()
+
+    if changed:
+        pipeline = EmbeddingPipeline(
+            vector_store,
+            batch_size=batch_size,
+            checkpoint_path=os.path.join(persist_dir, CHECKPOINT_FILE),
+            on_file_done=commit_file,
+        )
+        try:
+            asyncio.run(pipeline.run(data_dir, {rel_path: entry["sha256"] for rel_path, entry in changed.items()}))
+        finally:
+            if unsaved:
+                save_manifest(manifest, persist_dir)
+
+    print(f"Vector index synced: {len(changed)} file(s) embedded, {len(removed)} file(s) removed.")
+    return index
+
+
+def index_fingerprint(persist_dir: str = PERSIST_DIR) -> str:
+    """Hash of the indexed corpus (file paths + content hashes); changes whenever a sync embeds or removes files."""
+    manifest = load_manifest(persist_dir)
+    entries = sorted((path, entry["sha256"]) for path, entry in manifest["files"].items())
+    return hashlib.sha256(json.dumps([manifest["embed_model"], entries]).encode("utf-8")).hexdigest()
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# --- Configuration ---
+METRICS_JSON_PATH = "./cache/latency_metrics.json"
+METRICS_PROM_PATH = "./cache/latency_metrics.prom"    # Prometheus textfile-collector format
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_S_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000)
+MAX_CALL_RECORDS = 1000        # recent per-call records (with usage_metadata) kept for the JSON sink
+
+METRIC_BUCKETS = {
+    "ttft_seconds": LATENCY_BUCKETS_S,
+    "inter_chunk_gap_seconds": LATENCY_BUCKETS_S,
+    "duration_seconds": LATENCY_BUCKETS_S,
+    "stage_seconds": LATENCY_BUCKETS_S,
+    "output_tokens_per_second": TOKENS_PER_S_BUCKETS,
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus semantics): observe() is a bisect and two additions."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (the resolution Prometheus would give)."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _model_of(chat) -> str:
+    return getattr(chat, "_model", None) or "unknown"
+
+
+def _label(value) -> str:
+    """A Prometheus label value: backslash, double quote and newline escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _usage_dict(usage) -> dict:
+    if usage is None:
+        return {}
+    return {k: v for k, v in usage.model_dump(exclude_none=True).items() if isinstance(v, (int, float))}
+
+
+# --- LATENCY RECORDER ---
+class LatencyRecorder:
+    """
+    Per-call timing for model requests, labelled by model and call site:
+    time to first token, inter-chunk gaps, total duration, output tokens/s and usage_metadata.
+    Wrap calls with generate_content / generate_content_stream / send_message / send_message_stream
+    (same arguments as the SDK plus `site`), and time retrieval or SQL with span(stage, site) so
+    slow turns can be attributed. Exported as Prometheus text and JSON at exit (or via export()).
+    """
+
+    def __init__(self, json_path: str | None = METRICS_JSON_PATH, prom_path: str | None = METRICS_PROM_PATH):
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple, Histogram] = {}    # (metric, model, site[, stage]) -> Histogram
+        self.counters: dict[tuple, float] = {}          # (metric, model, site) -> total
+        self.calls = deque(maxlen=MAX_CALL_RECORDS)
+        atexit.register(self.export)
+
+    # --- Recording ---
+    def _observe(self, metric: str, labels: tuple, value: float) -> None:
+        key = (metric,) + labels
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = Histogram(METRIC_BUCKETS[metric])
+        hist.observe(value)
+
+    def _count(self, metric: str, labels: tuple, value: float) -> None:
+        key = (metric,) + labels
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_call(self, model: str, site: str, start: float, end: float, first_chunk: float | None = None,
+                    gaps: list[float] | None = None, usage=None, error: str | None = None) -> None:
+        labels = (model, site)
+        duration = end - start
+        usage = _usage_dict(usage)
+        output_tokens = usage.get("candidates_token_count", 0)
+        # candidates_token_count includes the first chunk's tokens, which arrived at first_chunk, so a
+        # rate over end - first_chunk would overstate it (unboundedly for one-chunk streams). Streams use
+        # the whole call and are skipped when they delivered everything in one chunk.
+        single_chunk = first_chunk is not None and not gaps
+        gen_time = 0.0 if single_chunk else duration
+        with self._lock:
+            self._count("calls_total", labels, 1)
+            if error:
+                self._count("errors_total", labels, 1)
+            self._observe("duration_seconds", labels, duration)
+            if first_chunk is not None:
+                self._observe("ttft_seconds", labels, first_chunk - start)
+            for gap in gaps or ():
+                self._observe("inter_chunk_gap_seconds", labels, gap)
+            if output_tokens and gen_time > 0:
+                self._observe("output_tokens_per_second", labels, output_tokens / gen_time)
+            for field, metric in (("prompt_token_count", "prompt_tokens_total"),
+                                  ("candidates_token_count", "output_tokens_total"),
+                                  ("cached_content_token_count", "cached_tokens_total")):
+                if usage.get(field):
+                    self._count(metric, labels, usage[field])
+            self.calls.append({
+                "model": model, "site": site, "at": time.time(), "duration_s": duration,
+                "ttft_s": first_chunk - start if first_chunk is not None else None,
+                "chunks": len(gaps) + 1 if gaps is not None else None, "usage": usage, "error": error,
+            })
+
+    @contextmanager
+    def span(self, stage: str, site: str, model: str = "-"):
+        """Times a non-model stage (retrieval, SQL, tools) under stage_seconds{stage=...}."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, site, time.perf_counter() - start, model)
+
+    def observe_stage(self, stage: str, site: str, seconds: float, model: str = "-") -> None:
+        with self._lock:
+            self._observe("stage_seconds", (model, site, stage), seconds)
+
+    # --- SDK wrappers ---
+    def generate_content(self, client, site: str, **kwargs):
+        start, usage, error = time.perf_counter(), None, None
+        try:
+            response = client.models.generate_content(**kwargs)
+            usage = response.usage_metadata
+            return response
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            self.record_call(kwargs.get("model", "unknown"), site, start, time.perf_counter(), usage=usage, error=error)
+
+    def generate_content_stream(self, client, site: str, **kwargs):
+        yield from self._timed_stream(lambda: client.models.generate_content_stream(**kwargs),
+                                      kwargs.get("model", "unknown"), site)
+
+    def send_message(self, chat, message, site: str, **kwargs):
+        start, usage, error = time.perf_counter(), None, None
+        try:
+            response = chat.send_message(message, **kwargs)
+            usage = response.usage_metadata
+            return response
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            self.record_call(_model_of(chat), site, start, time.perf_counter(), usage=usage, error=error)
+
+    async def asend_message(self, chat, message, site: str, **kwargs):
+        """send_message for a client.aio chat."""
+        start, usage, error = time.perf_counter(), None, None
+        try:
+            response = await chat.send_message(message, **kwargs)
+            usage = response.usage_metadata
+            return response
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            self.record_call(_model_of(chat), site, start, time.perf_counter(), usage=usage, error=error)
+
+    def send_message_stream(self, chat, message, site: str, **kwargs):
+        yield from self._timed_stream(lambda: chat.send_message_stream(message, **kwargs), _model_of(chat), site)
+
+    def _timed_stream(self, open_stream, model: str, site: str):
+        # Only timestamps are taken per chunk; everything else happens once the stream ends
+        start = time.perf_counter()
+        stamps, usage, error = [], None, None
+        try:
+            for chunk in open_stream():
+                stamps.append(time.perf_counter())
+                if chunk.usage_metadata is not None:
+                    usage = chunk.usage_metadata
+                yield chunk
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+            self.record_call(model, site, start, end, stamps[0] if stamps else None, gaps, usage, error)
+
+    # --- Export ---
+    def summary(self) -> dict:
+        """p50/p95 (bucket bounds), mean and count per histogram, plus counters, for logs and JSON."""
+        with self._lock:
+            histograms = {
+                "|".join(key): {"count": h.count, "mean": h.sum / h.count if h.count else None,
+                                "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                for key, h in self.histograms.items()
+            }
+            counters = {"|".join(key): v for key, v in self.counters.items()}
+        return {"histograms": histograms, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in METRIC_BUCKETS:
+                series = [(k, h) for k, h in self.histograms.items() if k[0] == metric]
+                if not series:
+                    continue
+                lines.append(f"# TYPE genai_{metric} histogram")
+                for key, h in series:
+                    labels = f'model="{_label(key[1])}",site="{_label(key[2])}"' + \
+                        (f',stage="{_label(key[3])}"' if len(key) > 3 else "")
+                    cumulative = 0
+                    for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                        cumulative += n
+                        lines.append(f'genai_{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"genai_{metric}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"genai_{metric}_count{{{labels}}} {h.count}")
+            for metric in sorted({k[0] for k in self.counters}):
+                lines.append(f"# TYPE genai_{metric} counter")
+                for key, v in self.counters.items():
+                    if key[0] == metric:
+                        lines.append(f'genai_{metric}{{model="{_label(key[1])}",site="{_label(key[2])}"}} {v}')
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        """Writes the JSON sink (summary + recent calls) and the Prometheus text file atomically."""
+        if not self.calls and not self.histograms:
+            return
+        with self._lock:
+            calls = list(self.calls)
+        outputs = []
+        if self.json_path:
+            outputs.append((self.json_path, json.dumps({**self.summary(), "calls": calls}, indent=2)))
+        if self.prom_path:
+            outputs.append((self.prom_path, self.prometheus_text()))
+        for path, payload in outputs:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+
+# Shared recorder: every agent in the process reports into the same histograms
+metrics = LatencyRecorder()
@@ -0,0 +1,517 @@
+import os
+import json
+import threading
+from typing import Any
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+# --- Configuration ---
+# "float32" | "float16" | "int8" (symmetric, one float32 scale per row). Quantized files are 2-4x
+# smaller on disk and in the page cache, but every scanned row is converted back to float32 per
+# query, so they pay off for large stores, batched queries or together with the IVF index.
+DEFAULT_DTYPE = "float32"
+IVF_MIN_ROWS = 50_000            # below this an exact scan of the whole matrix is cheaper than probing lists
+IVF_NPROBE = 8                   # inverted lists scanned per query
+IVF_KMEANS_ITERATIONS = 10
+IVF_SAMPLE_PER_LIST = 64         # k-means trains on this many rows per list, not on the whole matrix
+IVF_REBUILD_GROWTH = 0.25        # rebuild once rows added after the last build exceed this fraction
+QUERY_BLOCK_ROWS = 65_536        # rows dequantized per matmul; bounds the temporary float32 copy
+COMPACT_DELETED_RATIO = 0.2      # rewrite the files once this fraction of rows is deleted
+STORE_FORMAT = 1
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+HEADER_FILE = "store.json"
+
+
+# --- 1. VECTOR HELPERS ---
+def normalize_rows(vectors, dim: int | None = None) -> np.ndarray:
+    """
+    float32 copy truncated to the first `dim` components and L2-normalized, so cosine similarity
+    is a dot product. Truncation is how a reduced output_dimensionality is applied to stored and
+    query vectors alike (meaningful for Matryoshka-trained models such as gemini-embedding-001).
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    if dim is not None:
+        vectors = vectors[:, :dim]
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Returns (stored matrix, per-row scales or None). int8 rows are scaled so their largest component is 127."""
+    if dtype == "int8":
+        scales = (np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    return vectors.astype(DTYPES[dtype]), None
+
+
+def _sync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _match(value, operator: FilterOperator, target) -> bool:
+    try:
+        if operator == FilterOperator.EQ:
+            return value == target
+        if operator == FilterOperator.NE:
+            return value != target
+        if operator == FilterOperator.GT:
+            return value is not None and value > target
+        if operator == FilterOperator.GTE:
+            return value is not None and value >= target
+        if operator == FilterOperator.LT:
+            return value is not None and value < target
+        if operator == FilterOperator.LTE:
+            return value is not None and value <= target
+        if operator == FilterOperator.IN:
+            return value in target
+        if operator == FilterOperator.NIN:
+            return value not in target
+        if operator == FilterOperator.CONTAINS:
+            return isinstance(value, list) and target in value
+        if operator == FilterOperator.ANY:
+            return isinstance(value, list) and any(v in value for v in target)
+        if operator == FilterOperator.ALL:
+            return isinstance(value, list) and all(v in value for v in target)
+        if operator == FilterOperator.TEXT_MATCH:
+            return isinstance(value, str) and target in value
+        if operator == FilterOperator.TEXT_MATCH_INSENSITIVE:
+            return isinstance(value, str) and target.lower() in value.lower()
+        if operator == FilterOperator.IS_EMPTY:
+            return value is None or value == "" or value == []
+    except TypeError:
+        # e.g. comparing a year stored as a string against an int
+        return False
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def matches_filters(metadata: dict, filters: MetadataFilters) -> bool:
+    """Evaluates LlamaIndex MetadataFilters (nested, AND / OR / NOT) against one node's metadata."""
+    results = (
+        matches_filters(metadata, f) if isinstance(f, MetadataFilters) else _match(metadata.get(f.key), f.operator, f.value)
+        for f in filters.filters
+    )
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    if filters.condition == FilterCondition.NOT:
+        return not any(results)
+    return all(results)
+
+
+# --- 2. MEMORY-MAPPED STORE ---
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store for VectorStoreIndex, for read-mostly corpora.
+    Vectors live in one flat file per generation (float32, float16 or int8 + scales) that is
+    opened with np.memmap: every worker process maps the same pages from the OS page cache,
+    nothing is copied or deserialized at startup. Node text and metadata are a JSON-lines sidecar.
+    Search is an exact blocked matmul + argpartition top-k; above ivf_min_rows an IVF coarse
+    quantizer (spherical k-means) restricts each query to its nprobe nearest lists.
+    Writes append to the files and then publish a new header atomically, so readers in other
+    processes never see a half-written batch; one writer process at a time is assumed.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    path: str
+    dtype: str = DEFAULT_DTYPE
+    output_dimensionality: int | None = None
+    nprobe: int = IVF_NPROBE
+    ivf_min_rows: int = IVF_MIN_ROWS
+
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _header: dict = PrivateAttr(default_factory=dict)
+    _header_stamp: tuple | None = PrivateAttr(default=None)
+    _vectors: np.ndarray | None = PrivateAttr(default=None)
+    _scales: np.ndarray | None = PrivateAttr(default=None)
+    _records: list = PrivateAttr(default_factory=list)       # per row: {"id", "ref_doc_id", "metadata"}
+    _records_bytes: int = PrivateAttr(default=0)              # sidecar bytes already parsed
+    _row_of: dict = PrivateAttr(default_factory=dict)         # node id -> live row
+    _alive: np.ndarray | None = PrivateAttr(default=None)
+    _ivf: dict | None = PrivateAttr(default=None)
+    _filter_masks: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, path: str, dtype: str = DEFAULT_DTYPE, output_dimensionality: int | None = None,
+                 nprobe: int = IVF_NPROBE, ivf_min_rows: int = IVF_MIN_ROWS, **kwargs: Any):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(DTYPES)}, got {dtype!r}")
+        super().__init__(path=path, dtype=dtype, output_dimensionality=output_dimensionality,
+                         nprobe=nprobe, ivf_min_rows=ivf_min_rows, **kwargs)
+        self._refresh()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def count(self) -> int:
+        """Live (not deleted) nodes. Deliberately not __len__: StorageContext treats an empty store as falsy."""
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    # --- Files ---
+    def _file(self, kind: str, generation: int | None = None) -> str:
+        generation = self._header.get("generation", 0) if generation is None else generation
+        return os.path.join(self.path, {
+            "vectors": f"vectors.{generation}.bin",
+            "scales": f"scales.{generation}.bin",
+            "nodes": f"nodes.{generation}.jsonl",
+            "ivf": f"ivf.{generation}.npz",
+        }[kind])
+
+    def _write_header(self, header: dict) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, HEADER_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+            _sync(f)
+        os.replace(tmp_path, path)
+
+    def _new_header(self, generation: int = 0) -> dict:
+        return {"format": STORE_FORMAT, "generation": generation, "dtype": self.dtype, "dim": None,
+                "count": 0, "nodes_bytes": 0, "deleted": [], "ivf_rows": 0}
+
+    def _refresh(self) -> None:
+        """Picks up batches, deletions and compactions published by a writer (possibly another process)."""
+        try:
+            stat = os.stat(os.path.join(self.path, HEADER_FILE))
+        except FileNotFoundError:
+            if self._header_stamp is not None or not self._header:
+                self._header, self._header_stamp = self._new_header(), None
+                self._reset_rows()
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._header_stamp:
+            return
+        with open(os.path.join(self.path, HEADER_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != STORE_FORMAT:
+            raise ValueError(f"{self.path} was written by an incompatible MmapVectorStore (format {header.get('format')})")
+        if header["generation"] != self._header.get("generation") or header["count"] < len(self._records):
+            self._reset_rows()
+        self._header, self._header_stamp = header, stamp
+        count, dim = header["count"], header["dim"]
+
+        # Only the sidecar bytes written since the last refresh are parsed
+        if len(self._records) < count:
+            with open(self._file("nodes"), "rb") as f:
+                f.seek(self._records_bytes)
+                chunk = f.read(header["nodes_bytes"] - self._records_bytes)
+            self._records_bytes = header["nodes_bytes"]
+            self._records.extend(json.loads(line) for line in chunk.splitlines() if line)
+
+        if count:
+            self._vectors = np.memmap(self._file("vectors"), dtype=DTYPES[header["dtype"]], mode="r", shape=(count, dim))
+            self._scales = (np.memmap(self._file("scales"), dtype=np.float32, mode="r", shape=(count,))
+                            if header["dtype"] == "int8" else None)
+        self._alive = np.ones(count, dtype=bool)
+        self._alive[header["deleted"]] = False
+        self._row_of = {self._records[row]["id"]: row for row in np.flatnonzero(self._alive).tolist()}
+        self._filter_masks.clear()
+
+        self._ivf = None
+        if header["ivf_rows"]:
+            with np.load(self._file("ivf")) as ivf:
+                # A rebuild in progress may already have replaced the file; exact search until its header lands
+                if int(ivf["rows"]) == header["ivf_rows"]:
+                    self._ivf = {name: ivf[name] for name in ("centroids", "order", "offsets")}
+                    self._ivf["rows"] = header["ivf_rows"]
+
+    def _reset_rows(self) -> None:
+        self._vectors = self._scales = self._ivf = None
+        self._records, self._row_of, self._records_bytes = [], {}, 0
+        self._alive = np.ones(0, dtype=bool)
+        self._filter_masks.clear()
+
+    # --- Writes ---
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        """Appends nodes; a node id that is already stored replaces the old row (upsert)."""
+        if not nodes:
+            return []
+        with self._lock:
+            self._refresh()
+            header = dict(self._header)
+            vectors = normalize_rows([n.get_embedding() for n in nodes], header["dim"] or self.output_dimensionality)
+            if header["dim"] is None:
+                header["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != header["dim"]:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, the store holds {header['dim']}")
+            data, scales = quantize(vectors, header["dtype"])
+
+            deleted, row_of, lines = set(header["deleted"]), dict(self._row_of), []
+            for offset, node in enumerate(nodes):
+                if node.node_id in row_of:
+                    deleted.add(row_of[node.node_id])
+                row_of[node.node_id] = header["count"] + offset
+                record = {"id": node.node_id, "ref_doc_id": node.ref_doc_id,
+                          "metadata": node_to_metadata_dict(node, remove_text=False, flat_metadata=self.flat_metadata)}
+                lines.append(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+            os.makedirs(self.path, exist_ok=True)
+            itemsize = np.dtype(DTYPES[header["dtype"]]).itemsize
+            # Cut off anything a crashed writer appended after the last published header
+            appends = [(self._file("vectors"), header["count"] * header["dim"] * itemsize, data.tobytes()),
+                       (self._file("nodes"), header["nodes_bytes"], b"".join(lines))]
+            if scales is not None:
+                appends.append((self._file("scales"), header["count"] * 4, scales.tobytes()))
+            for path, valid_bytes, payload in appends:
+                with open(path, "ab") as f:
+                    f.truncate(valid_bytes)
+                    f.write(payload)
+                    _sync(f)
+
+            header.update(count=header["count"] + len(nodes), nodes_bytes=header["nodes_bytes"] + len(appends[1][2]),
+                          deleted=sorted(deleted))
+            self._write_header(header)
+            self._refresh()
+            self._maintain()
+        return [n.node_id for n in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Deletes every node that came from the document ref_doc_id."""
+        with self._lock:
+            self._refresh()
+            self._mark_deleted([row for row in self._row_of.values() if self._records[row]["ref_doc_id"] == ref_doc_id])
+
+    def delete_nodes(self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None,
+                     **delete_kwargs: Any) -> None:
+        with self._lock:
+            self._refresh()
+            rows = self._row_of.values() if node_ids is None else [self._row_of[i] for i in node_ids if i in self._row_of]
+            if filters is not None:
+                rows = [row for row in rows if matches_filters(self._records[row]["metadata"], filters)]
+            self._mark_deleted(list(rows))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._refresh()
+            old_generation = self._header["generation"]
+            self._write_header(self._new_header(old_generation + 1))
+            self._refresh()
+            self._remove_generation(old_generation)
+
+    def _mark_deleted(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        header = dict(self._header)
+        header["deleted"] = sorted(set(header["deleted"]) | set(rows))
+        self._write_header(header)
+        self._refresh()
+        self._maintain()
+
+    # --- Maintenance ---
+    def _maintain(self) -> None:
+        count, deleted = self._header["count"], len(self._header["deleted"])
+        if count and deleted / count > COMPACT_DELETED_RATIO:
+            self.compact()
+            return
+        ivf_rows = self._header["ivf_rows"]
+        if count - deleted >= self.ivf_min_rows and (not ivf_rows or count - ivf_rows > IVF_REBUILD_GROWTH * ivf_rows):
+            self.build_ivf()
+
+    def compact(self) -> None:
+        """Rewrites the live rows into a new generation of files; readers switch on their next query."""
+        with self._lock:
+            self._refresh()
+            old = self._header
+            live = np.flatnonzero(self._alive)
+            header = self._new_header(old["generation"] + 1)
+            header.update(dtype=old["dtype"], dim=old["dim"], count=int(live.size))
+            os.makedirs(self.path, exist_ok=True)
+            # Every new file is on disk before the header that publishes the generation (as in add)
+            with open(self._file("vectors", header["generation"]), "wb") as f:
+                for start in range(0, live.size, QUERY_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(self._vectors[live[start:start + QUERY_BLOCK_ROWS]]).tobytes())
+                _sync(f)
+            if self._scales is not None:
+                with open(self._file("scales", header["generation"]), "wb") as f:
+                    f.write(np.ascontiguousarray(self._scales[live]).tobytes())
+                    _sync(f)
+            with open(self._file("nodes", header["generation"]), "wb") as f:
+                for row in live.tolist():
+                    header["nodes_bytes"] += f.write(json.dumps(self._records[row], ensure_ascii=False).encode("utf-8") + b"\n")
+                _sync(f)
+            self._write_header(header)
+            self._refresh()
+            self._remove_generation(old["generation"])
+            if live.size >= self.ivf_min_rows:
+                self.build_ivf()
+
+    def _remove_generation(self, generation: int) -> None:
+        # Processes that still map the old files keep their pages until they refresh (POSIX unlink semantics)
+        for kind in ("vectors", "scales", "nodes", "ivf"):
+            try:
+                os.remove(self._file(kind, generation))
+            except (FileNotFoundError, PermissionError):
+                pass
+
+    def build_ivf(self, nlist: int | None = None, seed: int = 0) -> None:
+        """Trains the coarse quantizer (spherical k-means on a sample) and assigns every row to a list."""
+        with self._lock:
+            self._refresh()
+            count = self._header["count"]
+            if not count:
+                return
+            nlist = nlist or int(np.clip(np.sqrt(count), 16, 4096))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(count, size=min(count, nlist * IVF_SAMPLE_PER_LIST), replace=False))
+            sample_vectors = self._rows(sample)
+            centroids = sample_vectors[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)]
+            for _ in range(IVF_KMEANS_ITERATIONS):
+                assignment = (sample_vectors @ centroids.T).argmax(axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample_vectors)
+                empty = np.bincount(assignment, minlength=len(centroids)) == 0
+                # Empty lists are re-seeded from random rows instead of collapsing
+                sums[empty] = sample_vectors[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = normalize_rows(sums)
+            assignment = np.concatenate([
+                (self._rows(slice(start, min(start + QUERY_BLOCK_ROWS, count))) @ centroids.T).argmax(axis=1)
+                for start in range(0, count, QUERY_BLOCK_ROWS)
+            ])
+            order = np.argsort(assignment, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+            tmp_path = self._file("ivf") + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, centroids=centroids, order=order, offsets=offsets, rows=count)
+                _sync(f)
+            os.replace(tmp_path, self._file("ivf"))
+            header = dict(self._header, ivf_rows=count)
+            self._write_header(header)
+            self._refresh()
+            print(f"(Vector store: IVF index built, {len(centroids)} lists over {count:,} rows.)")
+
+    # --- Search ---
+    def _rows(self, index) -> np.ndarray:
+        """Dequantized float32 rows; a slice reads straight from the mapping, an index array gathers."""
+        block = np.asarray(self._vectors[index], dtype=np.float32)
+        if self._scales is not None:
+            block *= self._scales[index][:, None]
+        return block
+
+    def _scores(self, queries: np.ndarray, index) -> np.ndarray:
+        """queries @ rows.T; int8 scales are applied to the (rows x queries) scores, not to every component."""
+        scores = queries @ np.asarray(self._vectors[index], dtype=np.float32).T
+        if self._scales is not None:
+            scores *= self._scales[index]
+        return scores
+
+    def _filter_mask(self, filters: MetadataFilters | None, node_ids: list[str] | None,
+                     doc_ids: list[str] | None) -> np.ndarray:
+        mask = self._alive
+        if filters is not None and filters.filters:
+            key = filters.model_dump_json()
+            if key not in self._filter_masks:
+                self._filter_masks[key] = np.fromiter(
+                    (matches_filters(r["metadata"], filters) for r in self._records), dtype=bool, count=len(self._records))
+            mask = mask & self._filter_masks[key]
+        if node_ids is not None:
+            allowed = np.zeros_like(mask)
+            allowed[[self._row_of[i] for i in node_ids if i in self._row_of]] = True
+            mask = mask & allowed
+        if doc_ids is not None:
+            doc_ids = set(doc_ids)
+            mask = mask & np.fromiter((r["ref_doc_id"] in doc_ids for r in self._records), dtype=bool, count=len(self._records))
+        return mask
+
+    def _top_k(self, queries: np.ndarray, k: int, mask: np.ndarray, candidates: np.ndarray | None = None):
+        """Exact top-k over all rows (blocked slices) or over a sorted candidate row array (gathered)."""
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        total = len(mask) if candidates is None else len(candidates)
+        for start in range(0, total, QUERY_BLOCK_ROWS):
+            end = min(start + QUERY_BLOCK_ROWS, total)
+            rows = np.arange(start, end) if candidates is None else candidates[start:end]
+            scores = self._scores(queries, slice(start, end) if candidates is None else rows)
+            scores[:, ~mask[rows]] = -np.inf
+            best_scores = np.hstack([best_scores, scores])
+            best_rows = np.hstack([best_rows, np.broadcast_to(rows, scores.shape)])
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return np.where(np.isfinite(best_scores), best_rows, -1), best_scores
+
+    def search_rows(self, queries, k: int, filters: MetadataFilters | None = None, node_ids: list[str] | None = None,
+                    doc_ids: list[str] | None = None, exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched top-k for a (n_queries, dim) array.
+        Returns:
+            (rows, scores), both (n_queries, <=k), best first; row -1 marks an empty slot.
+        """
+        with self._lock:
+            self._refresh()
+            queries = np.array(queries, dtype=np.float32, ndmin=2)
+            if not self._header["count"] or k <= 0:
+                return np.full((len(queries), 0), -1), np.zeros((len(queries), 0), dtype=np.float32)
+            queries = normalize_rows(queries, self._header["dim"])
+            mask = self._filter_mask(filters, node_ids, doc_ids)
+            ivf = self._ivf
+            # A selective prefilter is scanned exactly; so is everything when there is no IVF index
+            selective = mask is not self._alive and np.count_nonzero(mask) <= QUERY_BLOCK_ROWS
+            if exact or ivf is None or selective:
+                return self._top_k(queries, k, mask, np.flatnonzero(mask) if selective else None)
+
+            probes = np.argpartition(-(queries @ ivf["centroids"].T), min(self.nprobe, len(ivf["centroids"])) - 1,
+                                     axis=1)[:, :self.nprobe]
+            tail = np.arange(ivf["rows"], len(mask))   # rows added since the last build are always scanned
+            results = [
+                self._top_k(query[None, :], k, mask, np.sort(np.concatenate(
+                    [ivf["order"][ivf["offsets"][p]:ivf["offsets"][p + 1]] for p in probe] + [tail])))
+                for query, probe in zip(queries, probes)
+            ]
+        width = max(r[0].shape[1] for r in results)
+        rows = np.full((len(results), width), -1)
+        scores = np.full((len(results), width), -np.inf, dtype=np.float32)
+        for i, (r, s) in enumerate(results):
+            rows[i, :r.shape[1]], scores[i, :s.shape[1]] = r[0], s[0]
+        return rows, scores
+
+    def search(self, queries, k: int, **kwargs) -> list[list[tuple[str, float]]]:
+        """Batched top-k as [(node_id, cosine similarity), ...] per query."""
+        with self._lock:
+            rows, scores = self.search_rows(queries, k, **kwargs)
+            return [[(self._records[r]["id"], float(s)) for r, s in zip(row, score) if r >= 0]
+                    for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("MmapVectorStore only answers embedding queries.")
+        # VectorIndexRetriever passes node_ids=[] for "no restriction"
+        with self._lock:
+            rows, scores = self.search_rows([query.query_embedding], query.similarity_top_k, filters=query.filters,
+                                            node_ids=query.node_ids or None, doc_ids=query.doc_ids or None)
+            hits = [(self._records[r], float(s)) for r, s in zip(rows[0].tolist(), scores[0].tolist()) if r >= 0]
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(record["metadata"]) for record, _ in hits],
+            similarities=[s for _, s in hits],
+            ids=[record["id"] for record, _ in hits],
+        )
+
+    def get_nodes(self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None) -> list[BaseNode]:
+        with self._lock:
+            self._refresh()
+            rows = self._row_of.values() if node_ids is None else [self._row_of[i] for i in node_ids if i in self._row_of]
+            records = [self._records[row] for row in rows]
+        if filters is not None:
+            records = [r for r in records if matches_filters(r["metadata"], filters)]
+        return [metadata_dict_to_node(r["metadata"]) for r in records]
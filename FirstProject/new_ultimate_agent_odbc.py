@@ -1,37 +1,55 @@
 import os
-import json
+import time
 import chromadb
 from google import genai
 from google.genai import types
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+from embedding_cache import CachedEmbedding
+from semantic_cache import SemanticCache
+from sql_cache import CachedSQLQueryEngine, schema_fingerprint
+from schema_snapshot import load_sql_database
+from schema_retrieval import SchemaRetrievalSQLQueryEngine
+from sql_rows import sql_rows_context
+from sql_guard import BoundedSQLDatabase
+from db_engines import EngineRouter
+from query_router import QueryRouter, ROUTE_SQL, ROUTE_TOOL, ROUTE_NONE
 # --- SQL Imports ---
 from llama_index.core import SQLDatabase
 from llama_index.core.query_engine import NLSQLTableQueryEngine
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Integer, text
+from sqlalchemy import MetaData, Table, Column, String, Integer, text
 from sqlalchemy.engine.url import URL  # Useful for complex connection strings
+from tools import get_current_weather
+from tool_executor import ToolExecutor
+from context_cache import ContextCacheManager, GeminiCacheBackend
+from latency_metrics import metrics
 
 # --- Global Configuration & Setup ---
 Settings.llm = GoogleGenAI(model="gemini-2.5-flash")
-Settings.embed_model = GoogleGenAIEmbedding(model_name="models/embedding-001")
+Settings.embed_model = CachedEmbedding(GoogleGenAIEmbedding(model_name="models/embedding-001"))
 PERSIST_DIR = "./chroma_db"
 DATA_DIR = "./data"
+USE_SEMANTIC_CACHE = False  # opt-in: reuse answers for near-duplicate questions
+USE_SQL_CACHE = True  # reuse generated SQL for repeat / same-shape data questions
+USE_SCHEMA_RETRIEVAL = False  # send only the relevant tables' schemas (for databases with many tables)
+USE_SQL_GUARD = True  # row limit, cost pre-check, streamed + token-bounded results and a timeout for generated SQL
+# "single_pass": raw SQL rows go straight into the chat turn (2 model calls per data question)
+# "synthesize":  LlamaIndex first turns the rows into prose, then the chat answers (3 model calls)
+ORCHESTRATION_MODE = "single_pass"
+USE_CONTEXT_CACHE = True  # reuse a cached-content handle for the static persona/tools prefix
+USE_QUERY_ROUTER = True  # skip NL-to-SQL for tool-only / general questions (decided locally, no LLM call)
+RUN_LATENCY_COMPARISON = False  # time both modes on the test question at the end of the script
 client = genai.Client()
 
-# Initialize the engine variable in the global scope for the final cleanup step
+# Initialize the engine variables in the global scope for the final cleanup step
 engine = None
+engines = None
 query_engine_sql = None  # Initialize the query engine to None
 
 
 # --- 1. TOOL DEFINITION (Function Calling) ---
-def get_current_weather(city: str) -> str:
-    """Returns the current weather for a specific city."""
-    city = city.lower()
-    if "boston" in city:
-        return json.dumps({"temperature": "12°C", "conditions": "Cloudy"})
-    else:
-        return json.dumps({"error": "City Not Found", "code": 404})
+# get_current_weather is shared by all agents; see tools.py for its TTL cache policy (per normalized city)
 
 
 # --- 2. SQL SERVER CONNECTION & AGENT SETUP ---
@@ -54,12 +72,48 @@ CONNECTION_URL = URL.create(
     database=DB_NAME,
     query={"driver": "ODBC Driver 17 for SQL Server"}  # Ensure this driver name is correct!
 )
+# Optional readable secondary for the read-only text-to-SQL queries (e.g. read_only_url(CONNECTION_URL)
+# for an availability-group listener); None keeps everything on the primary.
+READ_REPLICA_URL = None
+
+def build_sql_engine(synthesize_response: bool, use_sql_cache: bool = USE_SQL_CACHE):
+    """
+    Builds the text-to-SQL engine for TABLE_LIST.
+    With synthesize_response=False the engine returns the executed SQL and raw rows
+    (metadata "sql_query", "result", "col_keys") instead of an LLM-written summary.
+    """
+    if USE_SCHEMA_RETRIEVAL:
+        # Only the top-k relevant tables (+ FK neighbours) go into each text-to-SQL prompt
+        sql_engine = SchemaRetrievalSQLQueryEngine(
+            sql_database,
+            TABLE_LIST,
+            llm=Settings.llm,
+            synthesize_response=synthesize_response,
+            verbose=True
+        )
+    else:
+        sql_engine = NLSQLTableQueryEngine(
+            sql_database=sql_database,
+            tables=TABLE_LIST, # <--- Pass the original list directly
+            llm=Settings.llm,
+            synthesize_response=synthesize_response,
+            verbose=True
+        )
+
+    # Repeat questions (and questions differing only in a literal) reuse validated SQL
+    # and skip the text-to-SQL LLM call; cache entries are scoped to the current schema.
+    if use_sql_cache:
+        sql_engine = CachedSQLQueryEngine(sql_engine, sql_database, TABLE_LIST)
+    return sql_engine
+
 
 try:
     print("Starting SQL Server Agent Setup...")
 
-    # Create the engine object (will attempt connection immediately)
-    engine = create_engine(CONNECTION_URL)
+    # Pooled engines (see db_engines.py for pool size, pre-ping, recycle); a few connections are
+    # opened now so the first questions do not pay the login handshake
+    engines = EngineRouter(CONNECTION_URL, READ_REPLICA_URL, name="odbc")
+    engine = engines.primary
 
     # 2a. Wrap the SQL Engine with LlamaIndex's SQLDatabase abstraction
     # NOTE: LlamaIndex automatically reflects (reads) the schema of tables in the database.
@@ -67,18 +121,16 @@ try:
     # List of tables already included in the database wrapper:
     TABLE_LIST = ['employee_info', 'Product_Catalog', 'Sales_Data'] # Define this list globally
 
-    # Then, create the SQLDatabase object:
-    sql_database = SQLDatabase(engine, include_tables=TABLE_LIST)
+    # Then, create the SQLDatabase object. The reflected schema is restored from a local snapshot
+    # when one catalog query (max modify_date in sys.objects) shows the tables are unchanged.
+    sql_database = load_sql_database(engines.read, TABLE_LIST)
+    if USE_SQL_GUARD:
+        # Generated SQL runs bounded: an unfiltered SELECT * on Sales_Data cannot pull the whole table
+        sql_database = BoundedSQLDatabase(sql_database)
+
+    # And use the list directly when creating the query engine (see build_sql_engine above):
+    query_engine_sql = build_sql_engine(synthesize_response=(ORCHESTRATION_MODE == "synthesize"))
 
-    # And use the list directly when creating the query engine:
-    query_engine_sql = NLSQLTableQueryEngine(
-        sql_database=sql_database,
-        tables=TABLE_LIST, # <--- Pass the original list directly
-        llm=Settings.llm,
-        synthesize_response=True,
-        verbose=True
-    )
-    
     print("✅ SQL Query Engine successfully connected to server and ready.")
 
 except Exception as e:
@@ -89,10 +141,23 @@ except Exception as e:
 # --- 3. AGENT CONFIGURATION & CHAT CREATION ---
 rag_persona = "You are a highly professional Corporate Information Assistant. You will translate user requests into SQL queries and provide only data-driven answers. Maintain a formal, concise tone."
 
-config = types.GenerateContentConfig(
-    system_instruction=rag_persona,
-    tools=[get_current_weather],
-)
+# Tool calls are run by the executor (parallel, per-tool timeouts); automatic function calling is off
+tool_executor = ToolExecutor([get_current_weather])
+config = tool_executor.config(system_instruction=rag_persona)
+
+# The persona + tool declarations are the same on every request: once they reach the model's minimum
+# cacheable size they are sent as a cached-content handle instead of being re-sent each turn.
+context_cache = ContextCacheManager(GeminiCacheBackend(client)) if USE_CONTEXT_CACHE else None
+
+
+def turn_config() -> types.GenerateContentConfig:
+    return context_cache.config_for("gemini-2.5-flash", config) if context_cache is not None else config
+
+
+def send(chat_session, message):
+    """One chat turn, including tool round trips, with the (possibly cached) static prefix."""
+    return tool_executor.send_message(chat_session, message, config=turn_config(), site="new_ultimate_agent_odbc")
+
 
 chat = client.chats.create(
     model="gemini-2.5-flash",
@@ -100,23 +165,51 @@ chat = client.chats.create(
 )
 
 
+# --- 3b. OPTIONAL SEMANTIC ANSWER CACHE ---
+# Cached answers are dropped whenever a table used by the SQL engine changes shape
+answer_cache = SemanticCache(
+    Settings.embed_model.get_query_embedding,
+    fingerprint_fn=lambda: schema_fingerprint(sql_database, TABLE_LIST) if query_engine_sql is not None else "",
+) if USE_SEMANTIC_CACHE else None
+
+
+# --- 3c. LOCAL QUERY ROUTER ---
+router = QueryRouter(Settings.embed_model, routes=[ROUTE_SQL, ROUTE_TOOL, ROUTE_NONE]) if USE_QUERY_ROUTER else None
+
+
 # --- 4. THE ULTIMATE AGENT EXECUTION FUNCTION ---
-def run_ultimate_query(prompt: str):
+def answer_with_sql(prompt: str, mode: str = ORCHESTRATION_MODE, sql_engine=None, chat_session=None):
+    """
+    Retrieval + generation for one question, without any answer caching.
+    Returns:
+        (answer, retrieval_ok)
+    """
+    sql_engine = sql_engine or query_engine_sql
+    chat_session = chat_session or chat
+    retrieval_ok = True
+
     # 1. ORCHESTRATION LOGIC: Check if the SQL engine was successfully created
-    if query_engine_sql is not None:
+    if sql_engine is not None:
         # A. SQL Retrieval is available: Query the database
         print("\n(Agent attempting SQL query via LlamaIndex.)")
         try:
-            # LlamaIndex generates, executes, and returns the NL response from DB data
-            rag_response = query_engine_sql.query(prompt)
-            rag_context = rag_response.response.strip()
+            # LlamaIndex generates and executes the SQL. In single-pass mode the rows themselves
+            # become the context; otherwise LlamaIndex's NL summary of them does.
+            with metrics.span("sql", "new_ultimate_agent_odbc"):
+                rag_response = sql_engine.query(prompt)
+            if mode == "single_pass" and "result" in (rag_response.metadata or {}):
+                rag_context = sql_rows_context(rag_response.metadata)
+            else:
+                rag_context = rag_response.response.strip()
         except Exception as e:
             # Catch errors during query generation/execution
             rag_context = f"SQL Query failed: Could not process request. Error: {e.__class__.__name__}"
+            retrieval_ok = False
             print(f"(SQL Query Failed inside LlamaIndex: {rag_context})")
     else:
         # B. SQL Retrieval is NOT available (initialization failed)
         rag_context = "SQL DATA UNAVAILABLE. Cannot access the database."
+        retrieval_ok = False
         print(f"(Agent skipping SQL: Engine not initialized.)")
 
     # 2. GENERATION STEP: Send the prompt + context to the Gemini Chat
@@ -125,8 +218,55 @@ def run_ultimate_query(prompt: str):
         f"Based ONLY on the DATA CONTEXT and your available tools, answer the user's question: {prompt}"
     )
 
-    response = chat.send_message(final_prompt)
-    return response.text.strip()
+    response = send(chat_session, final_prompt)
+    return response.text.strip(), retrieval_ok
+
+
+def run_ultimate_query(prompt: str):
+    # 0. CACHE CHECK: A near-identical question answered against the same schema is reused as-is
+    if answer_cache is not None:
+        hit = answer_cache.lookup(prompt)
+        if hit is not None:
+            print(f"(Semantic cache hit: similarity {hit.similarity:.3f}, saved ~{hit.saved_latency_s:.2f}s.)")
+            return hit.answer
+
+    # 1. ROUTING: questions that need no database lookup go straight to the chat (tools stay available)
+    if router is not None and ROUTE_SQL not in router.route(prompt).routes:
+        response = send(chat, prompt)
+        return response.text.strip()
+    start = time.perf_counter()
+
+    answer, retrieval_ok = answer_with_sql(prompt)
+    # Answers built on failed/unavailable retrieval are never cached
+    if answer_cache is not None and retrieval_ok:
+        answer_cache.store(prompt, answer, time.perf_counter() - start)
+    return answer
+
+
+def compare_orchestration_modes(questions: list[str], repeats: int = 3) -> dict:
+    """
+    End-to-end latency of "synthesize" vs "single_pass" on the same questions.
+    Caches are bypassed and each mode gets a fresh chat so history size does not skew the timings.
+    """
+    results = {}
+    for mode in ("synthesize", "single_pass"):
+        sql_engine = build_sql_engine(synthesize_response=(mode == "synthesize"), use_sql_cache=False)
+        timings = []
+        for _ in range(repeats):
+            session = client.chats.create(model="gemini-2.5-flash", config=config)
+            for question in questions:
+                start = time.perf_counter()
+                answer_with_sql(question, mode=mode, sql_engine=sql_engine, chat_session=session)
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[mode] = {
+            "mean_s": sum(timings) / len(timings),
+            "p50_s": timings[len(timings) // 2],
+            "max_s": timings[-1],
+        }
+    for mode, stats in results.items():
+        print(f"  {mode:<12} mean {stats['mean_s']:.2f}s  p50 {stats['p50_s']:.2f}s  max {stats['max_s']:.2f}s")
+    return results
 
 
 # --- TEST QUERIES ---
@@ -139,11 +279,32 @@ print(f"\nQUERY 1 (SQL Agent Test):\nUser: {query_sql}\nAgent: {response_sql}")
 
 # TEST 2: Function Calling Question (Uses get_current_weather tool)
 query_tool = "What are the current weather conditions in Boston?"
-response_tool = chat.send_message(query_tool)
-print(f"\nQUERY 2 (Tool Test):\nUser: {query_tool}\nAgent: {response_tool.text}")
+response_tool = run_ultimate_query(query_tool)  # routed to the tool: no NL-to-SQL pass
+print(f"\nQUERY 2 (Tool Test):\nUser: {query_tool}\nAgent: {response_tool}")
+
+# TEST 3 (optional): End-to-end latency of the two orchestration modes
+if RUN_LATENCY_COMPARISON and query_engine_sql is not None:
+    print("\n--- ORCHESTRATION LATENCY COMPARISON ---")
+    compare_orchestration_modes([query_sql])
 
 # --- FINAL CLEANUP (CRITICAL for PyCharm/IDE) ---
+if isinstance(query_engine_sql, CachedSQLQueryEngine):
+    print(f"\nSQL cache stats: {query_engine_sql.cache.stats}")
+if query_engine_sql is not None and isinstance(sql_database, BoundedSQLDatabase):
+    print(f"\nSQL guard stats: {sql_database.stats}")
+if router is not None:
+    print(f"\nRouter decisions: {router.counts}")
+if answer_cache is not None:
+    answer_cache.export_stats()
+    print(f"\nSemantic cache stats: {answer_cache.stats()}")
+
+if context_cache is not None:
+    print(f"\nContext cache stats: {context_cache.stats}")
+    context_cache.close()
+metrics.export()
+print(f"\nLatency metrics written to {metrics.json_path} and {metrics.prom_path}")
 print("\nPerforming final database cleanup...")
-if engine:
-    engine.dispose()
+if engines:
+    print(f"DB pool stats: {engines.stats()}")
+    engines.dispose()
 print("Process finished and resources released.")
\ No newline at end of file
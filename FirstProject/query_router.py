@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import numpy as np
+
+# --- Configuration ---
+ROUTE_SQL = "sql"      # text-to-SQL over the company database
+ROUTE_RAG = "rag"      # vector search over the policy documents
+ROUTE_TOOL = "tool"    # a function tool (e.g. get_current_weather); the chat turn calls it itself
+ROUTE_NONE = "none"    # general knowledge / small talk: answer directly
+RETRIEVAL_ROUTES = (ROUTE_SQL, ROUTE_RAG)
+
+KEYWORD_WEIGHT = 0.08       # added to a route's similarity score per matching rule (max 2 rules)
+TOP_EXEMPLARS = 2           # a route's similarity is the mean of its best-matching exemplars
+SOFTMAX_TEMPERATURE = 0.05
+MIN_CONFIDENCE = 0.45       # below this (and with no keyword evidence) every retrieval route runs
+ROUTER_LOG_PATH = "./cache/router_decisions.jsonl"   # pass as log_path to record decisions (off by default)
+ROUTER_LOG_MAX_BYTES = 5 * 1024 ** 2    # the log is rotated to <path>.1 beyond this, so at most two files exist
+EXEMPLAR_EMBED_WORKERS = 8
+
+DEFAULT_EXEMPLARS = {
+    ROUTE_SQL: [
+        "Show me the names of all employees in the Sales department.",
+        "Who has the highest salary?",
+        "What is the average salary per department?",
+        "How many employees work in Marketing?",
+        "Which products had the most sales last quarter?",
+        "List the product catalog with prices.",
+        "What were total sales by region?",
+    ],
+    ROUTE_RAG: [
+        "What is the policy regarding remote work?",
+        "How much is the mileage reimbursement rate?",
+        "What are the core working hours?",
+        "Do travel expenses need pre-approval?",
+        "Where do I submit expense receipts?",
+        "What does the company handbook say about flexible start times?",
+    ],
+    ROUTE_TOOL: [
+        "What are the current weather conditions in Boston?",
+        "Is it raining in Seattle right now?",
+        "What's the temperature in London today?",
+        "Weather forecast for Chicago",
+    ],
+    ROUTE_NONE: [
+        "Hello, how are you?",
+        "Thanks, that's all.",
+        "What is the capital of France?",
+        "Explain what a SQL join is.",
+        "Write a short haiku about autumn.",
+        "What is 15 percent of 80?",
+    ],
+}
+
+DEFAULT_KEYWORD_RULES = {
+    ROUTE_SQL: [r"\bemployees?\b", r"\b(salar(y|ies)|earns?|paid)\b", r"\bdepartments?\b", r"\bproducts?\b",
+                r"\bsales\b", r"\b(how many|average|total|highest|lowest|top \d+)\b"],
+    ROUTE_RAG: [r"\bpolic(y|ies)\b", r"\breimburse", r"\bremote work\b", r"\bhandbook\b",
+                r"\b(work|core) hours\b", r"\bexpenses?\b", r"\bpre-?approval\b"],
+    ROUTE_TOOL: [r"\bweather\b", r"\btemperature\b", r"\bforecast\b", r"\b(rain|raining|snow|sunny)\b"],
+    ROUTE_NONE: [r"^\s*(hi|hello|hey|thanks|thank you)\b"],
+}
+
+
+@dataclass
+class RouteDecision:
+    routes: list[str]                   # what to run; several retrieval routes run in parallel
+    confidence: float                   # softmax probability of the top-scoring route
+    scores: dict[str, float]
+    keyword_hits: dict[str, list[str]] = field(default_factory=dict)
+    fallback: bool = False              # True when confidence was too low and all retrieval routes run
+    elapsed_ms: float = 0.0
+
+    @property
+    def needs_retrieval(self) -> bool:
+        return any(r in RETRIEVAL_ROUTES for r in self.routes)
+
+
+# --- LOCAL ROUTER (keyword rules + exemplar similarity, no LLM call) ---
+class QueryRouter:
+    """
+    Decides which retrieval a prompt needs before any of it runs.
+    Keyword rules give cheap, precise evidence; cosine similarity to labelled exemplar questions
+    covers paraphrases. Only routes the agent actually has are considered.
+    """
+
+    def __init__(self, embed_model=None, routes: list[str] = None, exemplars: dict[str, list[str]] = None,
+                 keyword_rules: dict[str, list[str]] = None, min_confidence: float = MIN_CONFIDENCE,
+                 log_path: str | None = None, log_max_bytes: int = ROUTER_LOG_MAX_BYTES):
+        exemplars = exemplars or DEFAULT_EXEMPLARS
+        keyword_rules = keyword_rules or DEFAULT_KEYWORD_RULES
+        self.routes = list(routes or exemplars.keys())
+        self.embed_model = embed_model
+        self.min_confidence = min_confidence
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self._log_lock = threading.Lock()
+        self.rules = {r: [re.compile(p, re.IGNORECASE) for p in keyword_rules.get(r, [])] for r in self.routes}
+        self.counts = {r: 0 for r in self.routes}
+        self.counts["fallback"] = 0
+
+        # Exemplars are embedded once (and cached on disk by CachedEmbedding across runs).
+        # They are questions compared with questions, so both sides use the query embedding:
+        # models with task types (retrieval_document vs retrieval_query) place the two in different spaces.
+        self._labels, self._matrix = [], None
+        if embed_model is not None:
+            texts = [(r, t) for r in self.routes for t in exemplars.get(r, [])]
+            try:
+                with ThreadPoolExecutor(max_workers=EXEMPLAR_EMBED_WORKERS) as pool:
+                    vectors = np.asarray(list(pool.map(embed_model.get_query_embedding, [t for _, t in texts])),
+                                         dtype=np.float32)
+            except Exception as e:
+                print(f"(Router: exemplar embedding failed ({e.__class__.__name__}), using keyword rules only.)")
+            else:
+                self._matrix = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                self._labels = np.array([r for r, _ in texts])
+
+    def _keyword_hits(self, prompt: str) -> dict[str, list[str]]:
+        hits = {}
+        for route, patterns in self.rules.items():
+            matched = [m.group(0).lower() for m in (p.search(prompt) for p in patterns) if m]
+            if matched:
+                hits[route] = matched
+        return hits
+
+    def _similarities(self, prompt: str) -> dict[str, float]:
+        if self._matrix is None:
+            return {r: 0.0 for r in self.routes}
+        try:
+            query = np.asarray(self.embed_model.get_query_embedding(prompt), dtype=np.float32)
+        except Exception as e:
+            print(f"(Router: embedding failed ({e.__class__.__name__}), using keyword rules only.)")
+            return {r: 0.0 for r in self.routes}
+        sims = self._matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        scores = {}
+        for route in self.routes:
+            route_sims = np.sort(sims[self._labels == route])[::-1][:TOP_EXEMPLARS]
+            scores[route] = float(route_sims.mean()) if len(route_sims) else 0.0
+        return scores
+
+    def route(self, prompt: str) -> RouteDecision:
+        start = time.perf_counter()
+        hits = self._keyword_hits(prompt)
+        scores = self._similarities(prompt)
+        for route, matched in hits.items():
+            scores[route] += KEYWORD_WEIGHT * min(len(matched), 2)
+
+        ordered = sorted(self.routes, key=lambda r: scores[r], reverse=True)
+        logits = np.array([scores[r] for r in ordered]) / SOFTMAX_TEMPERATURE
+        probs = np.exp(logits - logits.max())
+        confidence = float(probs[0] / probs.sum())
+        best = ordered[0]
+
+        # Every actionable route with keyword evidence runs alongside the best one ("salary ... and weather")
+        routes = [best] + [r for r in ordered[1:] if r in hits and r != ROUTE_NONE]
+        if len(routes) > 1 and ROUTE_NONE in routes:
+            routes.remove(ROUTE_NONE)
+        fallback = False
+        if confidence < self.min_confidence and not hits:
+            # Unsure and nothing to go on: do the work rather than risk an ungrounded answer
+            routes = [r for r in self.routes if r in RETRIEVAL_ROUTES] or routes
+            fallback = True
+
+        decision = RouteDecision(routes, confidence, scores, hits, fallback,
+                                 (time.perf_counter() - start) * 1000)
+        self._log(prompt, decision)
+        return decision
+
+    def _log(self, prompt: str, decision: RouteDecision) -> None:
+        for route in decision.routes:
+            self.counts[route] += 1
+        self.counts["fallback"] += decision.fallback
+        keywords = ", ".join(w for words in decision.keyword_hits.values() for w in words) or "-"
+        print(f"(Router: {'+'.join(decision.routes)} | confidence {decision.confidence:.2f}"
+              f"{' (low, fallback)' if decision.fallback else ''} | keywords: {keywords} | {decision.elapsed_ms:.1f} ms)")
+        if self.log_path:
+            self._append_log(prompt, decision)
+
+    def _append_log(self, prompt: str, decision: RouteDecision) -> None:
+        # Prompts can contain personal data: only a hash is kept, enough to group repeated questions
+        record = json.dumps({
+            "ts": time.time(), "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16],
+            "routes": decision.routes, "confidence": round(decision.confidence, 4),
+            "scores": {r: round(s, 4) for r, s in decision.scores.items()},
+            "keywords": decision.keyword_hits, "fallback": decision.fallback,
+        }) + "\n"
+        with self._log_lock:
+            if os.path.dirname(self.log_path):
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) + len(record) > self.log_max_bytes:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(record)
+
+def gather_contexts(retrievers: dict, routes: list[str]) -> dict[str, str]:
+    """
+    Runs the retrievers for the routed retrieval routes concurrently.
+    Args:
+        retrievers: route -> callable returning the context string for that route.
+    Returns:
+        route -> context, in `routes` order.
+    """
+    selected = [r for r in routes if r in retrievers]
+    if len(selected) <= 1:
+        return {r: retrievers[r]() for r in selected}
+    with ThreadPoolExecutor(max_workers=len(selected)) as pool:
+        futures = {r: pool.submit(retrievers[r]) for r in selected}
+        return {r: futures[r].result() for r in selected}
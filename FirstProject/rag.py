@@ -1,54 +1,50 @@
 import os
-import chromadb
 
 # --- LlamaIndex Imports ---
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.gemini import Gemini
 from llama_index.embeddings.gemini import GeminiEmbedding
+from embedding_cache import CachedEmbedding
+from ingestion import sync_index, VECTOR_BACKEND
+from hybrid_retrieval import HybridRetriever, sync_keyword_index
 
 # --- Configuration ---
 # LlamaIndex will automatically use the GOOGLE_API_KEY environment variable.
 # We explicitly configure the models for clarity.
 Settings.llm = Gemini(model="gemini-2.5-flash") # Use Gemini for the final answer generation
-Settings.embed_model = GeminiEmbedding(model_name="models/embedding-001") # Use Gemini for vector creation
+# Embeddings are served from a local on-disk cache when the same text was embedded before
+Settings.embed_model = CachedEmbedding(GeminiEmbedding(model_name="models/embedding-001")) # Use Gemini for vector creation
 PERSIST_DIR = "./chroma_db"
 DATA_DIR = "./data"
+# The vector backend is ingestion.VECTOR_BACKEND ("chroma" by default, "mmap" for the in-process
+# mmap_vector_store), so every entry point opens the same store; switching re-embeds once from the embedding cache.
 
 print("Starting RAG Pipeline Setup...")
 
-# 1. LOAD: Read documents from the local directory
-documents = SimpleDirectoryReader(DATA_DIR).load_data()
-print(f"Loaded {len(documents)} document(s) from {DATA_DIR}.")
+# 1+2. LOAD & INDEX: Sync the persisted vector index with DATA_DIR
+# Only new or modified files are chunked and embedded; a per-file manifest in PERSIST_DIR
+# (size, mtime, content hash, chunk ids) lets unchanged runs skip embedding entirely.
+index = sync_index(DATA_DIR, PERSIST_DIR, backend=VECTOR_BACKEND)
 
-# 2. INDEX: Create or Load the Vector Store Index
-# This step chunks the documents, converts them into vectors using the embedding model, 
-# and stores them in the Chroma vector database.
-try:
-    # Attempt to load the existing index
-    db = chromadb.PersistentClient(path=PERSIST_DIR)
-    chroma_collection = db.get_or_create_collection("company_policy")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        storage_context=chroma_collection
-    )
-    print("Loaded existing vector index.")
-except Exception:
-    # If loading fails, create a new one
-    db = chromadb.PersistentClient(path=PERSIST_DIR)
-    chroma_collection = db.get_or_create_collection("company_policy")
-    index = VectorStoreIndex.from_documents(documents)
-    print("Created and persisted new vector index.")
+
+# The BM25 keyword index is updated for the chunks that sync_index added or removed
+keyword_index = sync_keyword_index(index.vector_store, PERSIST_DIR)
 
 
 # 3. QUERY: Ask a question that requires knowledge from the policy.txt
-query_engine = index.as_query_engine()
+# Hybrid retrieval: exact terms ("mileage", "$0.67") via BM25 plus vector search, fused by rank,
+# so a small top-k still finds the right chunks. Restrict by metadata before scoring with e.g.
+# retriever.with_filters(file_name="policy.txt", section="TRAVEL EXPENSE", year=2025).
+retriever = HybridRetriever(index, keyword_index)
+query_engine = RetrieverQueryEngine.from_args(retriever)
 
 question = "I worked remotely for 4 days last week. Is this allowed by the company policy, and what is the specific cost per mile for travel?"
 
 print(f"\n3. User Query: {question}")
 
 # This sends the query to LlamaIndex, which performs:
-# A. Retrieval: Converts the question to a vector and finds relevant chunks.
+# A. Retrieval: Vector + keyword search over the chunks, fused and de-duplicated.
 # B. Generation: Sends the relevant chunks + the question to Gemini.
 response = query_engine.query(question)
 
@@ -58,7 +54,8 @@ print("\n--- SOURCE NODES (The proof) ---")
 
 # Access the source nodes to see which policy text was used as context
 for node in response.source_nodes:
-    print(f"File: {node.metadata.get('file_name')}, Score: {node.score:.2f}")
+    print(f"File: {node.metadata.get('file_name')}, Section: {node.metadata.get('section')}, "
+          f"Fused score: {node.score:.4f}")
     # Print the chunk text that was retrieved
     print(f"Context Snippet: {node.text.strip()[:100]}...\n") 
 print("-----------------------------------------------------")
\ No newline at end of file
@@ -0,0 +1,234 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import hashlib
+from collections import deque
+from html import escape
+from pydantic import ValidationError
+from google.genai import types
+from embedding_pipeline import AIMDController, is_throttle_error, truncate_torn_tail
+from review_schema import ExtractedReview
+
+# --- Configuration ---
+MODEL_NAME = "gemini-2.5-flash"
+REVIEWS_PER_REQUEST = 20          # reviews packed into one generate_content call
+MAX_REVIEW_CHARS = 4000           # longer reviews are truncated before packing
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+MAX_RETRIES = 6                   # per request, on 429/503
+MAX_ITEM_ATTEMPTS = 3             # a review missing/malformed this often is written to the errors file
+PROGRESS_INTERVAL_S = 10.0
+
+EXTRACTION_INSTRUCTION = (
+    "Analyze each user review below and extract the structured data. "
+    "Return exactly one object per <review>, with review_id set to that review's id attribute."
+)
+
+
+# --- 1. STREAMING INPUT ---
+def review_id_for(text: str) -> str:
+    """Content-derived id for rows without one, so reruns address the same review."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def read_reviews(path: str, text_field: str = "text", id_field: str = "id"):
+    """
+    Yields (review_id, text) from a JSONL or CSV file without loading it into memory.
+    Rows without an id get a content hash; rows without text are skipped.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if path.lower().endswith(".csv") else (json.loads(l) for l in f if l.strip())
+        for row in rows:
+            text = (row.get(text_field) or "").strip()
+            if text:
+                yield str(row.get(id_field) or review_id_for(text)), text
+
+
+def pack_prompt(reviews: list[tuple[str, str]]) -> str:
+    body = "\n".join(f'<review id="{escape(rid)}">\n{escape(text[:MAX_REVIEW_CHARS])}\n</review>' for rid, text in reviews)
+    return f"{EXTRACTION_INSTRUCTION}\n\n{body}"
+
+
+def completed_ids(path: str) -> set[str]:
+    """Review ids already in the output file (the output doubles as the resume checkpoint)."""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["review_id"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue  # a damaged line only loses its own review, which is extracted again
+    except FileNotFoundError:
+        pass
+    return done
+
+
+# --- 2. BATCH EXTRACTOR ---
+class BatchReviewExtractor:
+    """
+    Bulk ProductReview extraction: reviews are streamed from disk, packed REVIEWS_PER_REQUEST
+    to a request with a list[ExtractedReview] schema, and sent concurrently under an AIMD limit.
+    Each returned item is validated on its own; reviews whose item is missing, duplicated or
+    malformed are re-queued as single-review requests. Results are appended to a JSONL file as
+    they arrive, and a rerun skips every review id already in it.
+    """
+
+    def __init__(self, client, output_path: str, model: str = MODEL_NAME,
+                 reviews_per_request: int = REVIEWS_PER_REQUEST,
+                 initial_concurrency: int = INITIAL_CONCURRENCY, max_concurrency: int = MAX_CONCURRENCY):
+        self.client = client
+        self.output_path = output_path
+        self.errors_path = os.path.splitext(output_path)[0] + ".errors.jsonl"
+        self.model = model
+        self.reviews_per_request = reviews_per_request
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[ExtractedReview],
+        )
+        self.stats = {"reviews": 0, "skipped": 0, "requests": 0, "requeued": 0, "failed": 0, "tokens": 0}
+
+    async def _generate(self, controller: AIMDController, prompt: str):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await self.client.aio.models.generate_content(
+                    model=self.model, contents=prompt, config=self.config)
+                controller.on_success()
+                return response
+            except Exception as e:
+                if not is_throttle_error(e) or attempt == MAX_RETRIES:
+                    raise
+                delay = controller.on_throttle()
+                print(f"(Review batch: throttled, concurrency -> {int(controller.limit)}, retrying in {delay:.1f}s.)")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _validate(response, expected: set[str]) -> dict[str, ExtractedReview]:
+        """Valid items keyed by review id; anything unparseable, unknown or repeated is dropped."""
+        try:
+            items = json.loads(response.text or "[]")
+        except json.JSONDecodeError:
+            return {}
+        valid = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                review = ExtractedReview.model_validate(item)
+            except ValidationError:
+                continue
+            if review.review_id in expected and review.review_id not in valid:
+                valid[review.review_id] = review
+        return valid
+
+    async def run(self, source) -> dict:
+        """
+        Extracts every review of `source` (a JSONL/CSV path or an iterable of (review_id, text)).
+        Returns:
+            The stats dict, including reviews/s and tokens/review for this run.
+        """
+        reviews = read_reviews(source) if isinstance(source, str) else iter(source)
+        # Drop a torn last line from a crash before reading the checkpoint and appending after it
+        truncate_torn_tail(self.output_path)
+        truncate_torn_tail(self.errors_path)
+        done = completed_ids(self.output_path)
+        if done:
+            print(f"(Review batch: resuming, {len(done)} review(s) already extracted.)")
+
+        controller = AIMDController(self.initial_concurrency, maximum=self.max_concurrency)
+        retry_queue: deque[tuple[str, str, int]] = deque()   # (review_id, text, attempts so far)
+        attempts: dict[str, int] = {}
+        tasks: set[asyncio.Task] = set()
+        failures: list[BaseException] = []
+        start = time.perf_counter()
+        out = open(self.output_path, "a", encoding="utf-8")
+        errors = open(self.errors_path, "a", encoding="utf-8")
+
+        async def extract(batch: list[tuple[str, str]]) -> None:
+            try:
+                response = await self._generate(controller, pack_prompt(batch))
+            finally:
+                await controller.release()
+            self.stats["requests"] += 1
+            usage = response.usage_metadata
+            self.stats["tokens"] += (usage.total_token_count or 0) if usage else 0
+            valid = self._validate(response, {rid for rid, _ in batch})
+            # One write per request; the flush makes the results durable for resume before the next batch
+            out.writelines(json.dumps(v.model_dump()) + "\n" for v in valid.values())
+            out.flush()
+            self.stats["reviews"] += len(valid)
+            for rid, text in batch:
+                if rid in valid:
+                    continue
+                attempts[rid] = attempts.get(rid, 0) + 1
+                if attempts[rid] < MAX_ITEM_ATTEMPTS:
+                    retry_queue.append((rid, text, attempts[rid]))
+                    self.stats["requeued"] += 1
+                else:
+                    errors.write(json.dumps({"review_id": rid, "error": "no valid extraction"}) + "\n")
+                    self.stats["failed"] += 1
+            errors.flush()
+
+        def on_done(task: asyncio.Task) -> None:
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failures.append(task.exception())
+
+        async def dispatch(batch: list[tuple[str, str]]) -> None:
+            if failures:
+                raise failures[0]
+            await controller.acquire()
+            task = asyncio.create_task(extract(batch))
+            tasks.add(task)
+            task.add_done_callback(on_done)
+
+        async def dispatch_retries() -> None:
+            # Re-queued reviews go alone, so one bad item cannot sink a whole pack again
+            while retry_queue:
+                rid, text, _ = retry_queue.popleft()
+                await dispatch([(rid, text)])
+
+        async def reporter() -> None:
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL_S)
+                print(f"  ... {self.report(time.perf_counter() - start)}")
+
+        reporter_task = asyncio.create_task(reporter())
+        try:
+            batch = []
+            for rid, text in reviews:
+                if rid in done:
+                    self.stats["skipped"] += 1
+                    continue
+                done.add(rid)    # also drops duplicate ids within the input
+                batch.append((rid, text))
+                if len(batch) == self.reviews_per_request:
+                    await dispatch(batch)
+                    batch = []
+                await dispatch_retries()
+            if batch:
+                await dispatch(batch)
+            while tasks or retry_queue:
+                await dispatch_retries()
+                if tasks:
+                    await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+                if failures:
+                    raise failures[0]
+        finally:
+            reporter_task.cancel()
+            for task in tasks:
+                task.cancel()
+            out.close()
+            errors.close()
+
+        print(f"Review batch finished: {self.report(time.perf_counter() - start)}")
+        return self.stats
+
+    def report(self, elapsed: float) -> str:
+        self.stats["reviews_per_s"] = self.stats["reviews"] / max(elapsed, 1e-9)
+        self.stats["tokens_per_review"] = self.stats["tokens"] / max(self.stats["reviews"], 1)
+        return (f"{self.stats['reviews']} review(s) in {self.stats['requests']} request(s), "
+                f"{self.stats['reviews_per_s']:.1f} reviews/s, {self.stats['tokens_per_review']:.0f} tokens/review, "
+                f"{self.stats['requeued']} requeued, {self.stats['failed']} failed")
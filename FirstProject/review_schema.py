@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+
+
+class ProductReview(BaseModel):
+    """Structured data model for a product review summary"""
+    product_name: str = Field(description="The formal, full name of the product.")
+    sentiment_score: int = Field(description="The sentiment rating from 1 (bad) to 10 (excellent).")
+    key_pros: list[str] = Field(description="A list of 2-3 main positive points about the product.")
+    key_con: list[str] = Field(description="A list of 2-3 main negative points about the product.")
+
+
+class ExtractedReview(ProductReview):
+    """ProductReview tagged with the id of the review it was extracted from (packed batch requests)."""
+    review_id: str = Field(description="The id attribute of the <review> this summary belongs to, copied exactly.")
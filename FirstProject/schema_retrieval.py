@@ -0,0 +1,175 @@
+import re
+import math
+from collections import Counter, OrderedDict
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.query_engine import NLSQLTableQueryEngine
+from sqlalchemy import select
+from token_estimator import estimate_tokens
+
+# --- Configuration ---
+TOP_K_TABLES = 3
+SAMPLE_VALUES = 3          # distinct sample values per column added to each table description
+RRF_K = 60                 # reciprocal-rank-fusion constant
+MAX_CACHED_ENGINES = 32    # NLSQLTableQueryEngine instances kept per distinct table selection
+
+
+# --- 1. TABLE DESCRIPTIONS ---
+def identifier_terms(text: str) -> list[str]:
+    """Splits identifiers and prose into lowercase terms: 'Sales_Data' / 'productId' -> sale, data, product, id."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    terms = []
+    for word in re.findall(r"[A-Za-z0-9]+", text.lower()):
+        # Crude plural folding so 'sales'/'sale' and 'products'/'product' meet
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def sample_values(sql_database, table_name: str, limit: int = SAMPLE_VALUES) -> dict[str, list]:
+    """A few example values per column, from the schema snapshot when available."""
+    if hasattr(sql_database, "get_sample_rows"):
+        rows = sql_database.get_sample_rows(table_name)
+    else:
+        table = sql_database.metadata_obj.tables[table_name]
+        with sql_database.engine.connect() as connection:
+            rows = connection.execute(select(table).limit(limit)).fetchall()
+    columns = [c.name for c in sql_database.metadata_obj.tables[table_name].columns]
+    values = {c: [] for c in columns}
+    for row in rows:
+        for column, value in zip(columns, row):
+            if value is not None and value not in values[column] and len(values[column]) < limit:
+                values[column].append(value)
+    return values
+
+
+def table_description(sql_database, table_name: str) -> str:
+    """Schema text used for retrieval: the prompt description plus sample values per column."""
+    samples = sample_values(sql_database, table_name)
+    sample_text = "; ".join(f"{c}: {', '.join(map(str, v))}" for c, v in samples.items() if v)
+    description = sql_database.get_single_table_info(table_name)
+    return f"{description}\nSample values: {sample_text}" if sample_text else description
+
+
+def fk_neighbours(sql_database, table_name: str) -> set[str]:
+    """Tables this table references, and tables referencing it."""
+    tables = sql_database.metadata_obj.tables
+    neighbours = {fk.column.table.name for fk in tables[table_name].foreign_keys}
+    for other_name, other in tables.items():
+        if any(fk.column.table.name == table_name for fk in other.foreign_keys):
+            neighbours.add(other_name)
+    neighbours.discard(table_name)
+    return neighbours
+
+
+# --- 2. HYBRID (VECTOR + KEYWORD) TABLE RETRIEVER ---
+class TableSchemaRetriever:
+    """
+    Picks the tables a question needs: dense similarity over table descriptions fused with
+    BM25 over identifier terms (reciprocal rank fusion), then adds FK-linked neighbours so joins
+    still have both sides in the prompt.
+    """
+
+    def __init__(self, sql_database, tables: list[str], embed_model=None, top_k: int = TOP_K_TABLES,
+                 include_fk_neighbours: bool = True):
+        self.sql_database = sql_database
+        self.tables = list(tables)
+        self.embed_model = embed_model or Settings.embed_model
+        self.top_k = top_k
+        self.include_fk_neighbours = include_fk_neighbours
+
+        self.descriptions = {t: table_description(sql_database, t) for t in self.tables}
+        self.prompt_info = {t: sql_database.get_single_table_info(t) for t in self.tables}
+        self.neighbours = {t: fk_neighbours(sql_database, t) & set(self.tables) for t in self.tables}
+
+        vectors = np.asarray(self.embed_model.get_text_embedding_batch(
+            [self.descriptions[t] for t in self.tables]), dtype=np.float32)
+        self._matrix = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        # Table names and column names are weighted up by repeating their terms
+        self._doc_terms = []
+        for t in self.tables:
+            columns = " ".join(c.name for c in sql_database.metadata_obj.tables[t].columns)
+            terms = identifier_terms(t) * 3 + identifier_terms(columns) * 2 + identifier_terms(self.descriptions[t])
+            self._doc_terms.append(Counter(terms))
+        self._avg_len = sum(sum(c.values()) for c in self._doc_terms) / max(1, len(self._doc_terms))
+        doc_freq = Counter(term for counts in self._doc_terms for term in counts)
+        n = len(self.tables)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def _bm25(self, question: str, k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+        query_terms = set(identifier_terms(question))
+        scores = np.zeros(len(self.tables), dtype=np.float32)
+        for i, counts in enumerate(self._doc_terms):
+            length = sum(counts.values())
+            for term in query_terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    scores[i] += self._idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / self._avg_len))
+        return scores
+
+    def select(self, question: str) -> list[str]:
+        """Returns the top-k tables for the question plus their FK neighbours, in schema order."""
+        query_vector = np.asarray(self.embed_model.get_query_embedding(question), dtype=np.float32)
+        dense = self._matrix @ (query_vector / max(np.linalg.norm(query_vector), 1e-12))
+        keyword = self._bm25(question)
+
+        fused = np.zeros(len(self.tables))
+        for scores in (dense, keyword):
+            for rank, idx in enumerate(np.argsort(-scores)):
+                if scores is keyword and scores[idx] <= 0:
+                    break  # tables without a single matching term get no keyword vote
+                fused[idx] += 1.0 / (RRF_K + rank + 1)
+
+        chosen = {self.tables[i] for i in np.argsort(-fused)[:self.top_k]}
+        if self.include_fk_neighbours:
+            for table in list(chosen):
+                chosen |= self.neighbours[table]
+        return [t for t in self.tables if t in chosen]
+
+    def prompt_tokens(self, tables: list[str]) -> int:
+        return estimate_tokens("\n\n".join(self.prompt_info[t] for t in tables))
+
+
+# --- 3. DROP-IN QUERY ENGINE ---
+class SchemaRetrievalSQLQueryEngine:
+    """
+    Drop-in replacement for NLSQLTableQueryEngine(tables=TABLE_LIST) that only puts the schemas of the
+    retrieved tables into the text-to-SQL prompt. Engines are reused per distinct table selection.
+    """
+
+    def __init__(self, sql_database, tables: list[str], llm=None, top_k: int = TOP_K_TABLES,
+                 embed_model=None, **engine_kwargs):
+        self.sql_database = sql_database
+        self.llm = llm or Settings.llm
+        self.retriever = TableSchemaRetriever(sql_database, tables, embed_model=embed_model, top_k=top_k)
+        self.engine_kwargs = engine_kwargs
+        self._engines: OrderedDict[tuple, NLSQLTableQueryEngine] = OrderedDict()
+        self.full_schema_tokens = self.retriever.prompt_tokens(self.retriever.tables)
+        self.tokens_saved_total = 0
+
+    def _engine_for(self, tables: list[str]) -> NLSQLTableQueryEngine:
+        key = tuple(tables)
+        if key not in self._engines:
+            self._engines[key] = NLSQLTableQueryEngine(
+                sql_database=self.sql_database, tables=tables, llm=self.llm, **self.engine_kwargs
+            )
+            if len(self._engines) > MAX_CACHED_ENGINES:
+                self._engines.popitem(last=False)
+        self._engines.move_to_end(key)
+        return self._engines[key]
+
+    def query(self, question: str):
+        tables = self.retriever.select(question)
+        selected_tokens = self.retriever.prompt_tokens(tables)
+        saved = self.full_schema_tokens - selected_tokens
+        self.tokens_saved_total += saved
+        print(f"(Schema retrieval: {len(tables)}/{len(self.retriever.tables)} table(s) {tables}, "
+              f"~{selected_tokens} schema tokens instead of ~{self.full_schema_tokens}, saved ~{saved}.)")
+
+        response = self._engine_for(tables).query(question)
+        if response.metadata is None:
+            response.metadata = {}
+        response.metadata.update({"selected_tables": tables, "schema_tokens_saved": saved})
+        return response
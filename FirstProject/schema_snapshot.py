@@ -0,0 +1,147 @@
+import os
+import time
+import pickle
+import hashlib
+import sqlalchemy
+import llama_index.core
+from llama_index.core import SQLDatabase
+from sqlalchemy import MetaData, select, text
+
+# --- Configuration ---
+SNAPSHOT_DIR = "./cache"
+SNAPSHOT_VERSION = 2
+SAMPLE_ROWS = 3
+
+
+# --- 1. CHEAP CATALOG VERSION CHECK ---
+def catalog_version(engine, tables: list[str]) -> str | None:
+    """
+    One catalog query that changes whenever the listed tables' DDL changes.
+    Returns None for dialects without a cheap equivalent (the snapshot is then never trusted).
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as connection:
+        if dialect == "mssql":
+            # modify_date moves on ALTER TABLE / index changes; the count catches drops and creates.
+            names = ", ".join(f":t{i}" for i in range(len(tables)))
+            row = connection.execute(
+                text("SELECT COUNT(*), CONVERT(varchar(33), MAX(modify_date), 126) FROM sys.objects "
+                     f"WHERE type IN ('U', 'V') AND name IN ({names})"),
+                {f"t{i}": t for i, t in enumerate(tables)},
+            ).fetchone()
+            return f"mssql:{row[0]}:{row[1]}"
+        if dialect == "sqlite":
+            return f"sqlite:{connection.execute(text('PRAGMA schema_version')).scalar()}"
+    return None
+
+
+# --- 2. SNAPSHOT-BACKED SQLDatabase ---
+class SnapshotMetaData(MetaData):
+    """MetaData whose tables come from the snapshot; SQLDatabase.__init__'s reflect() is a no-op."""
+
+    def reflect(self, *args, **kwargs) -> None:
+        return None
+
+
+class SnapshotSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase restored from a snapshot instead of reflecting over the wire.
+    SQLDatabase.__init__ runs as usual but only lists table names: the snapshot's MetaData
+    skips reflection. Table descriptions, columns and sample rows come from the snapshot;
+    queries still run on the live engine.
+    """
+
+    def __init__(self, engine, snapshot: dict):
+        super().__init__(
+            engine,
+            schema=snapshot["schema"],
+            metadata=snapshot["metadata"],
+            include_tables=snapshot["tables"],
+            sample_rows_in_table_info=snapshot["sample_rows_in_table_info"],
+            max_string_length=snapshot["max_string_length"],
+        )
+        self.snapshot = snapshot
+
+    def get_single_table_info(self, table_name: str) -> str:
+        return self.snapshot["table_info"][table_name]
+
+    def get_table_columns(self, table_name: str) -> list:
+        return self.snapshot["columns"][table_name]
+
+    def get_sample_rows(self, table_name: str) -> list[tuple]:
+        return self.snapshot["sample_rows"].get(table_name, [])
+
+
+def build_snapshot(sql_database: SQLDatabase, tables: list[str], version: str | None,
+                   sample_rows: int = SAMPLE_ROWS) -> dict:
+    """Captures everything the text-to-SQL prompt needs from a freshly reflected SQLDatabase."""
+    metadata = SnapshotMetaData(schema=sql_database.metadata_obj.schema)
+    for table in sql_database.metadata_obj.sorted_tables:
+        table.to_metadata(metadata)
+    samples = {}
+    with sql_database.engine.connect() as connection:
+        for table_name in tables:
+            table = sql_database.metadata_obj.tables[table_name]
+            rows = connection.execute(select(table).limit(sample_rows)).fetchall()
+            samples[table_name] = [tuple(row) for row in rows]
+    return {
+        "snapshot_version": SNAPSHOT_VERSION,
+        "catalog_version": version,
+        "created_at": time.time(),
+        "schema": sql_database._schema,
+        "tables": sorted(tables),
+        "sample_rows_in_table_info": sql_database._sample_rows_in_table_info,
+        "max_string_length": sql_database._max_string_length,
+        "metadata": metadata,
+        "table_info": {t: sql_database.get_single_table_info(t) for t in tables},
+        "columns": {t: sql_database.get_table_columns(t) for t in tables},
+        "sample_rows": samples,
+    }
+
+
+# --- 3. LOAD OR RE-REFLECT ---
+def snapshot_path(engine, tables: list[str], snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    # One snapshot per server/database/table set and library versions (the pickle holds
+    # SQLAlchemy objects and SQLDatabase output); the password is not part of the key.
+    url = engine.url.render_as_string(hide_password=True)
+    versions = f"sqlalchemy={sqlalchemy.__version__}|llama-index-core={llama_index.core.__version__}"
+    key = hashlib.sha256(f"{url}|{','.join(sorted(tables))}|{versions}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"schema_snapshot_{key}.pkl")
+
+
+def load_sql_database(engine, tables: list[str], snapshot_dir: str = SNAPSHOT_DIR,
+                      sample_rows: int = SAMPLE_ROWS) -> SQLDatabase:
+    """
+    Returns a SQLDatabase for `tables`, restored from the local snapshot when a single
+    catalog query shows the schema is unchanged, and reflected (then re-snapshotted) otherwise.
+    """
+    path = snapshot_path(engine, tables, snapshot_dir)
+    version = catalog_version(engine, tables)
+
+    if version is not None:
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+            if (snapshot.get("snapshot_version") == SNAPSHOT_VERSION
+                    and snapshot["catalog_version"] == version
+                    and snapshot["tables"] == sorted(tables)):
+                sql_database = SnapshotSQLDatabase(engine, snapshot)
+                print(f"(Schema snapshot is current: skipped reflection of {len(tables)} table(s).)")
+                return sql_database
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Unreadable or incompatible snapshot (truncated file, classes that moved or changed): rebuild it
+            print(f"(Schema snapshot unusable: {e.__class__.__name__}.)")
+
+    print(f"(Reflecting schema for {len(tables)} table(s)...)")
+    sql_database = SQLDatabase(engine, include_tables=tables)
+    if version is not None:
+        snapshot = build_snapshot(sql_database, tables, version, sample_rows)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f)
+        os.replace(tmp_path, path)
+        return SnapshotSQLDatabase(engine, snapshot)
+    return sql_database
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+
+# --- Configuration ---
+DEFAULT_THRESHOLD = 0.92       # cosine similarity needed to reuse an answer
+DEFAULT_TTL_S = 3600.0
+DEFAULT_MAX_ENTRIES = 1000
+FINGERPRINT_CHECK_S = 30.0     # how often the index/schema fingerprint is re-evaluated
+STATS_PATH = "./cache/semantic_cache_stats.json"
+
+
+def fingerprint(*parts: str) -> str:
+    """Stable hash of the things an answer depends on (index manifest, table schemas, ...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation so trivial variants match exactly."""
+    text = re.sub(r"\s+", " ", prompt.strip().lower())
+    return text.rstrip("?!. ")
+
+
+@dataclass
+class CacheEntry:
+    normalized: str
+    vector: np.ndarray
+    answer: str
+    created_at: float
+    latency_s: float  # what the full retrieval + generation path cost when the answer was produced
+
+
+@dataclass
+class CacheHit:
+    answer: str
+    similarity: float
+    saved_latency_s: float
+
+
+# --- SEMANTIC ANSWER CACHE ---
+class SemanticCache:
+    """
+    In-memory, LRU-bounded cache from prompt meaning to final answer.
+    A prompt hits when its embedding is within `threshold` cosine similarity of a stored prompt
+    that has not expired and was answered against the current index/schema fingerprint.
+    """
+
+    def __init__(self, embed_fn, threshold: float = DEFAULT_THRESHOLD, ttl_s: float = DEFAULT_TTL_S,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, fingerprint_fn=None):
+        self.embed_fn = embed_fn              # str -> list[float], e.g. Settings.embed_model.get_query_embedding
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.fingerprint_fn = fingerprint_fn  # () -> str; a change invalidates every entry
+        self._fingerprint = fingerprint_fn() if fingerprint_fn else None
+        self._fingerprint_checked_at = time.monotonic()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._matrix = None                   # stacked vectors, rebuilt lazily after inserts/evictions
+        self._matrix_keys: list[str] = []
+        self._pending_vectors: dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "exact_hits": 0, "misses": 0, "evictions": 0,
+                          "expired": 0, "invalidations": 0}
+        self._saved_latency_s = 0.0
+        # Best similarity seen per lookup, bucketed by 0.01, to see where a threshold would cut
+        self._similarity_hist: dict[str, int] = {}
+
+    # --- Internal helpers ---
+    def _check_fingerprint(self) -> None:
+        if self.fingerprint_fn is None or time.monotonic() - self._fingerprint_checked_at < FINGERPRINT_CHECK_S:
+            return
+        self._fingerprint_checked_at = time.monotonic()
+        current = self.fingerprint_fn()
+        if current != self._fingerprint:
+            self._fingerprint = current
+            self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._matrix = None
+
+    def _expire(self, key: str) -> None:
+        del self._entries[key]
+        self._matrix = None
+        self._counters["expired"] += 1
+
+    def _nearest(self, vector: np.ndarray) -> tuple[str | None, float]:
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = np.stack([self._entries[k].vector for k in self._matrix_keys])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._matrix_keys[best], float(scores[best])
+
+    def _hit(self, key: str, entry: CacheEntry, similarity: float, started: float) -> CacheHit:
+        self._entries.move_to_end(key)
+        saved = max(0.0, entry.latency_s - (time.perf_counter() - started))
+        self._saved_latency_s += saved
+        self._counters["hits"] += 1
+        return CacheHit(entry.answer, similarity, saved)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    # --- Public API ---
+    def lookup(self, prompt: str) -> CacheHit | None:
+        """Returns the cached answer for a semantically equivalent prompt, or None on a miss."""
+        started = time.perf_counter()
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() - entry.created_at > self.ttl_s:
+                    self._expire(key)
+                else:
+                    self._counters["exact_hits"] += 1
+                    return self._hit(key, entry, 1.0, started)
+
+        # Embed outside the lock: this may be a network call.
+        vector = self._unit(self.embed_fn(key))
+        with self._lock:
+            self._pending_vectors[key] = vector  # reused by store() so a miss is embedded only once
+            if len(self._pending_vectors) > self.max_entries:
+                self._pending_vectors.pop(next(iter(self._pending_vectors)))
+            best_key, similarity = self._nearest(vector)
+            bucket = f"{np.floor(similarity * 100) / 100:.2f}"
+            self._similarity_hist[bucket] = self._similarity_hist.get(bucket, 0) + 1
+            if best_key is not None and similarity >= self.threshold:
+                entry = self._entries[best_key]
+                if time.time() - entry.created_at > self.ttl_s:
+                    self._expire(best_key)
+                else:
+                    return self._hit(best_key, entry, similarity, started)
+            self._counters["misses"] += 1
+            return None
+
+    def store(self, prompt: str, answer: str, latency_s: float) -> None:
+        """Caches the answer produced for `prompt`; `latency_s` is what producing it cost."""
+        key = normalize_prompt(prompt)
+        with self._lock:
+            vector = self._pending_vectors.pop(key, None)
+        if vector is None:
+            vector = self._unit(self.embed_fn(key))
+        with self._lock:
+            self._entries[key] = CacheEntry(key, vector, answer, time.time(), latency_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+                "saved_latency_s": round(self._saved_latency_s, 3),
+                "threshold": self.threshold,
+                "best_similarity_histogram": dict(sorted(self._similarity_hist.items())),
+            }
+
+    def export_stats(self, path: str = STATS_PATH) -> None:
+        """Writes stats() as JSON so hit rate vs. threshold can be tuned offline."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.stats(), f, indent=2)
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from llama_index.core.base.response.schema import Response
+from sqlalchemy import text
+from semantic_cache import fingerprint
+from sql_guard import BoundedSQLDatabase
+
+# --- Configuration ---
+SQL_CACHE_PATH = "./cache/sql_cache.sqlite3"
+
+# Words that do not change which SQL a question needs ("show me", "please", ...)
+FILLER_WORDS = {"please", "show", "me", "tell", "list", "give", "find", "is", "are", "the",
+                "a", "an", "of", "all", "can", "you", "i", "want", "to", "know"}
+TOKEN_RE = re.compile(r"[\w$%.@-]+")
+# Splits SQL into quoted string literals and everything else, so numbers inside strings are left alone
+SQL_STRING_RE = re.compile(r"('(?:[^']|'')*')")
+SQL_NUMBER_RE = re.compile(r"(?<![\w.:])(\d+(?:\.\d+)?)(?![\w.])")
+# Row-limit clauses take a literal count in T-SQL (TOP (n) / FETCH accept no bind in older drivers,
+# and LIMIT :p0 is not T-SQL at all); their numbers are never turned into parameters
+ROW_LIMIT_RE = re.compile(r"\b(?:limit|top|offset|fetch\s+(?:first|next))\s*\(?\s*$", re.IGNORECASE)
+# One aggregate row comes back whatever the filter, so a wrongly bound template would look like a hit
+AGGREGATE_SQL_RE = re.compile(r"\b(?:count|sum|avg|min|max|total|group_concat|string_agg)\s*\(|\bgroup\s+by\b",
+                              re.IGNORECASE)
+
+
+def schema_fingerprint(sql_database, tables: list[str]) -> str:
+    """Hash of the table descriptions the text-to-SQL prompt is built from."""
+    return fingerprint(*(sql_database.get_single_table_info(t) for t in sorted(tables)))
+
+
+# --- 1. QUESTION NORMALIZATION ---
+def question_tokens(question: str) -> list[str]:
+    """Case-preserving tokens of the question without filler words or punctuation."""
+    tokens = [t.strip(".") for t in TOKEN_RE.findall(question)]
+    return [t for t in tokens if t and t.lower() not in FILLER_WORDS]
+
+
+def question_key(question: str) -> str:
+    return " ".join(question_tokens(question)).lower()
+
+
+# --- 2. TEMPLATE LEARNING ---
+@dataclass
+class SQLTemplate:
+    pattern: str           # regex over the normalized question, one named group (p0, p1 ...) per parameter
+    sql: str               # SQL with :p0, :p1 ... bind parameters
+    params: list[dict]     # [{"kind": "str" | "int" | "float", "fmt": "%{}%"}] in group order
+
+
+def _value_numbers(segment: str):
+    """Numeric literals of an unquoted SQL segment, except row-limit counts (LIMIT n, TOP (n), ...)."""
+    for match in SQL_NUMBER_RE.finditer(segment):
+        if not ROW_LIMIT_RE.search(segment[:match.start()]):
+            yield match
+
+
+def _sql_literals(sql: str) -> list[tuple[str, str]]:
+    """Returns (kind, raw_value) for every string and numeric literal in the SQL, in order."""
+    literals = []
+    for i, segment in enumerate(SQL_STRING_RE.split(sql)):
+        if i % 2 == 1:
+            literals.append(("str", segment[1:-1].replace("''", "'")))
+        else:
+            for match in _value_numbers(segment):
+                number = match.group(1)
+                literals.append(("float" if "." in number else "int", number))
+    return literals
+
+
+def _replace_literal(sql: str, kind: str, value: str, bind: str) -> str:
+    """Replaces every occurrence of one literal (outside/inside quotes as appropriate) with a bind parameter."""
+    parts = SQL_STRING_RE.split(sql)
+    for i, segment in enumerate(parts):
+        if kind == "str" and i % 2 == 1 and segment[1:-1].replace("''", "'") == value:
+            parts[i] = bind
+        elif kind != "str" and i % 2 == 0:
+            spans = [m.span() for m in _value_numbers(segment) if m.group(1) == value]
+            for start, end in reversed(spans):
+                segment = segment[:start] + bind + segment[end:]
+            parts[i] = segment
+    return "".join(parts)
+
+
+def learn_template(question: str, sql: str) -> SQLTemplate | None:
+    """
+    Turns a (question, SQL) pair into a reusable shape when SQL literals also appear in the question,
+    e.g. "highest salary in Sales" + WHERE department = 'Sales' -> "highest salary in (\\S+)" + :p0.
+    A string slot matches exactly as many words as the learned value, so trailing conditions
+    ("Sales hired after 2020") never end up inside it. Aggregates are only cached exactly.
+    """
+    if AGGREGATE_SQL_RE.search(sql):
+        return None
+    normalized = " ".join(question_tokens(question))
+    pattern = re.escape(normalized)
+    template_sql = sql
+    params = []
+    for kind, raw in _sql_literals(sql):
+        core = raw.strip("%")
+        if not core:
+            continue
+        escaped = re.escape(core)
+        # Literal must appear as whole word(s) in the question to be a parameter
+        match = re.search(rf"(?<![\w]){re.escape(escaped)}(?![\w])", pattern, flags=re.IGNORECASE)
+        if match is None:
+            continue
+        bind = f"p{len(params)}"
+        words = len(match.group().split(" "))
+        # Named groups: question order and SQL literal order can differ
+        group = rf"(?P<{bind}>\d+)" if kind == "int" else rf"(?P<{bind}>\d+(?:\.\d+)?)" if kind == "float" else \
+            rf"(?P<{bind}>\S+" + r"(?:\ \S+)" * (words - 1) + ")"
+        pattern = pattern[:match.start()] + group + pattern[match.end():]
+        template_sql = _replace_literal(template_sql, kind, raw, f":{bind}")
+        params.append({"kind": kind, "fmt": raw.replace(core, "{}", 1)})
+    if not params:
+        return None
+    return SQLTemplate(f"^{pattern}$", template_sql, params)
+
+
+def _bind(template: SQLTemplate, question: str) -> dict | None:
+    match = re.match(template.pattern, " ".join(question_tokens(question)), flags=re.IGNORECASE)
+    if match is None:
+        return None
+    values = {}
+    for i, spec in enumerate(template.params):
+        captured = match.group(f"p{i}")
+        if spec["kind"] == "int":
+            value = int(captured)
+        elif spec["kind"] == "float":
+            value = float(captured)
+        else:
+            value = spec["fmt"].format(captured)
+        values[f"p{i}"] = value
+    return values
+
+
+# --- 3. PERSISTENT CACHE ---
+class SQLQueryCache:
+    """
+    SQLite-backed cache of generated SQL, scoped by a schema fingerprint:
+    exact entries map a normalized question to its SQL, templates map a question shape to
+    parameterized SQL. A schema change simply stops old entries from matching.
+    """
+
+    def __init__(self, schema_fp: str, path: str = SQL_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.schema_fp = schema_fp
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sql_exact ("
+            " schema_fp TEXT, question TEXT, sql TEXT, created REAL, hits INTEGER DEFAULT 0,"
+            " PRIMARY KEY (schema_fp, question));"
+            # v1 templates used open-ended (.+?) string slots; they are dropped rather than migrated
+            "DROP TABLE IF EXISTS sql_templates;"
+            "CREATE TABLE IF NOT EXISTS sql_templates_v2 ("
+            " schema_fp TEXT, pattern TEXT, sql TEXT, params TEXT, created REAL, hits INTEGER DEFAULT 0,"
+            " PRIMARY KEY (schema_fp, pattern));"
+        )
+        self._templates = self._load_templates()
+        self.stats = {"exact_hits": 0, "template_hits": 0, "misses": 0}
+
+    def _load_templates(self) -> list[SQLTemplate]:
+        rows = self._conn.execute(
+            "SELECT pattern, sql, params FROM sql_templates_v2 WHERE schema_fp = ? ORDER BY hits DESC",
+            (self.schema_fp,),
+        ).fetchall()
+        return [SQLTemplate(p, s, json.loads(params)) for p, s, params in rows]
+
+    def lookup(self, question: str) -> tuple[str, dict, str] | None:
+        """Returns (sql, bind_params, "exact" | "template") or None."""
+        key = question_key(question)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql FROM sql_exact WHERE schema_fp = ? AND question = ?", (self.schema_fp, key)
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE sql_exact SET hits = hits + 1 WHERE schema_fp = ? AND question = ?",
+                                   (self.schema_fp, key))
+                self._conn.commit()
+                self.stats["exact_hits"] += 1
+                return row[0], {}, "exact"
+            for template in self._templates:
+                params = _bind(template, question)
+                if params is not None:
+                    self._conn.execute("UPDATE sql_templates_v2 SET hits = hits + 1 WHERE schema_fp = ? AND pattern = ?",
+                                       (self.schema_fp, template.pattern))
+                    self._conn.commit()
+                    self.stats["template_hits"] += 1
+                    return template.sql, params, "template"
+            self.stats["misses"] += 1
+            return None
+
+    def learn(self, question: str, sql: str) -> None:
+        """Records SQL that executed successfully for `question` (read-only statements only)."""
+        if not re.match(r"^\s*(SELECT|WITH)\b", sql, flags=re.IGNORECASE):
+            return
+        template = learn_template(question, sql)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sql_exact (schema_fp, question, sql, created) VALUES (?, ?, ?, ?)",
+                               (self.schema_fp, question_key(question), sql, now))
+            if template is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sql_templates_v2 (schema_fp, pattern, sql, params, created) VALUES (?, ?, ?, ?, ?)",
+                    (self.schema_fp, template.pattern, template.sql, json.dumps(template.params), now),
+                )
+                self._templates = [t for t in self._templates if t.pattern != template.pattern] + [template]
+            self._conn.commit()
+
+    def forget(self, question: str, sql: str) -> None:
+        """Drops a cached entry whose SQL no longer executes (e.g. data-dependent failure)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_exact WHERE schema_fp = ? AND question = ?",
+                               (self.schema_fp, question_key(question)))
+            self._conn.execute("DELETE FROM sql_templates_v2 WHERE schema_fp = ? AND sql = ?", (self.schema_fp, sql))
+            self._templates = [t for t in self._templates if t.sql != sql]
+            self._conn.commit()
+
+
+# --- 4. DROP-IN QUERY ENGINE ---
+class CachedSQLQueryEngine:
+    """
+    Wraps an NLSQLTableQueryEngine. Cache hits skip the text-to-SQL LLM call and only run the
+    database query; the raw rows are returned as the response for the chat turn to phrase.
+    """
+
+    def __init__(self, query_engine, sql_database, tables: list[str], cache_path: str = SQL_CACHE_PATH):
+        self.query_engine = query_engine
+        self.sql_database = sql_database
+        self.cache = SQLQueryCache(schema_fingerprint(sql_database, tables), cache_path)
+
+    def _execute(self, sql: str, params: dict) -> tuple[list[tuple], list[str]]:
+        if isinstance(self.sql_database, BoundedSQLDatabase):
+            # Cached SQL gets the same row limit, token budget and timeout as freshly generated SQL
+            _, metadata = self.sql_database.run_sql(sql, params)
+            return metadata["result"], metadata["col_keys"]
+        with self.sql_database.engine.connect() as connection:
+            cursor = connection.execute(text(sql), params)
+            return [tuple(row) for row in cursor.fetchall()], list(cursor.keys())
+
+    def query(self, question: str) -> Response:
+        hit = self.cache.lookup(question)
+        if hit is not None:
+            sql, params, kind = hit
+            try:
+                rows, col_keys = self._execute(sql, params)
+            except Exception as e:
+                print(f"(Cached SQL failed: {e.__class__.__name__}. Regenerating.)")
+                self.cache.forget(question, sql)
+            else:
+                # An empty result from a learned template may just mean a bad parameter split; let the LLM retry.
+                if rows or kind == "exact":
+                    print(f"(SQL cache {kind} hit: skipped text-to-SQL generation.)")
+                    return Response(
+                        response=f"SQL query: {sql}\nParameters: {params}\nColumns: {col_keys}\nRows: {rows}",
+                        metadata={"sql_query": sql, "sql_params": params, "result": rows,
+                                  "col_keys": col_keys, "sql_cache": kind},
+                    )
+
+        response = self.query_engine.query(question)
+        sql = (response.metadata or {}).get("sql_query")
+        if sql and "result" in response.metadata:
+            self.cache.learn(question, sql)
+        return response
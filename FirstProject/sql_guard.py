@@ -0,0 +1,334 @@
+import re
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.types import LargeBinary, PickleType
+from sql_rows import ROW_CONTEXT_TOKENS, format_cell
+from token_estimator import estimate_tokens
+
+# --- Configuration ---
+MAX_RESULT_ROWS = 200            # injected LIMIT / TOP; one extra row is fetched to detect truncation
+MAX_PROJECTED_COLUMNS = 20       # SELECT * is rewritten to at most this many non-binary columns
+STATEMENT_TIMEOUT_S = 15.0
+FETCH_SIZE = 100                 # rows per fetchmany() from the (server-side) cursor
+# Estimated-plan limits per dialect; statements above them are rejected before execution.
+# SQLite has no cost model: its "cost" is the number of rows in fully scanned tables.
+MAX_PLAN_COST = {"sqlite": 5_000_000, "mssql": 100.0, "postgresql": 1_000_000.0}
+
+READ_ONLY_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# String literals, quoted identifiers and comments: blanked before looking for separators and keywords
+SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|`[^`]*`|--[^\n]*|/\*.*?\*/", re.DOTALL)
+# A WITH ... DELETE, SELECT ... INTO or a batch behind the SELECT is not read-only
+WRITE_KEYWORD_RE = re.compile(
+    r"\b(insert|update|delete|merge|drop|alter|create|truncate|exec|execute|grant|revoke|deny|into|attach|detach|"
+    r"pragma|vacuum|reindex|declare|waitfor|dbcc|backup|restore|shutdown|kill|openrowset|opendatasource)\b",
+    re.IGNORECASE,
+)
+SELECT_STAR_RE = re.compile(r"^\s*select\s+(distinct\s+)?\*\s+from\s+([\w\[\]\.\"`]+)", re.IGNORECASE)
+# The TOP check precedes the optional DISTINCT, so the regex cannot backtrack around an existing TOP
+MSSQL_SELECT_RE = re.compile(r"^\s*select\s+(?!\s*(?:distinct\s+)?top\b)(distinct\s+)?", re.IGNORECASE)
+MSSQL_COST_RE = re.compile(r'StatementSubTreeCost="([\d.Ee+-]+)"')
+MSSQL_ROWS_RE = re.compile(r'StatementEstRows="([\d.Ee+-]+)"')
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*USING (?:COVERING )?INDEX)")
+# "FROM employee_info a", "JOIN dbo.[Sales_Data] AS s": alias -> table, for plans that name the alias
+TABLE_ALIAS_RE = re.compile(r"\b(?:from|join)\s+([\w\[\]\"`.]+)(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+
+
+class SQLGuardError(Exception):
+    """A generated statement was refused; the message is shown to the model like any SQL error."""
+
+
+class SQLCostError(SQLGuardError):
+    pass
+
+
+class SQLTimeoutError(SQLGuardError):
+    pass
+
+
+@dataclass
+class PlanEstimate:
+    cost: float
+    rows: float | None
+    detail: str
+
+
+# --- 1. STATEMENT REWRITING ---
+def _strip(sql: str) -> str:
+    return sql.strip().rstrip(";").strip()
+
+
+def read_only_violation(sql: str) -> str | None:
+    """Why `sql` is not a single read-only statement, or None. Literals and comments are ignored."""
+    if not READ_ONLY_RE.match(sql):
+        return "Only read-only SELECT statements are allowed."
+    code = SQL_LITERAL_RE.sub(" ", _strip(sql))
+    if ";" in code:
+        return "Only one statement per query is allowed."
+    match = WRITE_KEYWORD_RE.search(code)
+    if match:
+        return f"Only read-only SELECT statements are allowed ({match.group(1).upper()} found)."
+    return None
+
+
+@contextmanager
+def read_only_session(connection, dialect: str):
+    """
+    Second line of defence behind read_only_violation: SQLite refuses writes on the connection
+    (PRAGMA query_only) and PostgreSQL runs a READ ONLY transaction. MSSQL has no per-session
+    switch: give the guarded database an engine whose login can only read (e.g. db_datareader,
+    via db_engines.EngineRouter.read).
+    """
+    if dialect == "sqlite":
+        connection.exec_driver_sql("PRAGMA query_only = ON")
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql("PRAGMA query_only = OFF")
+        return
+    if dialect == "postgresql":
+        connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+    yield
+
+
+def limit_statement(sql: str, dialect: str, max_rows: int) -> str:
+    """Caps the rows the server produces. MSSQL gets TOP on the outer SELECT, others an outer LIMIT."""
+    sql = _strip(sql)
+    if dialect == "mssql":
+        # A derived table cannot hold ORDER BY in T-SQL, so TOP goes into the statement itself;
+        # CTEs and existing TOPs are left to the streaming cap below.
+        return MSSQL_SELECT_RE.sub(lambda m: f"SELECT {m.group(1) or ''}TOP ({max_rows}) ", sql, count=1)
+    return f"SELECT * FROM ({sql}) AS bounded_result LIMIT {max_rows}"
+
+
+def project_columns(sql: str, sql_database, max_columns: int = MAX_PROJECTED_COLUMNS) -> str:
+    """
+    SELECT * FROM <table> ... becomes an explicit list of the table's columns, without binary
+    columns and at most max_columns, using the already reflected metadata (no catalog query).
+    """
+    match = SELECT_STAR_RE.match(sql)
+    if match is None:
+        return sql
+    name = re.sub(r"[\[\]\"`]", "", match.group(2))
+    tables = sql_database.metadata_obj.tables
+    short_name = name.split(".")[-1].lower()
+    table = next((t for key, t in tables.items() if key.split(".")[-1].lower() == short_name), None)
+    if table is None:
+        return sql
+    columns = [c for c in table.columns if not isinstance(c.type, (LargeBinary, PickleType))][:max_columns]
+    if not columns or len(columns) == len(table.columns):
+        return sql
+    projection = ", ".join(sql_database.engine.dialect.identifier_preparer.quote(c.name) for c in columns)
+    star = match.group(0).rindex("*")
+    return sql[:star] + projection + sql[star + 1:]
+
+
+# --- 2. COST PRE-CHECK ---
+def _sqlite_scan_tables(connection, sql: str, plan) -> list[str]:
+    """
+    Real tables behind the plan's full scans. SQLite names the alias when a table has one, and
+    also reports scans of subqueries, CTEs and the bounded_result wrapper, which have no rows of
+    their own (the tables inside them appear as separate plan rows).
+    """
+    tables = {name.lower(): name for (name,) in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = {}
+    for table, alias in TABLE_ALIAS_RE.findall(sql):
+        table = re.sub(r"[\[\]\"`]", "", table).split(".")[-1].lower()
+        if alias and table in tables:
+            aliases[alias.lower()] = tables[table]
+    scanned = []
+    for row in plan:
+        match = SQLITE_SCAN_RE.match(row[-1])
+        if match:
+            target = match.group(1).lower()
+            table = aliases.get(target) or tables.get(target)
+            if table is not None:
+                scanned.append(table)
+    return scanned
+
+
+def estimate_plan(connection, sql: str, dialect: str, params: dict | None = None) -> PlanEstimate | None:
+    """Estimated cost of `sql` (with its bind params) from the database's own planner, or None without an estimator."""
+    params = params or {}
+    if dialect == "sqlite":
+        plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        scanned, cost = [], 0.0
+        for table in _sqlite_scan_tables(connection, sql, plan):
+            # max(rowid) is an index lookup, unlike COUNT(*)
+            try:
+                size = connection.exec_driver_sql(f'SELECT MAX(rowid) FROM "{table}"').scalar() or 0
+            except OperationalError:
+                size = connection.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar() or 0   # WITHOUT ROWID
+            scanned.append(f"{table}~{size}")
+            cost += size
+        return PlanEstimate(cost, None, "full scan: " + ", ".join(scanned) if scanned else "indexed")
+    if dialect == "mssql":
+        connection.exec_driver_sql("SET SHOWPLAN_XML ON")
+        try:
+            plan_xml = connection.execute(text(sql), params).scalar() or ""
+        finally:
+            connection.exec_driver_sql("SET SHOWPLAN_XML OFF")
+        cost, rows = MSSQL_COST_RE.search(plan_xml), MSSQL_ROWS_RE.search(plan_xml)
+        if cost is None:
+            return None
+        return PlanEstimate(float(cost.group(1)), float(rows.group(1)) if rows else None, "showplan")
+    if dialect == "postgresql":
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+        return PlanEstimate(plan["Total Cost"], plan.get("Plan Rows"), plan.get("Node Type", ""))
+    return None
+
+
+# --- 3. STATEMENT TIMEOUT ---
+class _StatementTimer:
+    """
+    Cancels the running statement after timeout_s: sqlite3 interrupt(), psycopg cancel(),
+    and for pyodbc the driver's own query timeout. The fetch loop also checks the deadline.
+    """
+
+    def __init__(self, connection, dialect: str, timeout_s: float):
+        self.dialect = dialect
+        self.deadline = time.monotonic() + timeout_s
+        self.fired = False
+        self._dbapi = connection.connection.dbapi_connection
+        self._timer = None
+        if dialect == "mssql":
+            self._dbapi.timeout = max(1, math.ceil(timeout_s))
+        elif hasattr(self._dbapi, "interrupt") or hasattr(self._dbapi, "cancel"):
+            self._timer = threading.Timer(timeout_s, self._cancel)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel(self) -> None:
+        self.fired = True
+        (getattr(self._dbapi, "interrupt", None) or self._dbapi.cancel)()
+
+    def expired(self) -> bool:
+        return self.fired or time.monotonic() > self.deadline
+
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.dialect == "mssql":
+            self._dbapi.timeout = 0
+
+
+_deadline = threading.local()
+
+
+@contextmanager
+def statement_deadline(timeout_s: float):
+    """
+    Caps every BoundedSQLDatabase statement this thread runs inside the block at timeout_s from now,
+    so a caller that gives up (asyncio.wait_for) also gets the worker thread back at about that time.
+    """
+    previous = getattr(_deadline, "at", None)
+    at = time.monotonic() + timeout_s
+    _deadline.at = at if previous is None else min(previous, at)
+    try:
+        yield
+    finally:
+        _deadline.at = previous
+
+
+def _statement_timeout(timeout_s: float) -> float:
+    at = getattr(_deadline, "at", None)
+    return timeout_s if at is None else min(timeout_s, at - time.monotonic())
+
+
+# --- 4. BOUNDED DATABASE ---
+class BoundedSQLDatabase:
+    """
+    Drop-in wrapper for a (Snapshot)SQLDatabase whose run_sql bounds what generated SQL can do:
+    only single read-only SELECT/WITH statements run; SELECT * is projected to explicit columns; a row limit is
+    injected; the estimated plan is checked against MAX_PLAN_COST; rows are streamed from the
+    cursor and the stream stops once max_rows or the token budget of the chat context is reached;
+    and the statement is cancelled after timeout_s. Everything else is delegated to the wrapped database.
+    """
+
+    def __init__(self, sql_database, max_rows: int = MAX_RESULT_ROWS, max_tokens: int = ROW_CONTEXT_TOKENS,
+                 timeout_s: float = STATEMENT_TIMEOUT_S, max_cost: float | None = None):
+        self.sql_database = sql_database
+        self.max_rows = max_rows
+        self.max_tokens = max_tokens
+        self.timeout_s = timeout_s
+        self.dialect = sql_database.engine.dialect.name
+        self.max_cost = max_cost if max_cost is not None else MAX_PLAN_COST.get(self.dialect)
+        self.stats = {"statements": 0, "projected": 0, "rejected": 0, "truncated": 0, "timeouts": 0}
+
+    def __getattr__(self, name):
+        return getattr(self.sql_database, name)
+
+    def prepare(self, sql: str) -> str:
+        """The statement that will actually run (read-only check, projection, row limit)."""
+        violation = read_only_violation(sql)
+        if violation:
+            self.stats["rejected"] += 1
+            raise SQLGuardError(violation)
+        sql = _strip(sql)
+        if self.sql_database._schema:
+            sql = self.sql_database._add_schema_prefix(sql)
+        projected = project_columns(sql, self.sql_database)
+        if projected != sql:
+            self.stats["projected"] += 1
+        # One row over the limit tells the stream that the result was cut off
+        return limit_statement(projected, self.dialect, self.max_rows + 1)
+
+    def run_sql(self, command: str, params: dict | None = None) -> tuple[str, dict]:
+        self.stats["statements"] += 1
+        sql = self.prepare(command)
+        with self.sql_database.engine.connect() as connection, read_only_session(connection, self.dialect):
+            if self.max_cost is not None:
+                plan = estimate_plan(connection, sql, self.dialect, params)
+                if plan is not None and plan.cost > self.max_cost:
+                    self.stats["rejected"] += 1
+                    raise SQLCostError(
+                        f"Statement rejected: estimated cost {plan.cost:,.0f} exceeds {self.max_cost:,.0f} "
+                        f"({plan.detail}). Add a selective WHERE clause or aggregate instead of listing rows."
+                    )
+            timeout_s = _statement_timeout(self.timeout_s)
+            if timeout_s <= 0:
+                self.stats["timeouts"] += 1
+                raise SQLTimeoutError("Statement not started: the caller's deadline has passed.")
+            timer = _StatementTimer(connection, self.dialect, timeout_s)
+            try:
+                result = connection.execution_options(stream_results=True, max_row_buffer=FETCH_SIZE) \
+                    .execute(text(sql), params or {})
+                rows, truncated = self._stream(result, timer, timeout_s)
+                col_keys = list(result.keys())
+                result.close()   # stops a server-side cursor that still has rows
+            except Exception as e:
+                if timer.expired():
+                    self.stats["timeouts"] += 1
+                    raise SQLTimeoutError(f"Statement cancelled after {timeout_s:g}s.") from e
+                raise
+            finally:
+                timer.stop()
+        if truncated:
+            self.stats["truncated"] += 1
+        return str(rows), {"result": rows, "col_keys": col_keys, "truncated": truncated, "executed_sql": sql}
+
+    def _stream(self, result, timer: _StatementTimer, timeout_s: float) -> tuple[list[tuple], bool]:
+        """Fetches rows until the row limit or the context token budget is reached."""
+        max_length = self.sql_database._max_string_length
+        rows, used = [], 0
+        while True:
+            batch = result.fetchmany(FETCH_SIZE)
+            if not batch:
+                return rows, False
+            for row in batch:
+                if len(rows) >= self.max_rows:
+                    return rows, True
+                row = tuple(self.sql_database.truncate_word(v, length=max_length) for v in row)
+                used += estimate_tokens("\t".join(format_cell(v) for v in row))
+                if used > self.max_tokens:
+                    return rows, True
+                rows.append(row)
+            if timer.expired():
+                raise SQLTimeoutError(f"Statement cancelled after {timeout_s:g}s.")
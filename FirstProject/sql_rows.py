@@ -0,0 +1,40 @@
+from token_estimator import estimate_tokens
+
+# --- Configuration ---
+ROW_CONTEXT_TOKENS = 2000   # budget for the rows fed into the chat turn
+MAX_CELL_CHARS = 200
+
+
+def format_cell(value) -> str:
+    text = "" if value is None else str(value)
+    text = text.replace("\t", " ").replace("\r", " ").replace("\n", " ")
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 3] + "..."
+
+
+def format_rows(col_keys: list[str], rows: list, max_tokens: int = ROW_CONTEXT_TOKENS) -> str:
+    """
+    Serializes a SQL result as a TSV header plus rows, stopping once the token budget is used.
+    Returns:
+        The TSV text, with a trailing note when rows were left out.
+    """
+    lines = ["\t".join(format_cell(c) for c in col_keys)]
+    used = estimate_tokens(lines[0])
+    for i, row in enumerate(rows):
+        line = "\t".join(format_cell(v) for v in row)
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            lines.append(f"... ({len(rows) - i} more row(s) truncated to fit the context budget)")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+def sql_rows_context(metadata: dict, max_tokens: int = ROW_CONTEXT_TOKENS) -> str:
+    """DATA CONTEXT for a chat turn: the executed SQL and its compact result rows."""
+    sql = metadata.get("sql_query", "")
+    rows = metadata.get("result", [])
+    table = format_rows(metadata.get("col_keys", []), rows, max_tokens)
+    # Set by sql_guard.BoundedSQLDatabase when it stopped streaming at its row / token limit
+    more = ", more rows exist beyond this limit" if metadata.get("truncated") else ""
+    return f"EXECUTED SQL: {sql}\nRESULT ({len(rows)} row(s){more}, tab-separated):\n{table}"
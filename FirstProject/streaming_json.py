@@ -0,0 +1,227 @@
+import re
+import json
+import time
+from dataclasses import dataclass
+from google.genai import types
+from latency_metrics import metrics
+
+_WHITESPACE = " \t\r\n"
+_SCALAR = re.compile(r"[^,\]\}\s]+")
+
+
+@dataclass
+class FieldEvent:
+    path: tuple          # ("key_pros", 0) for a list item, ("key_pros",) for the whole list, () for the document
+    value: object
+    elapsed_s: float = 0.0
+
+
+class _Frame:
+    __slots__ = ("container", "path", "key", "state")
+
+    def __init__(self, container, path: tuple):
+        self.container = container
+        self.path = path
+        self.key = None
+        self.state = "key" if isinstance(container, dict) else "value"
+
+
+# --- 1. INCREMENTAL PARSER ---
+class IncrementalJSONParser:
+    """
+    Push parser: feed() it text chunks as they arrive and it returns a FieldEvent for every value
+    that completed in that chunk (scalars, list items, and objects/lists when they close).
+    Containers are attached to their parent as soon as they open, so `root` is always the partially
+    filled document. Unfinished strings and numbers are kept until a later chunk completes them;
+    work per chunk is proportional to the chunk, not to the document so far.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._scan_from = 0      # how far into the current unfinished string we already searched
+        self._events: list[FieldEvent] = []
+
+    def feed(self, text: str) -> list[FieldEvent]:
+        self._buf += text
+        self._parse(final=False)
+        self._buf, self._pos = self._buf[self._pos:], 0
+        events, self._events = self._events, []
+        return events
+
+    def close(self) -> list[FieldEvent]:
+        """End of stream: completes a trailing number/literal and checks the document is whole."""
+        self._parse(final=True)
+        if not self.done:
+            raise ValueError("Incomplete JSON document")
+        events, self._events = self._events, []
+        return events
+
+    # --- Tokens ---
+    def _string(self) -> str | None:
+        """The JSON string starting at _pos, or None if its closing quote has not arrived yet."""
+        start = self._pos
+        end = max(start + 1, start + self._scan_from)
+        while True:
+            end = self._buf.find('"', end)
+            if end == -1:
+                self._scan_from = len(self._buf) - start
+                return None
+            backslashes = 0
+            while self._buf[end - 1 - backslashes] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end += 1
+        self._scan_from = 0
+        self._pos = end + 1
+        return json.loads(self._buf[start:end + 1])
+
+    # --- Structure ---
+    def _emit(self, path: tuple, value) -> None:
+        self._events.append(FieldEvent(path, value))
+
+    def _attach(self, value) -> tuple:
+        """Puts a value into the current container (or makes it the root) and returns its path."""
+        if not self._stack:
+            self.root = value
+            return ()
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            frame.container[frame.key] = value
+            return frame.path + (frame.key,)
+        frame.container.append(value)
+        return frame.path + (len(frame.container) - 1,)
+
+    def _finished(self, path: tuple, value) -> None:
+        self._emit(path, value)
+        if self._stack:
+            self._stack[-1].state = "comma"
+        else:
+            self.done = True
+
+    def _parse(self, final: bool) -> None:
+        buf = self._buf
+        while True:
+            while self._pos < len(buf) and buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos >= len(buf):
+                return
+            if self.done:
+                raise ValueError(f"Unexpected data after the JSON document: {buf[self._pos:self._pos + 20]!r}")
+            c = buf[self._pos]
+            frame = self._stack[-1] if self._stack else None
+
+            if frame is not None and c in "}]":
+                if (c == "}") != isinstance(frame.container, dict):
+                    raise ValueError(f"Mismatched {c!r} at {buf[self._pos:self._pos + 20]!r}")
+                # Only after a value or in an empty container: not after ',' (trailing comma) or a key
+                empty = not frame.container and frame.state == ("key" if c == "}" else "value")
+                if frame.state != "comma" and not empty:
+                    raise ValueError(f"Unexpected {c!r} at {buf[self._pos:self._pos + 20]!r}")
+                self._pos += 1
+                self._stack.pop()
+                self._finished(frame.path, frame.container)
+                continue
+            if frame is not None and frame.state == "comma":
+                if c != ",":
+                    raise ValueError(f"Expected ',' at {buf[self._pos:self._pos + 20]!r}")
+                self._pos += 1
+                frame.state = "key" if isinstance(frame.container, dict) else "value"
+                continue
+            if frame is not None and frame.state == "colon":
+                if c != ":":
+                    raise ValueError(f"Expected ':' at {buf[self._pos:self._pos + 20]!r}")
+                self._pos += 1
+                frame.state = "value"
+                continue
+            if frame is not None and frame.state == "key":
+                if c != '"':
+                    raise ValueError(f"Expected a key at {buf[self._pos:self._pos + 20]!r}")
+                key = self._string()
+                if key is None:
+                    return
+                frame.key, frame.state = key, "colon"
+                continue
+
+            # A value
+            if c in "{[":
+                self._pos += 1
+                container = {} if c == "{" else []
+                path = self._attach(container)
+                if frame is not None:
+                    frame.state = "opened"
+                self._stack.append(_Frame(container, path))
+            elif c == '"':
+                value = self._string()
+                if value is None:
+                    return
+                self._finished(self._attach(value), value)
+            else:
+                match = _SCALAR.match(buf, self._pos)
+                if match is None:
+                    raise ValueError(f"Expected a value at {buf[self._pos:self._pos + 20]!r}")
+                if match.end() == len(buf) and not final:
+                    return   # the number may continue in the next chunk
+                value = json.loads(match.group())
+                self._pos = match.end()
+                self._finished(self._attach(value), value)
+
+
+# --- 2. STREAMING STRUCTURED OUTPUT ---
+class StructuredStream:
+    """
+    generate_content_stream with a Pydantic response_schema, parsed while it streams.
+    Iterating yields a FieldEvent as soon as each field completes (e.g. product_name and
+    sentiment_score before key_pros is finished); `partial` is the model built from what has
+    arrived so far. The last event has path () and the validated model as its value, also
+    available as `result`.
+    Example:
+        stream = StructuredStream(client, MODEL_NAME, [prompt, review_text], ProductReview)
+        for event in stream:
+            if event.path == ("sentiment_score",):
+                route_by_sentiment(event.value)
+        review = stream.result
+    """
+
+    def __init__(self, client, model: str, contents, schema, config: types.GenerateContentConfig | None = None):
+        self.client = client
+        self.model = model
+        self.contents = contents
+        self.schema = schema
+        base = config or types.GenerateContentConfig()
+        self.config = base.model_copy(update={"response_mime_type": "application/json", "response_schema": schema})
+        self.parser = IncrementalJSONParser()
+        self.result = None
+        self.time_to_first_field_s = None
+        self.usage_metadata = None
+
+    @property
+    def partial(self):
+        """The schema built from the fields received so far, without validation."""
+        root = self.parser.root if isinstance(self.parser.root, dict) else {}
+        return self.schema.model_construct(**root)
+
+    def __iter__(self):
+        start = time.perf_counter()
+        stream = metrics.generate_content_stream(
+            self.client, "structured_stream", model=self.model, contents=self.contents, config=self.config)
+        for chunk in stream:
+            if chunk.usage_metadata is not None:
+                self.usage_metadata = chunk.usage_metadata
+            if not chunk.text:
+                continue
+            for event in self.parser.feed(chunk.text):
+                if event.path == ():
+                    continue
+                event.elapsed_s = time.perf_counter() - start
+                if self.time_to_first_field_s is None:
+                    self.time_to_first_field_s = event.elapsed_s
+                yield event
+        self.parser.close()
+        # The final gate is still the full schema (types, required fields)
+        self.result = self.schema.model_validate(self.parser.root)
+        yield FieldEvent((), self.result, time.perf_counter() - start)
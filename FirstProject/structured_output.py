@@ -1,18 +1,20 @@
 import os 
 import json 
+import asyncio
 from google import genai
 from google.genai import types
-from pydantic import BaseModel, Field
+from review_schema import ProductReview
+from review_batch import BatchReviewExtractor
+from streaming_json import StructuredStream
+from latency_metrics import metrics
 
 client = genai.Client()
 MODEL_NAME = "gemini-2.5-flash"
 
-class ProductReview(BaseModel):
-    """Structured data model for a product review summary"""
-    product_name: str = Field(description="The formal, full name of the product.")
-    sentiment_score: int = Field(description="The sentiment rating from 1 (bad) to 10 (excellent).")
-    key_pros: list[str] = Field(description="A list of 2-3 main positive points about the product.")
-    key_con: list[str] = Field(description="A list of 2-3 main negative points about the product.")
+# Bulk mode: reviews streamed from a JSONL/CSV file, packed several per request, resumable output
+RUN_BATCH_EXTRACTION = False
+REVIEWS_FILE = "reviews.jsonl"            # one {"id": ..., "text": ...} per line (or CSV with id,text columns)
+REVIEWS_OUTPUT = "./cache/review_extractions.jsonl"
 
 config = types.GenerateContentConfig(
     response_mime_type="application/json",
@@ -44,6 +46,20 @@ try:
     print(f"Cons: {review_data.key_con}")
     print("-----------------------------------------------------")
 
+    print("\n1b. Streaming the same extraction field by field...")
+    structured_stream = StructuredStream(
+        client, MODEL_NAME,
+        [f"Analyze the following user review and extract the structured data:", review_text],
+        ProductReview,
+    )
+    for event in structured_stream:
+        if len(event.path) == 1:   # top-level fields, as soon as each one is complete
+            print(f"  [{event.elapsed_s * 1000:.0f} ms] {event.path[0]}: {event.value}")
+    # None when no field completed before the end of the stream (e.g. an empty or one-chunk response)
+    first_field_s = structured_stream.time_to_first_field_s
+    first_field = f"{first_field_s * 1000:.0f} ms" if first_field_s is not None else "n/a"
+    print(f"  Time to first field: {first_field}; validated: {structured_stream.result.product_name}")
+
 
 
     long_prompt= "Write a 5-paragraph analysis of the impact of Large Language Models on the future of professional coding jobs, maintaining a highly optimistic but realistic tone."
@@ -52,7 +68,9 @@ try:
     print("Agent: ", end="")
 
 
-    stream = client.models.generate_content_stream(
+    # Timed per call: time to first token, gaps between chunks, output tokens/s (see latency_metrics.py)
+    stream = metrics.generate_content_stream(
+        client, "structured_output.long_form",
         model= MODEL_NAME,
         contents=[long_prompt]
     )
@@ -63,6 +81,15 @@ try:
             print(chunk.text, end="", flush=True)
 
     print("\n--- END OF STREAMED CONTENT ---")
+    timing = metrics.calls[-1]
+    ttft = f"{timing['ttft_s'] * 1000:.0f} ms" if timing["ttft_s"] is not None else "n/a (no text chunks)"
+    print(f"(Latency: TTFT {ttft}, total {timing['duration_s']:.2f}s, {timing['chunks']} chunks)")
+
+    if RUN_BATCH_EXTRACTION:
+        print(f"\n3. Bulk extraction of {REVIEWS_FILE} -> {REVIEWS_OUTPUT} ...")
+        os.makedirs(os.path.dirname(REVIEWS_OUTPUT), exist_ok=True)
+        extractor = BatchReviewExtractor(client, REVIEWS_OUTPUT, model=MODEL_NAME)
+        asyncio.run(extractor.run(REVIEWS_FILE))
 
 
 except Exception as e:
@@ -1,22 +1,12 @@
-import json
 
 from google import genai
 from google.genai import types
+from tool_executor import ToolExecutor
+from tools import get_current_weather
+from history_manager import HistoryManager
 
 # --- 1. DEFINE YOUR TOOL (PYTHON FUNCTION) ---
-def get_current_weather(city: str) -> str:
-    """
-    Returns the current weather for a specific city.
-    Args:
-        city: The city name, e.g., 'San Francisco' or 'Tokyo'.
-    """
-    city = city.lower()
-    if "boston" in city:
-        return json.dumps({"temperature": "12°C", "conditions": "Partly Cloudy", "wind": "15 kph"})
-    elif "tokyo" in city:
-        return json.dumps({"temperature": "25°C", "conditions": "Sunny", "wind": "8 kph"})
-    else:
-        return json.dumps({"error": "City Not Found", "code": 404})
+# get_current_weather is shared by all agents; see tools.py for its TTL cache policy (per normalized city)
 
 client = genai.Client()
 
@@ -24,16 +14,18 @@ client = genai.Client()
 science_persona = """You are a highly professional, academic physics assistant. Your tone must be formal, serious, and concise. You MUST decline non-scientific questions politely."""
 
 
-config = types.GenerateContentConfig(
-    system_instruction=science_persona,
-    tools=[get_current_weather]
-)
+# Function calls from one turn ("boston and tokyo") run in parallel instead of one after another
+tool_executor = ToolExecutor([get_current_weather])
+config = tool_executor.config(system_instruction=science_persona)
 
 
 try:
-    chat = client.chats.create(
+    # The manager owns the chat session and keeps its history under a token budget
+    history = HistoryManager(
+        client,
         model="gemini-2.5-flash",
-        config=config
+        config=config,
+        tool_executor=tool_executor,
     )
     print("Agent Chat Session successfully created with the weather tool with a defined persona.")
 except Exception as e:
@@ -42,12 +34,12 @@ except Exception as e:
 
 prompt_1 = "explain the fundamental principles of quantum entanglement"
 print(f"User 1: {prompt_1}")
-response_1 = chat.send_message(prompt_1)
+response_1 = history.send_message(prompt_1)
 print(f"Agent 1: {response_1.text}")
 
 prompt_2 = "what is the weather like in boston and tokyo today?"
 print(f"User 2: {prompt_2}")
-response_2 = chat.send_message(prompt_2)
+response_2 = history.send_message(prompt_2)
 print(f"Agent 2: {response_2.text}")
 
 
@@ -56,7 +48,7 @@ print(f"Agent 2: {response_2.text}")
 
 print("\n---FULL CONVERSATION HISTORY---")
 
-full_history = chat.get_history()
+full_history = history.get_history()
 
 for turn_index, content in enumerate(full_history):
     role = content.role.upper()
@@ -81,23 +73,33 @@ for turn_index, content in enumerate(full_history):
 
 print("Get Token Count")
 
-history_tokens = client.models.count_tokens(
-    model="gemini-2.5-pro",
-    contents=chat.get_history()
-)
-
-
-print(f"\nTotal tokens in History (Input Cost): {history_tokens.total_tokens}")
+# Local, calibrated estimate (no API round trip); set VERIFY_TOKEN_ESTIMATE to compare it with
+# count_tokens for the same model the chat uses.
+VERIFY_TOKEN_ESTIMATE = False
+contents_tokens = history.estimator.count(history.get_history())
+config_tokens = history.estimator.count_config(config)  # system instruction + tool declarations
+history_tokens = contents_tokens + config_tokens
+print(f"\nTotal tokens in History (Input Cost, estimated): {history_tokens} "
+      f"({contents_tokens} contents + {config_tokens} system instruction and tools)")
+
+if VERIFY_TOKEN_ESTIMATE:
+    # count_tokens on the Gemini API takes contents only (no system instruction / tools),
+    # so it is compared with the contents part of the estimate.
+    counted = client.models.count_tokens(
+        model="gemini-2.5-flash",
+        contents=history.get_history()
+    )
+    print(f"count_tokens: {counted.total_tokens} contents tokens "
+          f"(estimate error {100 * (contents_tokens - counted.total_tokens) / counted.total_tokens:+.1f}%)")
 
 
 print(f"\n---USAGE METADATA---")
 print(response_2.usage_metadata)
 
 
-messages_to_keep = 2
-if len(full_history) > messages_to_keep:
-    print(f"Truncating history: Removing {len(full_history) - messages_to_keep} messages...")
-    del full_history[messages_to_keep]
-else :
-    print(f"History is sort enough; no truncation needed.")
-
+# Deleting from get_history() only edits a copy; the manager instead folds older turns into a
+# rolling summary (in the background) once the history exceeds its budget.
+print(f"\nHistory budget: ~{history.history_tokens()} / {history.token_budget} tokens, "
+      f"keeping the last {history.keep_turns} turns verbatim. Compactions so far: {history.compactions}")
+print(f"Input tokens per turn: {history.turn_input_tokens}")
+history.close()
@@ -0,0 +1,35 @@
+import json
+from embedding_pipeline import Checkpoint, truncate_torn_tail
+from review_batch import completed_ids
+
+
+def test_truncate_torn_tail(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(b'{"review_id": "a"}\n{"review_id": "b"}\n{"review_i')
+    truncate_torn_tail(str(path))
+    assert path.read_bytes() == b'{"review_id": "a"}\n{"review_id": "b"}\n'
+    truncate_torn_tail(str(path))   # complete file is left alone
+    assert path.read_bytes() == b'{"review_id": "a"}\n{"review_id": "b"}\n'
+    truncate_torn_tail(str(tmp_path / "missing.jsonl"))
+
+
+def test_truncate_single_torn_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(b'{"review_id": "a"')
+    truncate_torn_tail(str(path))
+    assert path.read_bytes() == b""
+
+
+def test_completed_ids_skips_damaged_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"review_id": "a"}\nnot json\n{"other": 1}\n{"review_id": "b"}\n', encoding="utf-8")
+    assert completed_ids(str(path)) == {"a", "b"}
+
+
+def test_checkpoint_recovers_after_torn_write(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text(json.dumps(["a", "b"]) + "\n" + '["c", "d', encoding="utf-8")
+    checkpoint = Checkpoint(str(path))
+    assert checkpoint.committed == {"a", "b"}
+    checkpoint.commit(["e"])
+    assert Checkpoint(str(path)).committed == {"a", "b", "e"}
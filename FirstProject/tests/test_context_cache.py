@@ -0,0 +1,77 @@
+import time
+import pytest
+from google.genai import types
+from context_cache import ContextCacheManager, FakeCacheBackend
+
+MODEL = "gemini-2.5-flash"
+LONG_PERSONA = "You are a corporate policy assistant. " + " ".join(
+    f"Rule {i}: expenses over {i * 10} dollars need a receipt and manager approval." for i in range(400))
+
+
+def lookup_policy(topic: str) -> str:
+    """Returns the policy text for a topic."""
+    return topic
+
+
+@pytest.fixture
+def manager():
+    manager = ContextCacheManager(FakeCacheBackend())
+    yield manager
+    manager.close()
+
+
+def test_small_prefix_is_passed_through(manager):
+    config = types.GenerateContentConfig(system_instruction="Be concise.")
+    assert manager.config_for(MODEL, config) is config
+    assert manager.stats["too_small"] == 1
+    assert manager.backend.calls["create"] == 0
+
+
+def test_same_prefix_reuses_one_handle(manager):
+    config = types.GenerateContentConfig(system_instruction=LONG_PERSONA, tools=[lookup_policy])
+    first = manager.config_for(MODEL, config)
+    second = manager.config_for(MODEL, config.model_copy())
+    assert first.cached_content == second.cached_content is not None
+    assert manager.backend.calls["create"] == 1
+    assert manager.stats["reused"] == 1
+    other = manager.config_for(MODEL, config.model_copy(update={"system_instruction": LONG_PERSONA + " Be brief."}))
+    assert other.cached_content != first.cached_content
+
+
+def test_config_for_strips_cached_fields(manager):
+    config = types.GenerateContentConfig(system_instruction=LONG_PERSONA, tools=[lookup_policy], temperature=0.2)
+    cached = manager.config_for(MODEL, config)
+    assert cached.system_instruction is None and cached.tools is None
+    assert cached.temperature == 0.2
+    assert config.system_instruction == LONG_PERSONA and config.tools == [lookup_policy]
+    stored = manager.backend.caches[cached.cached_content]
+    assert stored["system_instruction"] == LONG_PERSONA and stored["tools"] == [lookup_policy]
+
+
+def test_handle_close_to_expiry_is_renewed(manager):
+    name = manager.get(MODEL, LONG_PERSONA)
+    handle = next(iter(manager.handles.values()))
+    handle.expire_at = time.time() + 10   # inside RENEW_MARGIN_S
+    assert manager.get(MODEL, LONG_PERSONA) == name
+    assert manager.backend.calls["renew"] == 1 and manager.stats["renewed"] == 1
+    assert handle.expire_at > time.time() + manager.renew_margin_s
+
+
+def test_expired_handle_is_recreated(manager):
+    name = manager.get(MODEL, LONG_PERSONA)
+    manager.backend.caches[name]["expire_at"] = time.time() - 1   # gone server-side
+    next(iter(manager.handles.values())).expire_at = time.time() - 1
+    renamed = manager.get(MODEL, LONG_PERSONA)
+    assert renamed != name
+    assert manager.stats["recreated"] == 1 and manager.backend.calls["create"] == 2
+
+
+def test_renew_due_drops_vanished_handles_and_close_deletes(manager):
+    name = manager.get(MODEL, LONG_PERSONA)
+    del manager.backend.caches[name]
+    next(iter(manager.handles.values())).expire_at = time.time()
+    manager.renew_due()
+    assert manager.handles == {}
+    manager.get(MODEL, LONG_PERSONA)
+    manager.close()
+    assert manager.backend.caches == {} and manager.backend.calls["delete"] == 1
@@ -0,0 +1,45 @@
+import time
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from db_engines import create_sql_engine, warm_up
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sql_engine(f"sqlite:///{tmp_path / 'pool.sqlite3'}", pool_size=1, max_overflow=0,
+                               pool_timeout=0.1, warmup=0)
+    yield engine
+    engine.dispose()
+
+
+def test_only_pool_exhaustion_counts_as_timeout(engine):
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert engine.pool.counters["timeouts"] == 1
+
+    def refuse(*args):
+        raise RuntimeError("login failed")
+    engine.dispose()
+    event.listen(engine, "do_connect", refuse)
+    with pytest.raises(RuntimeError):
+        engine.connect()
+    assert engine.pool.counters["timeouts"] == 1
+
+
+def test_failed_warm_up_does_not_wait_for_the_barrier(tmp_path):
+    engine = create_sql_engine(f"sqlite:///{tmp_path / 'pool.sqlite3'}", pool_size=3, warmup=0)
+    connects = []
+
+    def fail_second(*args):
+        connects.append(1)
+        if len(connects) == 2:
+            raise RuntimeError("login failed")
+    event.listen(engine, "do_connect", fail_second)
+    start = time.perf_counter()
+    warm_up(engine, 3)
+    assert time.perf_counter() - start < 5.0
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+    engine.dispose()
@@ -0,0 +1,139 @@
+import os
+import json
+from types import SimpleNamespace
+import pytest
+
+import file_registry
+from file_registry import FileRegistry
+
+
+class ApiError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeFiles:
+    def __init__(self):
+        self.uploads = []
+        self.deleted = []
+
+    def upload(self, file, config):
+        name = f"files/{len(self.uploads) + 1}"
+        self.uploads.append((file, config["mime_type"]))
+        return SimpleNamespace(name=name, uri=f"https://example.invalid/{name}", state=None, expiration_time=None)
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeClient:
+    def __init__(self, failures=()):
+        self.files = FakeFiles()
+        self.failures = list(failures)   # errors raised by the next generate_content calls
+        self.requests = []
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+
+    def _generate_content(self, model, contents, **kwargs):
+        self.requests.append([c.name for c in contents[1:]])
+        if self.failures:
+            raise self.failures.pop(0)
+        return SimpleNamespace(text="ok")
+
+
+def write(path, data: bytes) -> str:
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return FileRegistry(FakeClient(), path=str(tmp_path / "registry.json"))
+
+
+def test_same_content_is_uploaded_once(registry, tmp_path, monkeypatch):
+    a = write(tmp_path / "a.pdf", b"%PDF same bytes")
+    b = write(tmp_path / "copy.pdf", b"%PDF same bytes")
+    assert registry.get(a).name == registry.get(b).name == "files/1"
+    assert registry.stats["uploaded"] == 1 and registry.stats["reused"] == 1
+
+    hashed = []
+    monkeypatch.setattr(file_registry, "file_sha256", lambda path: hashed.append(path) or "x")
+    registry.get(a)
+    assert hashed == []   # size and mtime unchanged: the remembered hash is used
+
+    write(tmp_path / "a.pdf", b"%PDF changed bytes")
+    monkeypatch.undo()
+    assert registry.get(a).name == "files/2"
+    assert registry.get(a, mime_type="text/plain").name == "files/3"   # same bytes, other MIME type
+
+
+def test_registry_survives_a_restart(registry, tmp_path):
+    a = write(tmp_path / "a.pdf", b"%PDF")
+    registry.get(a)
+    reopened = FileRegistry(registry.client, path=registry.path)
+    assert reopened.get(a).name == "files/1" and reopened.stats["uploaded"] == 0
+
+
+def test_saves_only_on_change(registry, tmp_path, monkeypatch):
+    a = write(tmp_path / "a.pdf", b"%PDF")
+    registry.get(a)
+    writes = []
+    real_replace = os.replace
+    monkeypatch.setattr(file_registry.os, "replace", lambda src, dst: writes.append(dst) or real_replace(src, dst))
+    for _ in range(3):
+        registry.get(a)
+    assert writes == []
+    registry.evict()   # persists the new last_used
+    registry.evict()   # nothing changed
+    assert writes == [registry.path]
+
+
+def test_expired_uploads_are_uploaded_again(registry, tmp_path):
+    a = write(tmp_path / "a.pdf", b"%PDF")
+    registry.get(a)
+    next(iter(registry.entries.values()))["expire_at"] = 0
+    assert registry.get(a).name == "files/2" and registry.stats["reuploaded"] == 1
+
+
+def test_referenced_uploads_are_not_evicted(tmp_path):
+    registry = FileRegistry(FakeClient(), path=str(tmp_path / "registry.json"), max_files=1)
+    a = write(tmp_path / "a.pdf", b"%PDF a")
+    b = write(tmp_path / "b.pdf", b"%PDF b")
+    with registry.use([a, b]) as files:
+        registry.evict()
+        assert registry.client.files.deleted == []   # over max_files, but both are pinned
+        with registry.use([a]):
+            assert registry._refs == {"files/1": 2, "files/2": 1}
+        assert registry._refs == {"files/1": 1, "files/2": 1}
+        registry.get(b)   # b is now the most recently used
+    assert registry._refs == {}
+    assert registry.client.files.deleted == ["files/1"]
+    assert [e["name"] for e in registry.entries.values()] == [files[1].name]
+    assert {known[2] for known in registry.hashes.values()} == {registry.content_hash(b)}
+
+
+def test_hashes_shrink_with_evictions(tmp_path):
+    registry = FileRegistry(FakeClient(), path=str(tmp_path / "registry.json"), max_files=2)
+    for i in range(5):
+        with registry.use([write(tmp_path / f"{i}.pdf", f"%PDF {i}".encode())]):
+            pass
+    assert len(registry.entries) == 2 and len(registry.hashes) == 2
+    with open(registry.path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)["hashes"]) == 2
+
+
+@pytest.mark.parametrize("code", [403, 404])
+def test_vanished_upload_is_reuploaded_and_retried(tmp_path, code):
+    registry = FileRegistry(FakeClient(failures=[ApiError(code)]), path=str(tmp_path / "registry.json"))
+    a = write(tmp_path / "a.pdf", b"%PDF")
+    assert registry.generate_content("m", "Summarize", [a]).text == "ok"
+    assert registry.client.requests == [["files/1"], ["files/2"]]
+    assert registry.stats["uploaded"] == 2
+
+
+def test_other_errors_are_not_retried(tmp_path):
+    registry = FileRegistry(FakeClient(failures=[ApiError(500)]), path=str(tmp_path / "registry.json"))
+    with pytest.raises(ApiError):
+        registry.generate_content("m", "Summarize", [write(tmp_path / "a.pdf", b"%PDF")])
+    assert len(registry.client.requests) == 1 and len(registry.entries) == 1
@@ -0,0 +1,168 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from google.genai import types
+from history_manager import SUMMARY_PREFIX, HistoryManager, split_turns
+from token_estimator import TokenEstimator
+
+
+class FakeChat:
+    """Like the SDK chat: get_history() returns the live list, which send_message extends in place."""
+
+    def __init__(self, history=None, prompt_ratio: float = 1.5):
+        self._history = list(history or [])
+        self.prompt_ratio = prompt_ratio
+        self.estimator = TokenEstimator("fake", calibration_path=None)
+
+    def get_history(self, curated: bool = False):
+        return self._history
+
+    def send_message(self, message):
+        user = types.Content(role="user", parts=[types.Part(text=message)])
+        prompt_tokens = round(self.estimator.count(self._history + [user]) * self.prompt_ratio)
+        self._history.extend([user, types.Content(role="model", parts=[types.Part(text=f"Answer to: {message}")])])
+        return SimpleNamespace(text=f"Answer to: {message}",
+                               usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=prompt_tokens))
+
+
+class FakeClient:
+    def __init__(self, summary: str = "The user asked about travel policy."):
+        self.summary = summary
+        self.summary_calls = 0
+        self.prompts = []
+        self.release = threading.Event()   # cleared by a test to hold the background summary
+        self.release.set()
+        self.chats = SimpleNamespace(create=self._create_chat)
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+
+    def _create_chat(self, model, config=None, history=None):
+        return FakeChat(history)
+
+    def _generate_content(self, model, contents, config=None):
+        self.summary_calls += 1
+        self.prompts.append(contents)
+        self.release.wait(5)
+        if isinstance(self.summary, Exception):
+            raise self.summary
+        return SimpleNamespace(text=self.summary)
+
+
+@pytest.fixture
+def manager():
+    manager = HistoryManager(FakeClient(), model="fake-model")
+    manager.estimator = TokenEstimator("fake-model", calibration_path=None)
+    yield manager
+    manager.close()
+
+
+def test_plain_turns_calibrate_the_estimator(manager):
+    manager.send_message("What is the per diem for Boston?")
+    manager.send_message("And for Chicago?")
+    assert manager.estimator.samples == 2
+    assert manager.estimator.ratio == pytest.approx(1.5, rel=0.05)
+    assert manager.turn_input_tokens and all(t > 0 for t in manager.turn_input_tokens)
+
+
+def text(role: str, value: str) -> types.Content:
+    return types.Content(role=role, parts=[types.Part(text=value)])
+
+
+def tool_turn(question: str, city: str) -> list[types.Content]:
+    """User text, a function call, its response and the final answer: one turn."""
+    return [
+        text("user", question),
+        types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+            name="get_current_weather", args={"city": city}))]),
+        types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+            name="get_current_weather", response={"city": city, "temp_c": 21}))]),
+        text("model", f"It is 21 degrees in {city}."),
+    ]
+
+
+@pytest.fixture
+def small_budget():
+    manager = HistoryManager(FakeClient(), model="fake-model", token_budget=60, keep_turns=2)
+    manager.estimator = TokenEstimator("fake-model", calibration_path=None)
+    yield manager
+    manager.close()
+
+
+def wait_for_summary(manager) -> None:
+    assert manager._pending is not None
+    manager._pending[0].result(5)
+
+
+def test_under_budget_nothing_is_summarized(manager):
+    for i in range(3):
+        manager.send_message(f"Question {i}")
+    assert manager._pending is None and manager.client.summary_calls == 0
+
+
+def test_over_budget_older_turns_are_folded_into_the_summary(small_budget):
+    for i in range(5):
+        small_budget.send_message(f"Question {i} about the travel and expense policy for the Boston office?")
+        if small_budget._pending is not None:
+            break
+    wait_for_summary(small_budget)
+    assert small_budget.compactions == 0   # swapped in at the start of the next turn, never mid-turn
+
+    small_budget.send_message("And what about Chicago?")
+    assert small_budget.compactions == 1
+    assert small_budget.summary == small_budget.client.summary
+    history = small_budget.get_history()
+    assert history[0].parts[0].text.startswith(SUMMARY_PREFIX)
+    turns = split_turns(history[2:])
+    assert history[-2].parts[0].text == "And what about Chicago?"
+    assert len(turns) == small_budget.keep_turns + 1
+    assert "Question 0" in small_budget.client.prompts[0]
+
+
+def test_turns_sent_while_summarizing_are_kept(small_budget):
+    small_budget.client.release.clear()
+    for i in range(5):
+        small_budget.send_message(f"Question {i} about the travel and expense policy for the Boston office?")
+        if small_budget._pending is not None:
+            break
+    consumed = small_budget._pending[1]
+    small_budget.send_message("Sent while the summary is running")   # still pending: no swap, no second summary
+    assert small_budget.compactions == 0 and small_budget.client.summary_calls == 1
+    before_swap = list(small_budget.get_history())
+
+    small_budget.client.release.set()
+    wait_for_summary(small_budget)
+    small_budget._apply_summary()
+    history = small_budget.get_history()
+    assert history[2:] == before_swap[consumed:]
+    assert any(c.parts[0].text == "Sent while the summary is running" for c in history)
+
+
+def test_failed_summary_keeps_the_full_history(small_budget):
+    small_budget.client.summary = RuntimeError("quota")
+    for i in range(5):
+        small_budget.send_message(f"Question {i} about the travel and expense policy for the Boston office?")
+        if small_budget._pending is not None:
+            break
+    length = len(small_budget.get_history())
+    with pytest.raises(RuntimeError):
+        wait_for_summary(small_budget)
+    small_budget._apply_summary()
+    assert small_budget.compactions == 0 and small_budget.summary == ""
+    assert len(small_budget.get_history()) == length
+
+
+def test_tool_calls_keep_their_responses_across_the_cut(small_budget):
+    history = [entry for i, city in enumerate(["Boston", "Chicago", "Denver", "Austin"])
+               for entry in tool_turn(f"Weather in {city}, please?", city)]
+    small_budget.chat = FakeChat(history)
+    small_budget._maybe_compact()
+    wait_for_summary(small_budget)
+    small_budget._apply_summary()
+
+    kept = small_budget.get_history()[2:]
+    assert kept == history[-8:]   # the last two turns, each with call and response
+    assert kept[0].parts[0].text == "Weather in Denver, please?"
+    for i, content in enumerate(kept):
+        if content.parts[0].function_response:
+            assert kept[i - 1].parts[0].function_call.name == content.parts[0].function_response.name
+    assert "TOOL CALL: get_current_weather" in small_budget.client.prompts[0]
+    assert "TOOL RESULT: get_current_weather" in small_budget.client.prompts[0]
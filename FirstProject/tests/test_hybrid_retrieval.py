@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from hybrid_retrieval import (HybridRetriever, KeywordIndex, metadata_filters, reciprocal_rank_fusion,
+                              tokenize)
+
+POLICY = {
+    "remote": "Remote work is allowed up to three days per week with manager approval.",
+    "mileage": "Travel by personal car is reimbursed at $0.67 per mile (the mileage rate).",
+    "hours": "Core working hours are 10:00 to 15:00; flexible start times are allowed.",
+    "receipts": "Expense receipts are submitted through the finance portal within 30 days.",
+}
+
+
+class FakeVectorStore:
+    def __init__(self, nodes: list[TextNode]):
+        self.nodes = {n.node_id: n for n in nodes}
+        self.fetched: list[list[str]] = []
+
+    def get_nodes(self, node_ids: list[str]) -> list[TextNode]:
+        self.fetched.append(list(node_ids))
+        return [self.nodes[i] for i in node_ids if i in self.nodes]
+
+
+class FakeIndex:
+    """Dense retrieval returns a fixed ranking; the vector store serves nodes by id."""
+
+    def __init__(self, nodes: list[TextNode], dense_ids: list[str]):
+        self.vector_store = FakeVectorStore(nodes)
+        self.dense = [NodeWithScore(node=self.vector_store.nodes[i], score=1.0) for i in dense_ids]
+
+    def as_retriever(self, similarity_top_k: int, filters=None):
+        return SimpleNamespace(retrieve=lambda query_bundle: self.dense[:similarity_top_k])
+
+
+def _nodes(texts: dict[str, str]) -> list[TextNode]:
+    return [TextNode(id_=node_id, text=text, metadata={"file_name": "policy.txt"}) for node_id, text in texts.items()]
+
+
+def _keyword_index(texts: dict[str, str], path=None) -> KeywordIndex:
+    index = KeywordIndex(path)
+    for node_id, text in texts.items():
+        index.add(node_id, text, {"file_name": "policy.txt", "year": 2025 if node_id != "hours" else 2024})
+    return index
+
+
+def test_tokenize():
+    assert tokenize("The policies on Expenses: $1,000.50 and $0.67 per mile") == \
+        ["policy", "expense", "1,000.50", "0.67", "mile"]
+    assert tokenize("class access") == ["class", "access"]
+
+
+def test_keyword_index_finds_exact_terms():
+    index = _keyword_index(POLICY)
+    assert index.search("What is the mileage rate?", 2)[0][0] == "mileage"
+    assert index.search("$0.67", 5) == [("mileage", index.search("0.67", 1)[0][1])]
+    assert index.search("the and of", 5) == []
+
+
+def test_keyword_index_remove_filters_and_persist(tmp_path):
+    path = str(tmp_path / "keyword_index.json")
+    index = _keyword_index(POLICY, path)
+    index.remove("mileage")
+    assert index.search("mileage", 5) == []
+    assert [node_id for node_id, _ in index.search("allowed", 5, metadata_filters(year=2025))] == ["remote"]
+    index.save()
+    reloaded = KeywordIndex(path)
+    assert len(reloaded) == 3 and reloaded.total_length == index.total_length
+    assert reloaded.search("allowed", 5)[0][0] in ("remote", "hours")
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b"]], k=60)
+    assert [node_id for node_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_keyword_only_hit_is_fetched_from_the_store():
+    # The vector search misses the "$0.67 ... mileage" chunk; BM25 finds it by the exact terms
+    index = FakeIndex(_nodes(POLICY), dense_ids=["remote", "hours", "receipts"])
+    retriever = HybridRetriever(index, _keyword_index(POLICY), top_k=2)
+    results = retriever._retrieve(QueryBundle("mileage $0.67"))
+    assert "mileage" in [r.node.node_id for r in results]
+    assert index.vector_store.fetched == [["mileage"]]
+
+
+def test_duplicates_are_skipped_beyond_the_first_window():
+    texts = {f"dup{i}": POLICY["remote"] for i in range(5)} | {"hours": POLICY["hours"]}
+    index = FakeIndex(_nodes(texts), dense_ids=list(texts))
+    retriever = HybridRetriever(index, KeywordIndex(), top_k=2)   # first window: dup0..dup3
+    results = retriever._retrieve(QueryBundle("anything"))
+    assert [r.node.node_id for r in results] == ["dup0", "hours"]
+    assert results[0].score > results[1].score
+
+
+def test_token_budget_caps_the_context():
+    index = FakeIndex(_nodes(POLICY), dense_ids=list(POLICY))
+    retriever = HybridRetriever(index, KeywordIndex(), top_k=4, max_context_tokens=1)
+    assert [r.node.node_id for r in retriever._retrieve(QueryBundle("anything"))] == ["remote"]
@@ -0,0 +1,99 @@
+import io
+import pytest
+
+import image_input
+from image_input import load_image_part, prepare_image, sniff_mime
+from token_estimator import image_size, image_tokens
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def encode(fmt: str, size=(37, 21), mode: str = "RGB", **save_kwargs) -> bytes:
+    out = io.BytesIO()
+    Image.new(mode, size, color=(200, 30, 30, 128)[:len(mode)]).save(out, format=fmt, **save_kwargs)
+    return out.getvalue()
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("fmt, mime_type", [
+    ("PNG", "image/png"), ("JPEG", "image/jpeg"), ("GIF", "image/gif"), ("WEBP", "image/webp"),
+    ("BMP", "image/bmp"), ("TIFF", "image/tiff"),
+])
+def test_sniff_mime(fmt, mime_type):
+    assert sniff_mime(encode(fmt)[:16]) == mime_type
+
+
+def test_sniff_mime_heif_and_unknown():
+    assert sniff_mime(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00") == "image/heic"
+    assert sniff_mime(b"\x00\x00\x00\x18ftypmif1\x00\x00\x00\x00") == "image/heif"
+    assert sniff_mime(b"%PDF-1.7\n") is None
+    assert sniff_mime(b"") is None
+
+
+@pytest.mark.parametrize("fmt, save_kwargs, mode", [
+    ("PNG", {}, "RGB"),
+    ("JPEG", {}, "RGB"),
+    ("JPEG", {"progressive": True}, "RGB"),
+    ("GIF", {}, "RGB"),
+    ("WEBP", {"lossless": False}, "RGB"),    # VP8
+    ("WEBP", {"lossless": True}, "RGB"),     # VP8L
+    ("WEBP", {"lossless": False}, "RGBA"),   # VP8X (alpha)
+])
+def test_image_size_from_headers(fmt, save_kwargs, mode):
+    assert image_size(encode(fmt, size=(1201, 403), mode=mode, **save_kwargs)) == (1201, 403)
+
+
+def test_image_size_unknown_or_truncated():
+    assert image_size(b"not an image") is None
+    assert image_size(encode("PNG")[:20]) is None
+
+
+def test_image_tokens():
+    assert image_tokens(384, 384) == 258
+    assert image_tokens(1000, 500) == 258 * 2 * 1
+
+
+def test_small_compatible_image_is_sent_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_input, "_resize", lambda *args: pytest.fail("small image was decoded"))
+    original = encode("PNG", size=(640, 480))
+    data, mime_type, info = prepare_image(write(tmp_path, "photo.jpg", original), max_side=1024)
+    assert data == original and mime_type == "image/png"   # the bytes decide, not the extension
+    assert info["resized"] is False and info["size"] == (640, 480) and info["tokens"] == image_tokens(640, 480)
+
+
+def test_oversized_image_is_downscaled(tmp_path):
+    path = write(tmp_path, "scan.jpg", encode("JPEG", size=(2000, 1000)))
+    data, mime_type, info = prepare_image(path, max_side=500)
+    assert mime_type == "image/jpeg" and info["resized"] is True
+    assert info["original_size"] == (2000, 1000) and info["size"] == (500, 250)
+    assert image_size(data) == (500, 250) and info["sent_bytes"] == len(data)
+
+
+def test_oversized_image_with_alpha_stays_png(tmp_path):
+    path = write(tmp_path, "logo.png", encode("PNG", size=(800, 800), mode="RGBA"))
+    data, mime_type, info = prepare_image(path, max_side=400)
+    assert mime_type == "image/png" and image_size(data) == (400, 400)
+
+
+def test_unsupported_format_is_converted_even_when_small(tmp_path):
+    data, mime_type, info = prepare_image(write(tmp_path, "anim.gif", encode("GIF")), max_side=1024)
+    assert mime_type == "image/jpeg" and info["resized"] is True and info["size"] == (37, 21)
+
+
+def test_large_files_are_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_input, "MMAP_THRESHOLD", 0)
+    original = encode("WEBP", size=(300, 200))
+    data, mime_type, info = prepare_image(write(tmp_path, "a.webp", original))
+    assert data == original and isinstance(data, bytes) and mime_type == "image/webp"
+    part, info = load_image_part(write(tmp_path, "b.jpg", encode("JPEG", size=(4000, 20))), max_side=1000)
+    assert part.inline_data.mime_type == "image/jpeg" and info["size"] == (1000, 5)
+
+
+def test_not_an_image(tmp_path):
+    with pytest.raises(ValueError):
+        prepare_image(write(tmp_path, "notes.png", b"just text, not a picture"))
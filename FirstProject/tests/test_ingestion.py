@@ -0,0 +1,59 @@
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+import ingestion
+from ingestion import load_manifest, open_vector_store, plan_changes, sync_index
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "policy.txt").write_text("SECTION 1: TRAVEL\nEconomy class for flights under 6 hours.\n", encoding="utf-8")
+    (data_dir / "leave.txt").write_text("SECTION 1: LEAVE\n25 days of annual leave.\n", encoding="utf-8")
+    return data_dir, tmp_path / "store"
+
+
+def _stored(persist_dir, backend) -> int:
+    _, _, vector_store = open_vector_store(str(persist_dir), backend=backend)
+    if backend == "mmap":
+        return vector_store.count()
+    return vector_store._collection.count()
+
+
+def test_backend_switch_drops_vectors_orphaned_on_the_target(corpus):
+    pytest.importorskip("chromadb")
+    data_dir, persist_dir = corpus
+    sync_index(str(data_dir), str(persist_dir), backend="chroma")
+    sync_index(str(data_dir), str(persist_dir), backend="mmap")
+    # Edited while on mmap: Chroma still holds the old version's chunks
+    (data_dir / "policy.txt").write_text("SECTION 1: TRAVEL\nBusiness class for flights over 6 hours.\n", encoding="utf-8")
+    sync_index(str(data_dir), str(persist_dir), backend="mmap")
+    sync_index(str(data_dir), str(persist_dir), backend="chroma")
+
+    manifest = load_manifest(str(persist_dir))
+    expected = sum(len(entry["chunk_ids"]) for entry in manifest["files"].values())
+    assert manifest["backend"] == "chroma"
+    assert _stored(persist_dir, "chroma") == expected
+
+
+def test_plan_records_the_stat_taken_with_the_hash(corpus):
+    data_dir, _ = corpus
+    stat = (data_dir / "leave.txt").stat()
+    changed, removed = plan_changes(str(data_dir), {"files": {}})
+    assert changed["leave.txt"]["size"] == stat.st_size
+    assert changed["leave.txt"]["mtime"] == stat.st_mtime
+    assert set(changed) == {"leave.txt", "policy.txt"} and removed == []
+
+
+def test_manifest_saves_are_batched(corpus, monkeypatch):
+    data_dir, persist_dir = corpus
+    for i in range(120):
+        (data_dir / f"memo_{i:03}.txt").write_text(f"Memo {i}: office closed on day {i}.\n", encoding="utf-8")
+    saves = []
+    monkeypatch.setattr(ingestion, "MANIFEST_SAVE_INTERVAL_S", 3600.0)
+    monkeypatch.setattr(ingestion, "save_manifest", lambda manifest, persist_dir: saves.append(len(manifest["files"])))
+    sync_index(str(data_dir), str(persist_dir), backend="mmap")
+    # after the pre-embedding cleanup, then every MANIFEST_SAVE_EVERY_FILES files, then the last file
+    assert saves == [0, 50, 100, 122]
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+from google.genai import types
+
+from latency_metrics import LatencyRecorder
+
+
+def usage(output_tokens: int) -> types.GenerateContentResponseUsageMetadata:
+    return types.GenerateContentResponseUsageMetadata(prompt_token_count=10, candidates_token_count=output_tokens)
+
+
+def rate(recorder: LatencyRecorder, model: str = "m", site: str = "s"):
+    hist = recorder.histograms.get(("output_tokens_per_second", model, site))
+    return hist.sum / hist.count if hist else None
+
+
+def test_single_chunk_stream_has_no_rate():
+    recorder = LatencyRecorder(json_path=None, prom_path=None)
+    recorder.record_call("m", "s", start=0.0, end=2.0, first_chunk=1.999, gaps=[], usage=usage(500))
+    assert rate(recorder) is None
+    assert recorder.histograms[("ttft_seconds", "m", "s")].count == 1
+
+
+def test_stream_rate_covers_the_whole_call():
+    recorder = LatencyRecorder(json_path=None, prom_path=None)
+    recorder.record_call("m", "s", start=0.0, end=2.0, first_chunk=1.9, gaps=[0.05, 0.05], usage=usage(100))
+    assert rate(recorder) == 50.0
+
+
+def test_unary_call_rate():
+    recorder = LatencyRecorder(json_path=None, prom_path=None)
+    recorder.record_call("m", "s", start=0.0, end=4.0, usage=usage(100))
+    assert rate(recorder) == 25.0
+
+
+def test_streamed_chunks_are_timed():
+    recorder = LatencyRecorder(json_path=None, prom_path=None)
+    chunks = [SimpleNamespace(usage_metadata=None), SimpleNamespace(usage_metadata=usage(3))]
+    assert len(list(recorder._timed_stream(lambda: iter(chunks), "m", "s"))) == 2
+    assert recorder.calls[-1]["chunks"] == 2
+    assert recorder.histograms[("inter_chunk_gap_seconds", "m", "s")].count == 1
+
+
+def test_prometheus_label_values_are_escaped():
+    recorder = LatencyRecorder(json_path=None, prom_path=None)
+    recorder.record_call("m", 'agent "a"\\b\nc', start=0.0, end=1.0, usage=usage(1))
+    recorder.observe_stage('sql "x"', "s", 0.1)
+    text = recorder.prometheus_text()
+    assert 'site="agent \\"a\\"\\\\b\\nc"' in text
+    assert 'stage="sql \\"x\\""' in text
+    assert all(line.count("{") <= 1 for line in text.splitlines())
+    assert len([l for l in text.splitlines() if l.startswith("genai_calls_total")]) == 1
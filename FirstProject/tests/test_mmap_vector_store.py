@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import (
+    FilterCondition, FilterOperator, MetadataFilter, MetadataFilters, VectorStoreQuery)
+from mmap_vector_store import MmapVectorStore, matches_filters
+
+DIM = 16
+
+
+def _vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def _nodes(vectors, prefix: str = "n", year_of=lambda i: 2020 + i % 3) -> list[TextNode]:
+    return [TextNode(id_=f"{prefix}{i}", text=f"chunk {i}", embedding=v.tolist(),
+                     metadata={"year": year_of(i), "file_name": f"policy_{i % 2}.txt"})
+            for i, v in enumerate(vectors)]
+
+
+def _query(store, vector, k: int = 3, filters=None):
+    return store.query(VectorStoreQuery(query_embedding=list(map(float, vector)), similarity_top_k=k, filters=filters))
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_add_and_query_round_trip(tmp_path, dtype):
+    vectors = _vectors(50)
+    store = MmapVectorStore(str(tmp_path / "store"), dtype=dtype)
+    assert store.add(_nodes(vectors)) == [f"n{i}" for i in range(50)]
+    assert store.count() == 50
+    result = _query(store, vectors[7])
+    assert result.ids[0] == "n7"
+    assert result.similarities[0] == pytest.approx(1.0, abs=0.02)
+    assert result.nodes[0].get_content() == "chunk 7" and result.nodes[0].metadata["year"] == 2021
+
+
+def test_upsert_replaces_the_existing_row(tmp_path):
+    vectors = _vectors(10)
+    store = MmapVectorStore(str(tmp_path / "store"))
+    store.add(_nodes(vectors))
+    replacement = TextNode(id_="n3", text="new text", embedding=(-vectors[3]).tolist())
+    store.add([replacement])
+    assert store.count() == 10
+    assert _query(store, -vectors[3], k=1).nodes[0].get_content() == "new text"
+    assert "n3" not in _query(store, vectors[3], k=10).ids[:1]
+
+
+def test_delete_then_compaction(tmp_path):
+    path = tmp_path / "store"
+    store = MmapVectorStore(str(path))
+    vectors = _vectors(20)
+    store.add(_nodes(vectors))
+    store.delete_nodes(["n0", "n1"])
+    assert store.count() == 18 and store._header["generation"] == 0
+    store.delete_nodes(["n2", "n3", "n4"])   # 5 / 20 deleted: over COMPACT_DELETED_RATIO
+    assert store._header["generation"] == 1 and store._header["deleted"] == []
+    assert sorted(os.listdir(path)) == ["nodes.1.jsonl", "store.json", "vectors.1.bin"]
+    assert store.count() == 15
+    assert _query(store, vectors[10], k=1).ids == ["n10"]
+    assert not {"n0", "n1", "n2", "n3", "n4"} & set(_query(store, vectors[0], k=20).ids)
+
+
+def test_delete_by_document_and_clear(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"), ivf_min_rows=10**9)
+    nodes = _nodes(_vectors(40))
+    for i, node in enumerate(nodes):
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="handbook" if i < 4 else "memo")
+    store.add(nodes)
+    store.delete("handbook")
+    assert store.count() == 36
+    assert not {"n0", "n1", "n2", "n3"} & {n.node_id for n in store.get_nodes()}
+    store.clear()
+    assert store.count() == 0 and _query(store, _vectors(1)[0]).ids == []
+    store.add(nodes[:2])
+    assert store.count() == 2
+
+
+def test_other_instance_sees_writes(tmp_path):
+    path = str(tmp_path / "store")
+    writer = MmapVectorStore(path, dtype="float16")
+    vectors = _vectors(30)
+    writer.add(_nodes(vectors[:20]))
+    reader = MmapVectorStore(path)   # dtype comes from the header
+    assert reader.count() == 20
+    writer.add(_nodes(vectors[20:], prefix="m"))
+    writer.delete_nodes(["n5"])
+    assert reader.count() == 29
+    assert _query(reader, vectors[25], k=1).ids == ["m5"]
+    assert [n.node_id for n in reader.get_nodes(node_ids=["n5", "n6"])] == ["n6"]
+
+
+def test_ivf_search_matches_exact(tmp_path):
+    rng = np.random.default_rng(1)
+    topics = rng.normal(size=(8, DIM))
+    vectors = (topics[rng.integers(8, size=400)] + rng.normal(scale=0.3, size=(400, DIM))).astype(np.float32)
+    store = MmapVectorStore(str(tmp_path / "store"), ivf_min_rows=100, nprobe=4)
+    store.add(_nodes(vectors))
+    assert store._ivf is not None
+    store.add(_nodes(vectors[:5] * -1, prefix="late"))   # added after the build: still found through the tail
+    for i in (0, 17, 250):
+        assert store.search(vectors[i], 1)[0][0][0] == f"n{i}"
+    assert store.search(-vectors[2], 1)[0][0][0] == "late2"
+    exact = store.search_rows(vectors[:20], 5, exact=True)[0]
+    approx = store.search_rows(vectors[:20], 5)[0]
+    assert np.mean([len(set(a) & set(e)) / 5 for a, e in zip(approx, exact)]) >= 0.8
+
+
+def test_metadata_filters(tmp_path):
+    vectors = _vectors(30)
+    store = MmapVectorStore(str(tmp_path / "store"))
+    store.add(_nodes(vectors))
+    only_2022 = MetadataFilters(filters=[MetadataFilter(key="year", value=2022)])
+    result = _query(store, vectors[0], k=30, filters=only_2022)
+    assert result.ids and all(node.metadata["year"] == 2022 for node in result.nodes)
+    assert len(result.ids) == 10
+    either = MetadataFilters(filters=[MetadataFilter(key="year", value=[2020, 2021], operator=FilterOperator.IN),
+                                      MetadataFilter(key="file_name", value="policy_1.txt")],
+                             condition=FilterCondition.AND)
+    assert {n.metadata["year"] for n in _query(store, vectors[0], k=30, filters=either).nodes} == {2020, 2021}
+    assert all(n.metadata["file_name"] == "policy_1.txt" for n in _query(store, vectors[0], k=30, filters=either).nodes)
+    store.delete_nodes(filters=only_2022)
+    assert store.count() == 20
+
+
+def test_matches_filters_operators():
+    metadata = {"year": 2024, "section": "TRAVEL EXPENSE", "tags": ["travel", "mileage"]}
+    f = lambda key, value, op=FilterOperator.EQ: MetadataFilter(key=key, value=value, operator=op)
+    assert matches_filters(metadata, MetadataFilters(filters=[f("year", 2023, FilterOperator.GT)]))
+    assert not matches_filters(metadata, MetadataFilters(filters=[f("year", "2023", FilterOperator.GT)]))
+    assert matches_filters(metadata, MetadataFilters(filters=[f("tags", "mileage", FilterOperator.CONTAINS)]))
+    assert matches_filters(metadata, MetadataFilters(filters=[f("section", "travel", FilterOperator.TEXT_MATCH_INSENSITIVE)]))
+    assert matches_filters(metadata, MetadataFilters(filters=[f("year", 2020), f("year", 2024)], condition=FilterCondition.OR))
+    assert matches_filters(metadata, MetadataFilters(filters=[f("year", 2020)], condition=FilterCondition.NOT))
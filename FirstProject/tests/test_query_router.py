@@ -0,0 +1,58 @@
+import json
+import numpy as np
+
+from query_router import QueryRouter, ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE
+
+
+class FakeEmbedding:
+    """Bag-of-words vectors over a tiny vocabulary; records which embedding method was used."""
+    VOCAB = ["policy", "reimbursement", "remote", "weather", "rain", "temperature", "hello", "thanks"]
+
+    def __init__(self):
+        self.calls = {"query": 0, "text": 0}
+
+    def _vector(self, text: str) -> list[float]:
+        words = text.lower()
+        return [float(w in words) for w in self.VOCAB] + [0.1]
+
+    def get_query_embedding(self, text: str) -> list[float]:
+        self.calls["query"] += 1
+        return self._vector(text)
+
+    def get_text_embedding_batch(self, texts: list[str]) -> list[list[float]]:
+        self.calls["text"] += len(texts)
+        return [self._vector(t) for t in texts]
+
+
+ROUTES = [ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE]
+
+
+def test_exemplars_and_prompts_use_the_query_embedding():
+    embed = FakeEmbedding()
+    router = QueryRouter(embed, routes=ROUTES)
+    assert embed.calls["text"] == 0
+    decision = router.route("Will it rain tomorrow?")
+    assert decision.routes[0] == ROUTE_TOOL
+    assert np.allclose(np.linalg.norm(router._matrix, axis=1), 1.0)
+
+
+def test_decisions_are_not_logged_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    QueryRouter(FakeEmbedding(), routes=ROUTES).route("What is the remote work policy?")
+    assert not any(tmp_path.rglob("*.jsonl"))
+
+
+def test_log_stores_a_hash_and_rotates(tmp_path):
+    log_path = tmp_path / "router.jsonl"
+    router = QueryRouter(FakeEmbedding(), routes=ROUTES, log_path=str(log_path), log_max_bytes=600)
+    prompt = "My employee id is 4711, what is the reimbursement policy?"
+    for _ in range(5):
+        router.route(prompt)
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert records and "prompt" not in records[0]
+    assert len(records[0]["prompt_sha256"]) == 16
+    assert "4711" not in log_path.read_text()
+    assert (tmp_path / "router.jsonl.1").exists()
+    assert log_path.stat().st_size <= 600
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["router.jsonl", "router.jsonl.1"]
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import event
+from bulk_loader import build_demo_database
+from db_engines import create_sql_engine
+import schema_snapshot
+from schema_snapshot import SnapshotSQLDatabase, load_sql_database, snapshot_path
+
+TABLES = ["employee_info", "Sales_Data"]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_sql_engine(f"sqlite:///{tmp_path / 'demo.sqlite3'}")
+    build_demo_database(engine, 20, 10, 50)
+    yield engine
+    engine.dispose()
+
+
+def _statements(engine) -> list[str]:
+    seen = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, sql, *args: seen.append(sql))
+    return seen
+
+
+def test_snapshot_skips_reflection(engine, tmp_path):
+    reflected = load_sql_database(engine, TABLES, str(tmp_path))
+    seen = _statements(engine)
+    restored = load_sql_database(engine, TABLES, str(tmp_path))
+    assert isinstance(restored, SnapshotSQLDatabase)
+    assert not any("table_xinfo" in sql or "table_info" in sql for sql in seen)
+    assert restored.get_usable_table_names() == reflected.get_usable_table_names()
+    assert restored.get_single_table_info("employee_info") == reflected.get_single_table_info("employee_info")
+    assert restored.run_sql("SELECT COUNT(*) FROM employee_info")[1]["result"] == [(20,)]
+
+
+@pytest.mark.parametrize("payload", [b"not a pickle", b"\x80\x04\x95", b"\x80\x04]\x94."])
+def test_unusable_snapshot_is_rebuilt(engine, tmp_path, payload):
+    load_sql_database(engine, TABLES, str(tmp_path))
+    with open(snapshot_path(engine, TABLES, str(tmp_path)), "wb") as f:
+        f.write(payload)
+    assert load_sql_database(engine, TABLES, str(tmp_path)).get_usable_table_names()
+    assert isinstance(load_sql_database(engine, TABLES, str(tmp_path)), SnapshotSQLDatabase)
+
+
+def test_snapshot_key_includes_library_versions(engine, tmp_path, monkeypatch):
+    before = snapshot_path(engine, TABLES, str(tmp_path))
+    monkeypatch.setattr(schema_snapshot.sqlalchemy, "__version__", "0.0.0")
+    assert snapshot_path(engine, TABLES, str(tmp_path)) != before
@@ -0,0 +1,48 @@
+import pytest
+from sql_cache import SQLQueryCache, _bind, learn_template
+
+
+def test_string_slot_does_not_swallow_trailing_conditions():
+    template = learn_template("Who earns the highest salary in Sales",
+                              "SELECT name FROM employee_info WHERE department = 'Sales' ORDER BY salary DESC")
+    assert _bind(template, "Who earns the highest salary in Marketing") == {"p0": "Marketing"}
+    assert _bind(template, "Who earns the highest salary in Sales hired after 2020") is None
+
+
+def test_multi_word_slot_matches_same_word_count():
+    template = learn_template("Which employees work in New York",
+                              "SELECT name FROM employee_info WHERE city = 'New York'")
+    assert _bind(template, "Which employees work in Los Angeles") == {"p0": "Los Angeles"}
+    assert _bind(template, "Which employees work in Boston") is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM employee_info WHERE department = 'Sales'",
+    "SELECT AVG(salary) FROM employee_info WHERE department = 'Sales'",
+    "SELECT department, MAX(salary) FROM employee_info WHERE department = 'Sales' GROUP BY department",
+])
+def test_aggregates_are_not_templated(sql):
+    assert learn_template("How many employees in Sales", sql) is None
+
+
+def test_row_limits_stay_literal():
+    template = learn_template("Top 5 earners in Sales",
+                              "SELECT name FROM employee_info WHERE department = 'Sales' ORDER BY salary DESC LIMIT 5")
+    assert template.sql.endswith("LIMIT 5")
+    template = learn_template("Top 5 earners in Sales",
+                              "SELECT TOP (5) name FROM employee_info WHERE department = 'Sales' ORDER BY salary DESC")
+    assert template.sql.startswith("SELECT TOP (5) ")
+
+
+def test_parameters_bind_by_name_not_position():
+    template = learn_template("Employees in Sales earning over 50000",
+                              "SELECT name FROM employee_info WHERE salary > 50000 AND department = 'Sales'")
+    assert _bind(template, "Employees in Finance earning over 70000") == {"p0": 70000, "p1": "Finance"}
+
+
+def test_aggregate_is_served_only_for_the_exact_question(tmp_path):
+    cache = SQLQueryCache("schema", str(tmp_path / "sql_cache.sqlite3"))
+    sql = "SELECT COUNT(*) FROM employee_info WHERE department = 'Sales'"
+    cache.learn("How many employees in Sales", sql)
+    assert cache.lookup("how many employees in sales") == (sql, {}, "exact")
+    assert cache.lookup("How many employees in Sales hired after 2020") is None
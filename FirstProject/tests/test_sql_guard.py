@@ -0,0 +1,170 @@
+import time
+import pytest
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, text
+from sqlalchemy.exc import OperationalError
+from llama_index.core import SQLDatabase
+from bulk_loader import build_demo_database
+from db_engines import create_sql_engine
+from sql_guard import (BoundedSQLDatabase, SQLCostError, SQLGuardError, SQLTimeoutError, estimate_plan,
+                       limit_statement, read_only_session, read_only_violation, statement_deadline)
+from sql_rows import sql_rows_context
+
+EMPLOYEES, PRODUCTS, SALES = 200, 50, 5_000
+
+
+@pytest.fixture(scope="module")
+def sql_database():
+    engine = create_sql_engine("sqlite:///:memory:")
+    build_demo_database(engine, employees=EMPLOYEES, products=PRODUCTS, sales=SALES)
+    documents = Table("documents", MetaData(), Column("doc_id", Integer, primary_key=True),
+                      Column("title", String(50)), Column("body", LargeBinary))
+    documents.create(engine)
+    with engine.begin() as connection:
+        connection.execute(documents.insert(), [{"doc_id": 1, "title": "Policy", "body": b"\x00\x01"}])
+    return SQLDatabase(engine)
+
+
+@pytest.fixture
+def guard(sql_database):
+    return BoundedSQLDatabase(sql_database)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM employee_info",
+    "SELECT department, AVG(salary) FROM employee_info GROUP BY department",
+    "WITH top_paid AS (SELECT name, salary FROM employee_info WHERE salary > 50000) SELECT COUNT(*) FROM top_paid",
+    "SELECT name FROM employee_info UNION SELECT product_name FROM Product_Catalog",
+    "SELECT a.name, b.name FROM employee_info a JOIN employee_info AS b ON a.department = b.department "
+    "WHERE a.employee_id = 1",
+    "SELECT region, SUM(amount) FROM Sales_Data GROUP BY region",
+])
+def test_read_queries_pass_cost_check(guard, sql):
+    _, metadata = guard.run_sql(sql)
+    assert metadata["result"]
+    assert guard.stats["rejected"] == 0
+
+
+def test_aggregate_result_is_exact(guard):
+    _, metadata = guard.run_sql("SELECT COUNT(*) FROM employee_info")
+    assert metadata["result"] == [(EMPLOYEES,)]
+    assert metadata["truncated"] is False
+
+
+def test_alias_scan_is_priced_as_its_table(sql_database):
+    sql = "SELECT a.name FROM employee_info a JOIN employee_info b ON a.salary = b.salary"
+    with sql_database.engine.connect() as connection:
+        plan = estimate_plan(connection, sql, "sqlite")
+    assert "employee_info" in plan.detail
+    assert plan.cost >= EMPLOYEES
+
+
+def test_full_scan_over_budget_is_rejected(sql_database):
+    guard = BoundedSQLDatabase(sql_database, max_cost=SALES // 2)
+    with pytest.raises(SQLCostError):
+        guard.run_sql("SELECT * FROM Sales_Data WHERE quantity > 3")
+    assert guard.stats["rejected"] == 1
+
+
+def test_parameterized_statements_are_cost_checked(sql_database):
+    guard = BoundedSQLDatabase(sql_database, max_cost=SALES // 2)
+    with pytest.raises(SQLCostError):
+        guard.run_sql("SELECT sale_id FROM Sales_Data WHERE region = :region", {"region": "North"})
+    _, metadata = BoundedSQLDatabase(sql_database).run_sql(
+        "SELECT COUNT(*) FROM employee_info WHERE department = :department", {"department": "Sales"})
+    assert metadata["result"][0][0] > 0
+
+
+def test_select_star_is_projected_without_binary_columns(guard):
+    _, metadata = guard.run_sql("SELECT * FROM documents")
+    assert metadata["col_keys"] == ["doc_id", "title"]
+    assert "body" not in metadata["executed_sql"]
+    assert guard.stats["projected"] == 1
+
+
+def test_result_is_truncated_at_max_rows(sql_database):
+    guard = BoundedSQLDatabase(sql_database, max_rows=5)
+    _, metadata = guard.run_sql("SELECT name FROM employee_info")
+    assert len(metadata["result"]) == 5
+    assert metadata["truncated"] is True
+    assert "more rows exist" in sql_rows_context({**metadata, "sql_query": "SELECT name FROM employee_info"})
+
+
+def test_long_statement_is_cancelled(sql_database):
+    guard = BoundedSQLDatabase(sql_database, timeout_s=0.2)
+    slow = ("WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter WHERE x < 1000000000) "
+            "SELECT COUNT(*) FROM counter")
+    with pytest.raises(SQLTimeoutError):
+        guard.run_sql(slow)
+    assert guard.stats["timeouts"] == 1
+
+
+def test_caller_deadline_cancels_before_statement_timeout(sql_database):
+    guard = BoundedSQLDatabase(sql_database, timeout_s=60.0)
+    slow = ("WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter WHERE x < 1000000000) "
+            "SELECT COUNT(*) FROM counter")
+    start = time.monotonic()
+    with statement_deadline(0.2), pytest.raises(SQLTimeoutError):
+        guard.run_sql(slow)
+    assert time.monotonic() - start < 5.0
+    with statement_deadline(0.0), pytest.raises(SQLTimeoutError):
+        guard.run_sql("SELECT name FROM employee_info")
+    assert guard.stats["timeouts"] == 2
+    guard.run_sql("SELECT name FROM employee_info")   # deadline does not outlive the block
+
+
+def test_writes_are_refused(guard):
+    with pytest.raises(SQLGuardError):
+        guard.run_sql("DELETE FROM employee_info")
+
+
+@pytest.mark.parametrize("sql, limited", [
+    ("SELECT name FROM employee_info", "SELECT TOP (201) name FROM employee_info"),
+    ("select distinct department from employee_info", "SELECT distinct TOP (201) department from employee_info"),
+    ("SELECT topic FROM notes", "SELECT TOP (201) topic FROM notes"),
+    # existing TOPs are kept as they are
+    ("SELECT TOP 5 name FROM employee_info", "SELECT TOP 5 name FROM employee_info"),
+    ("SELECT  TOP 5 name FROM employee_info", "SELECT  TOP 5 name FROM employee_info"),
+    ("SELECT DISTINCT TOP 5 name FROM employee_info", "SELECT DISTINCT TOP 5 name FROM employee_info"),
+    ("SELECT DISTINCT\n  TOP(5) name FROM employee_info", "SELECT DISTINCT\n  TOP(5) name FROM employee_info"),
+])
+def test_mssql_row_limit(sql, limited):
+    assert limit_statement(sql, "mssql", 201) == limited
+
+
+@pytest.mark.parametrize("sql", [
+    "WITH x AS (SELECT 1 AS n) DELETE FROM employee_info",
+    "SELECT 1; DELETE FROM employee_info",
+    "SELECT name FROM employee_info;\nDROP TABLE employee_info;",
+    "SELECT name INTO employee_copy FROM employee_info",
+    "select 1 /* comment */ ; exec sp_who",
+    "SELECT 'unterminated; DELETE FROM employee_info",
+])
+@pytest.mark.parametrize("dialect", ["sqlite", "mssql"])
+def test_write_statements_behind_a_select_are_refused(sql, dialect):
+    assert read_only_violation(sql) is not None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT name FROM employee_info WHERE name = 'a; DELETE FROM x'",
+    "SELECT [update], \"delete\" FROM audit -- drop table later; insert",
+    "SELECT created_at, updated_by FROM audit",
+    "SELECT name FROM employee_info;",
+])
+def test_literals_and_comments_do_not_count(sql):
+    assert read_only_violation(sql) is None
+
+
+def test_refused_before_execution(guard):
+    for sql in ("WITH x AS (SELECT 1 AS n) DELETE FROM employee_info", "SELECT 1; DELETE FROM employee_info"):
+        with pytest.raises(SQLGuardError):
+            guard.run_sql(sql)
+    assert guard.run_sql("SELECT COUNT(*) FROM employee_info")[1]["result"] == [(200,)]
+
+
+def test_sqlite_session_refuses_writes(sql_database):
+    with sql_database.engine.connect() as connection:
+        with read_only_session(connection, "sqlite"):
+            with pytest.raises(OperationalError):
+                connection.execute(text("DELETE FROM employee_info"))
+        connection.execute(text("UPDATE employee_info SET salary = salary WHERE employee_id = 1"))
+        connection.rollback()
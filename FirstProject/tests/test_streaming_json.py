@@ -0,0 +1,43 @@
+import json
+import pytest
+from streaming_json import IncrementalJSONParser
+
+DOCUMENT = {"product_name": "Aero \"X\" 2\\\\", "sentiment_score": -0.25, "key_pros": ["light", "quiet"],
+            "specs": {"weight_g": 950, "colors": []}, "extras": {}, "ok": True, "note": None}
+
+
+def _parse(text: str, chunk: int = 3) -> IncrementalJSONParser:
+    parser = IncrementalJSONParser()
+    for i in range(0, len(text), chunk):
+        parser.feed(text[i:i + chunk])
+    parser.close()
+    return parser
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 7, 1000])
+def test_chunked_parse_matches_json(chunk):
+    text = json.dumps(DOCUMENT)
+    assert _parse(text, chunk).root == json.loads(text)
+
+
+def test_fields_complete_before_the_document():
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"product_name": "Aero", "sentiment_score": 0.5, "key_pros": ["li')
+    assert [(e.path, e.value) for e in events] == [(("product_name",), "Aero"), (("sentiment_score",), 0.5)]
+    assert parser.root == {"product_name": "Aero", "sentiment_score": 0.5, "key_pros": []}
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1]',            # closer of the wrong type
+    '[1, 2}',
+    '{"a": [1, 2}}',
+    '{"a": 1,}',           # trailing commas
+    '[1, 2,]',
+    '{"a": {"b": 1,}}',
+    '{"a"}',               # key without a value
+    '{"a":}',
+    '[,]',
+])
+def test_malformed_documents_are_rejected(text):
+    with pytest.raises(ValueError):
+        _parse(text, 1)
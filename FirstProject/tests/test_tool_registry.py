@@ -0,0 +1,147 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+import tool_registry
+from tool_registry import CachePolicy, CachedTool, SQLiteToolStore, ToolRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tool_registry.time, "time", clock)
+    return clock
+
+
+class Upstream:
+    """A tool that counts its calls and can be held until `release` is set."""
+
+    def __init__(self, hold: bool = False):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, city: str) -> dict:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {"city": city, "version": self.calls}
+
+
+def cached(upstream, **policy) -> CachedTool:
+    def get_weather(city: str) -> dict:
+        return upstream(city)
+    return CachedTool(get_weather, CachePolicy(**policy))
+
+
+def test_ttl_expiry(clock):
+    upstream = Upstream()
+    tool = cached(upstream, ttl_s=60)
+    assert tool("Boston")["version"] == 1
+    clock.now += 59
+    assert tool(city="Boston")["version"] == 1
+    clock.now += 2
+    assert tool("Boston")["version"] == 2
+    assert tool.stats["hits"] == 1 and tool.stats["misses"] == 2
+
+
+def test_key_fn_normalizes_arguments(clock):
+    upstream = Upstream()
+    tool = cached(upstream, ttl_s=60, key_fn=lambda city: city.strip().lower())
+    tool("Boston")
+    tool(" boston ")
+    assert upstream.calls == 1
+
+
+def test_lru_eviction(clock):
+    upstream = Upstream()
+    tool = cached(upstream, ttl_s=60, max_entries=2, key_fn=lambda city: city)
+    tool("a"), tool("b"), tool("a"), tool("c")   # "b" is least recently used
+    assert list(tool._entries) == ["a", "c"]
+    tool("a")
+    assert upstream.calls == 3
+    tool("b")
+    assert upstream.calls == 4
+
+
+def test_concurrent_misses_share_one_call(clock):
+    upstream = Upstream(hold=True)
+    tool = cached(upstream, ttl_s=60)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(tool, "Boston") for _ in range(8)]
+        upstream.started.wait(5)
+        upstream.release.set()
+        results = [f.result(5) for f in futures]
+    assert upstream.calls == 1
+    assert all(r == {"city": "Boston", "version": 1} for r in results)
+
+
+def test_errors_are_not_cached(clock):
+    def flaky(city: str) -> str:
+        flaky.calls += 1
+        if flaky.calls == 1:
+            raise TimeoutError
+        return city
+    flaky.calls = 0
+    tool = CachedTool(flaky, CachePolicy(ttl_s=60))
+    with pytest.raises(TimeoutError):
+        tool("Boston")
+    assert tool("Boston") == "Boston" and tool.stats["errors"] == 1 and not tool._inflight
+
+
+def test_stale_reads_start_a_single_refresh(clock):
+    upstream = Upstream()
+    tool = cached(upstream, ttl_s=60, stale_while_revalidate_s=30)
+    tool("Boston")
+    upstream.release.clear()
+    upstream.started.clear()
+    clock.now += 70
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        stale = list(pool.map(lambda _: tool("Boston"), range(8)))
+    assert all(r["version"] == 1 for r in stale)
+    upstream.started.wait(5)
+    assert tool.stats["refreshes"] == 1 and tool.stats["stale_hits"] == 8
+
+    upstream.release.set()
+    for _ in range(100):
+        if not tool._inflight:
+            break
+        threading.Event().wait(0.01)
+    assert upstream.calls == 2
+    assert tool("Boston")["version"] == 2
+
+
+def test_beyond_the_stale_window_is_a_miss(clock):
+    upstream = Upstream()
+    tool = cached(upstream, ttl_s=60, stale_while_revalidate_s=30)
+    tool("Boston")
+    clock.now += 91
+    assert tool("Boston")["version"] == 2 and tool.stats["refreshes"] == 0
+
+
+def test_shared_store_and_registry(clock, tmp_path):
+    store = SQLiteToolStore(str(tmp_path / "tools.sqlite3"))
+    upstream = Upstream()
+    registry = ToolRegistry(store)
+
+    @registry.register(CachePolicy(ttl_s=60))
+    def get_weather(city: str) -> dict:
+        """Weather for a city."""
+        return upstream(city)
+
+    assert get_weather.__name__ == "get_weather" and get_weather.__doc__ == "Weather for a city."
+    get_weather("Boston")
+    other_process = CachedTool(get_weather.cache.fn, CachePolicy(ttl_s=60), store)
+    assert other_process("Boston")["version"] == 1 and upstream.calls == 1
+    assert registry.stats()["get_weather"]["misses"] == 1
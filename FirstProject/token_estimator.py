@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import math
+import struct
+import inspect
+import threading
+from google.genai import types
+
+# --- Configuration ---
+DEFAULT_MODEL = "gemini-2.5-flash"
+CALIBRATION_PATH = "./cache/token_calibration.json"
+CALIBRATION_ALPHA = 0.2           # EMA weight of each new usage_metadata observation
+IMAGE_TILE_TOKENS = 258           # Gemini 2.x: an image <= 384px per side, or each 768x768 tile of a larger one
+IMAGE_SMALL_SIDE = 384
+IMAGE_TILE_SIDE = 768
+PDF_PAGE_TOKENS = 258
+UNKNOWN_BLOB_TOKENS = 258         # audio/video/other bytes without a cheap duration or size estimate
+PART_OVERHEAD_TOKENS = 2          # role/turn markers per history entry
+MAX_MEMOIZED_CONTENTS = 50_000
+
+# Letters (any script), single digits (Gemini splits numbers per digit), newlines, other symbols
+TOKEN_PIECE_RE = re.compile(r"[^\W\d_]+|\d|\n|[^\w\s]|_")
+
+
+def text_tokens(text: str) -> int:
+    """
+    Tokenizer-free estimate for Gemini's SentencePiece vocabulary: common words are one token,
+    long words ~one per 8 characters, digits and punctuation one each, CJK one per character.
+    Spaces merge into the following word.
+    """
+    if not text:
+        return 0
+    total = 0
+    for piece in TOKEN_PIECE_RE.findall(text):
+        if len(piece) == 1:
+            total += 1
+        elif ord(piece[0]) >= 0x2E80:
+            total += len(piece)
+        else:
+            total += 1 + (len(piece) - 1) // 8
+    return total
+
+
+# --- 1. MEDIA SIZES FROM HEADERS (no decoding) ---
+def image_size(data: bytes) -> tuple[int, int] | None:
+    """(width, height) from a PNG, GIF, JPEG or WebP header, or None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", data[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return w, h
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def image_tokens(width: int, height: int) -> int:
+    if width <= IMAGE_SMALL_SIDE and height <= IMAGE_SMALL_SIDE:
+        return IMAGE_TILE_TOKENS
+    return IMAGE_TILE_TOKENS * math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE)
+
+
+def blob_tokens(data: bytes | None, mime_type: str | None) -> int:
+    """Tokens for inline bytes (Part.from_bytes): images by tile count, PDFs by page count."""
+    mime_type = mime_type or ""
+    if data and mime_type.startswith("image/"):
+        size = image_size(data)
+        return image_tokens(*size) if size else IMAGE_TILE_TOKENS
+    if data and mime_type == "application/pdf":
+        pages = len(re.findall(rb"/Type\s*/Page(?!s)", data))
+        return PDF_PAGE_TOKENS * max(1, pages)
+    if mime_type.startswith("text/") and data:
+        return text_tokens(data.decode("utf-8", errors="replace"))
+    return UNKNOWN_BLOB_TOKENS
+
+
+# --- 2. CALIBRATED ESTIMATOR ---
+class TokenEstimator:
+    """
+    Local token counts for text, function calls/responses and inline media, scaled by a per-model
+    correction factor learned from the usage_metadata of real responses (see `observe`).
+    Contents are counted once and memoized, so counting a growing chat history is O(new entries).
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, calibration_path: str | None = CALIBRATION_PATH):
+        self.model = model
+        self.calibration_path = calibration_path
+        self.ratio = 1.0
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._content_cache: dict[int, tuple[types.Content, int]] = {}
+        if calibration_path and os.path.exists(calibration_path):
+            try:
+                with open(calibration_path, "r", encoding="utf-8") as f:
+                    entry = json.load(f).get(model, {})
+                self.ratio, self.samples = entry.get("ratio", 1.0), entry.get("samples", 0)
+            except (json.JSONDecodeError, OSError):
+                pass
+
+    # --- Raw (uncalibrated) counts ---
+    def _raw_part(self, part: types.Part) -> int:
+        if part.text:
+            return text_tokens(part.text)
+        if part.function_call:
+            return 3 + text_tokens(part.function_call.name) + text_tokens(json.dumps(part.function_call.args or {}))
+        if part.function_response:
+            return 3 + text_tokens(part.function_response.name) + \
+                text_tokens(json.dumps(part.function_response.response or {}, default=str))
+        if part.inline_data:
+            return blob_tokens(part.inline_data.data, part.inline_data.mime_type)
+        if part.file_data:
+            return blob_tokens(None, part.file_data.mime_type)
+        return 0
+
+    def _raw_content(self, content: types.Content) -> int:
+        # Entries are immutable once in a history, so they are keyed by identity
+        key = id(content)
+        cached = self._content_cache.get(key)
+        if cached is not None and cached[0] is content:
+            return cached[1]
+        count = PART_OVERHEAD_TOKENS + sum(self._raw_part(p) for p in content.parts or [])
+        if len(self._content_cache) >= MAX_MEMOIZED_CONTENTS:
+            self._content_cache.clear()
+        self._content_cache[key] = (content, count)
+        return count
+
+    def _raw(self, item) -> int:
+        if item is None:
+            return 0
+        if isinstance(item, str):
+            return text_tokens(item)
+        if isinstance(item, types.Content):
+            return self._raw_content(item)
+        if isinstance(item, types.Part):
+            return self._raw_part(item)
+        if isinstance(item, (list, tuple)):
+            return sum(self._raw(i) for i in item)
+        if callable(item):  # a tool function: name, signature and docstring become its declaration
+            return text_tokens(f"{item.__name__}{inspect.signature(item)}{item.__doc__ or ''}")
+        return text_tokens(str(item))
+
+    # --- Public API ---
+    def count(self, item) -> int:
+        """Estimated tokens for a str, Part, Content, or a list of them (e.g. chat.get_history())."""
+        return round(self._raw(item) * self.ratio)
+
+    def _raw_config(self, config: types.GenerateContentConfig | None) -> int:
+        if config is None:
+            return 0
+        raw = self._raw(config.system_instruction)
+        for tool in config.tools or []:
+            raw += self._raw(tool) if callable(tool) else text_tokens(str(tool))
+        return raw
+
+    def count_config(self, config: types.GenerateContentConfig | None) -> int:
+        """System instruction plus tool declarations, which every request carries."""
+        return round(self._raw_config(config) * self.ratio)
+
+    def observe(self, contents, usage_metadata, config: types.GenerateContentConfig | None = None) -> None:
+        """
+        Updates the correction factor from a real request: `contents` is exactly what was sent,
+        usage_metadata.prompt_token_count is what the API billed for it.
+        """
+        actual = getattr(usage_metadata, "prompt_token_count", None)
+        raw = self._raw(contents) + self._raw_config(config)
+        if not actual or raw <= 0:
+            return
+        with self._lock:
+            observed = min(2.0, max(0.5, actual / raw))
+            self.ratio = observed if self.samples == 0 else \
+                (1 - CALIBRATION_ALPHA) * self.ratio + CALIBRATION_ALPHA * observed
+            self.samples += 1
+            self._save()
+
+    def _save(self) -> None:
+        if not self.calibration_path:
+            return
+        if os.path.dirname(self.calibration_path):
+            os.makedirs(os.path.dirname(self.calibration_path), exist_ok=True)
+        data = {}
+        if os.path.exists(self.calibration_path):
+            try:
+                with open(self.calibration_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                data = {}
+        data[self.model] = {"ratio": self.ratio, "samples": self.samples}
+        tmp_path = self.calibration_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.calibration_path)
+
+    def forget(self, contents) -> None:
+        """Drops memoized counts for entries that left the history (after compaction)."""
+        for content in contents:
+            self._content_cache.pop(id(content), None)
+
+
+_default_estimators: dict[str, TokenEstimator] = {}
+
+
+def get_estimator(model: str = DEFAULT_MODEL) -> TokenEstimator:
+    """One shared, calibrated estimator per model."""
+    if model not in _default_estimators:
+        _default_estimators[model] = TokenEstimator(model)
+    return _default_estimators[model]
+
+
+def estimate_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Calibrated token estimate for plain text (prompt budgets, schema/row truncation)."""
+    return max(1, get_estimator(model).count(text))
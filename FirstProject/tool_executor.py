@@ -0,0 +1,170 @@
+import time
+import asyncio
+import inspect
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from google.genai import types
+from latency_metrics import metrics
+
+# --- Configuration ---
+DEFAULT_TOOL_TIMEOUT_S = 10.0
+DEFAULT_TOOL_CONCURRENCY = 8    # in-flight calls per tool (protects the upstream API / DB pool)
+MAX_WORKERS = 32                # threads for sync tools, shared by all tools
+MAX_TOOL_ROUNDS = 10            # model <-> tool round trips per user turn, like AFC's maximum_remote_calls
+MAX_LATENCY_SAMPLES = 1000      # recent calls per tool behind the stats() percentiles
+
+
+@dataclass
+class ToolSpec:
+    fn: callable
+    timeout_s: float = DEFAULT_TOOL_TIMEOUT_S
+    max_concurrency: int = DEFAULT_TOOL_CONCURRENCY
+
+    @property
+    def name(self) -> str:
+        return self.fn.__name__
+
+
+# --- PARALLEL TOOL EXECUTOR ---
+class ToolExecutor:
+    """
+    Runs every function call from one model turn concurrently and answers with the
+    function_response parts in the order the calls were made.
+    Sync tools run on a shared thread pool, async tools run natively on the event loop.
+    A tool that times out or raises becomes an {"error": ...} response instead of failing the turn.
+
+    Use with automatic function calling disabled (see `config`), and send turns through
+    `send_message` / `asend_message` so the executor handles the tool round trips.
+    """
+
+    def __init__(self, tools: list, max_workers: int = MAX_WORKERS):
+        self.specs = {}
+        for tool in tools:
+            spec = tool if isinstance(tool, ToolSpec) else ToolSpec(tool)
+            self.specs[spec.name] = spec
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        # Sync tools are limited with thread semaphores, async tools with one asyncio semaphore per event loop
+        self._thread_limits = {n: threading.BoundedSemaphore(s.max_concurrency) for n, s in self.specs.items()}
+        self._async_limits = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self.latencies: dict[str, deque[float]] = {n: deque(maxlen=MAX_LATENCY_SAMPLES) for n in self.specs}
+        self.counters = {n: {"calls": 0, "timeouts": 0, "errors": 0} for n in self.specs}
+
+    @property
+    def functions(self) -> list:
+        """The tool callables, for GenerateContentConfig(tools=...)."""
+        return [s.fn for s in self.specs.values()]
+
+    def config(self, **kwargs) -> types.GenerateContentConfig:
+        """GenerateContentConfig with these tools and automatic function calling turned off."""
+        return types.GenerateContentConfig(
+            tools=self.functions,
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+            **kwargs,
+        )
+
+    # --- Single call ---
+    def _record(self, name: str, elapsed: float, outcome: str | None) -> None:
+        with self._stats_lock:
+            self.latencies[name].append(elapsed)
+            self.counters[name]["calls"] += 1
+            if outcome:
+                self.counters[name][outcome] += 1
+
+    def _run_sync(self, spec: ToolSpec, args: dict):
+        with self._thread_limits[spec.name]:
+            return spec.fn(**args)
+
+    def _async_limit(self, name: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        limits = self._async_limits.setdefault(loop, {})
+        if name not in limits:
+            limits[name] = asyncio.Semaphore(self.specs[name].max_concurrency)
+        return limits[name]
+
+    async def _call(self, call: types.FunctionCall) -> types.Part:
+        spec = self.specs.get(call.name)
+        if spec is None:
+            return self._part(call, {"error": f"Unknown function: {call.name}"})
+        args = dict(call.args or {})
+        start = time.perf_counter()
+        outcome = None
+        try:
+            if inspect.iscoroutinefunction(spec.fn):
+                async with self._async_limit(spec.name):
+                    result = await asyncio.wait_for(spec.fn(**args), spec.timeout_s)
+            else:
+                # The thread keeps running after a timeout (threads cannot be killed); only the turn stops waiting
+                future = asyncio.get_running_loop().run_in_executor(self._pool, self._run_sync, spec, args)
+                result = await asyncio.wait_for(future, spec.timeout_s)
+            response = {"result": result}
+        except asyncio.TimeoutError:
+            outcome = "timeouts"
+            response = {"error": f"{call.name} timed out after {spec.timeout_s:.0f}s"}
+        except Exception as e:
+            outcome = "errors"
+            response = {"error": f"{call.name} failed: {e.__class__.__name__}: {e}"}
+        self._record(spec.name, time.perf_counter() - start, outcome)
+        return self._part(call, response)
+
+    @staticmethod
+    def _part(call: types.FunctionCall, response: dict) -> types.Part:
+        return types.Part(function_response=types.FunctionResponse(id=call.id, name=call.name, response=response))
+
+    # --- One model turn ---
+    async def aexecute(self, function_calls: list[types.FunctionCall]) -> list[types.Part]:
+        """All calls concurrently; the parts come back in call order."""
+        return list(await asyncio.gather(*(self._call(c) for c in function_calls)))
+
+    def execute(self, function_calls: list[types.FunctionCall]) -> list[types.Part]:
+        return asyncio.run(self.aexecute(function_calls))
+
+    def send_message(self, chat, message, config: types.GenerateContentConfig | None = None, site: str = "chat"):
+        """
+        chat.send_message plus the tool round trips, each round's calls executed in parallel.
+        `config` overrides the chat's config for every request of the turn (e.g. a cached-content prefix).
+        Every model request is timed in latency_metrics under `site`; tool time under stage "tools".
+        """
+        response = metrics.send_message(chat, message, site, config=config)
+        for _ in range(MAX_TOOL_ROUNDS):
+            if not response.function_calls:
+                break
+            with metrics.span("tools", site):
+                parts = self.execute(response.function_calls)
+            response = metrics.send_message(chat, parts, site, config=config)
+        return response
+
+    async def asend_message(self, chat, message, config: types.GenerateContentConfig | None = None, site: str = "chat"):
+        """Same as send_message for a client.aio chat."""
+        response = await metrics.asend_message(chat, message, site, config=config)
+        for _ in range(MAX_TOOL_ROUNDS):
+            if not response.function_calls:
+                break
+            with metrics.span("tools", site):
+                parts = await self.aexecute(response.function_calls)
+            response = await metrics.asend_message(chat, parts, site, config=config)
+        return response
+
+    # --- Reporting ---
+    def stats(self) -> dict:
+        """Call / timeout / error counts since start; latency figures over the last MAX_LATENCY_SAMPLES calls."""
+        report = {}
+        with self._stats_lock:
+            for name, samples in self.latencies.items():
+                ordered = sorted(samples)
+                entry = dict(self.counters[name])
+                if ordered:
+                    entry.update({
+                        "mean_ms": 1000 * sum(ordered) / len(ordered),
+                        "p50_ms": 1000 * ordered[len(ordered) // 2],
+                        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                        "max_ms": 1000 * ordered[-1],
+                    })
+                report[name] = entry
+        return report
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
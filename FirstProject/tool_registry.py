@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import inspect
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+# --- Configuration ---
+TOOL_CACHE_PATH = "./cache/tool_cache.sqlite3"
+
+
+@dataclass
+class CachePolicy:
+    ttl_s: float                          # fresh for this long
+    max_entries: int = 1024               # in-memory LRU bound per tool
+    key_fn: callable = None               # (**tool_args) -> str, e.g. lambda city: city.strip().lower()
+    stale_while_revalidate_s: float = 0.0  # after ttl_s, serve the old value this long while refreshing it
+
+
+# --- 1. OPTIONAL CROSS-PROCESS STORE ---
+class SQLiteToolStore:
+    """Tool results shared between processes on one machine (JSON-serializable results only)."""
+
+    def __init__(self, path: str = TOOL_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_results ("
+            " tool TEXT, key TEXT, value TEXT, stored_at REAL, PRIMARY KEY (tool, key))"
+        )
+        self._conn.commit()
+
+    def get(self, tool: str, key: str) -> tuple | None:
+        """Returns (value, stored_at) or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM tool_results WHERE tool = ? AND key = ?",
+                                     (tool, key)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, tool: str, key: str, value, stored_at: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO tool_results (tool, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                               (tool, key, json.dumps(value), stored_at))
+            self._conn.commit()
+
+
+# --- 2. MEMOIZED TOOL ---
+class CachedTool:
+    """
+    One tool with its cache: process-wide in-memory LRU, optional shared store behind it,
+    single-flight misses (concurrent callers for the same key share one upstream call) and
+    stale-while-revalidate refreshes in a background thread.
+    """
+
+    def __init__(self, fn, policy: CachePolicy, store: SQLiteToolStore | None = None):
+        self.fn = fn
+        self.name = fn.__name__
+        self.policy = policy
+        self.store = store
+        self._signature = inspect.signature(fn)
+        self._entries: OrderedDict[str, tuple] = OrderedDict()  # key -> (value, stored_at)
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "upstream_calls": 0, "errors": 0}
+
+    def key(self, *args, **kwargs) -> str:
+        arguments = self._signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        if self.policy.key_fn is not None:
+            return str(self.policy.key_fn(**arguments.arguments))
+        return json.dumps(arguments.arguments, sort_keys=True, default=str)
+
+    def _remember(self, key: str, value, stored_at: float) -> None:
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.policy.max_entries:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, key: str) -> tuple | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.store is not None:
+            entry = self.store.get(self.name, key)
+            if entry is not None:
+                self._remember(key, *entry)
+        return entry
+
+    def _claim(self, key: str) -> tuple[Future, bool]:
+        """The in-flight Future for `key` and whether the caller just created it (and must run the tool). Lock held."""
+        future = self._inflight.get(key)
+        if future is not None:
+            return future, False
+        future = self._inflight[key] = Future()
+        return future, True
+
+    def _fetch(self, key: str, args, kwargs):
+        """Runs the tool once for `key`; concurrent callers wait on the same Future."""
+        with self._lock:
+            future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        return self._run(key, future, args, kwargs)
+
+    def _run(self, key: str, future: Future, args, kwargs):
+        with self._lock:
+            self.stats["upstream_calls"] += 1
+        try:
+            value = self.fn(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+            del self._inflight[key]
+        if self.store is not None:
+            self.store.put(self.name, key, value, stored_at)
+        future.set_result(value)
+        return value
+
+    def _refresh(self, key: str, future: Future, args, kwargs) -> None:
+        try:
+            self._run(key, future, args, kwargs)
+        except Exception as e:
+            print(f"(Tool cache: background refresh of {self.name} failed: {e.__class__.__name__})")
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                age = time.time() - entry[1]
+                if age < self.policy.ttl_s:
+                    self.stats["hits"] += 1
+                    return entry[0]
+                if age < self.policy.ttl_s + self.policy.stale_while_revalidate_s:
+                    self.stats["stale_hits"] += 1
+                    # Claimed here, under the lock, so concurrent stale reads start a single refresh
+                    future, owner = self._claim(key)
+                    if owner:
+                        self.stats["refreshes"] += 1
+                        threading.Thread(target=self._refresh, args=(key, future, args, kwargs), daemon=True).start()
+                    return entry[0]
+            self.stats["misses"] += 1
+        return self._fetch(key, args, kwargs)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# --- 3. REGISTRY ---
+class ToolRegistry:
+    """
+    Process-wide set of tools with a declarative cache policy each.
+    `register` returns a function with the tool's own name, signature and docstring, so it can be
+    passed to GenerateContentConfig(tools=...) or ToolExecutor unchanged.
+    """
+
+    def __init__(self, store: SQLiteToolStore | None = None):
+        self.store = store
+        self.tools: dict[str, CachedTool] = {}
+
+    def register(self, policy: CachePolicy | None = None):
+        def decorator(fn):
+            if policy is None:
+                return fn
+            if inspect.iscoroutinefunction(fn):
+                raise TypeError(f"{fn.__name__}: cache policies are only supported for sync tools")
+            cached = CachedTool(fn, policy, self.store)
+            self.tools[cached.name] = cached
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return cached(*args, **kwargs)
+
+            wrapper.cache = cached
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        return {name: dict(tool.stats) for name, tool in self.tools.items()}
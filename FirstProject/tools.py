@@ -0,0 +1,30 @@
+import json
+from tool_registry import ToolRegistry, CachePolicy, SQLiteToolStore
+
+# --- Configuration ---
+PERSIST_TOOL_CACHE = False  # share cached tool results between processes via ./cache/tool_cache.sqlite3
+
+# One registry per process: every chat session (and agent script) sees the same cached results
+registry = ToolRegistry(store=SQLiteToolStore() if PERSIST_TOOL_CACHE else None)
+
+
+def normalize_city(city: str) -> str:
+    """'  boston ' / 'Boston' -> 'boston'."""
+    return " ".join(city.lower().split())
+
+
+# --- 1. TOOL DEFINITIONS (Function Calling) ---
+@registry.register(CachePolicy(ttl_s=600, key_fn=normalize_city, stale_while_revalidate_s=300))
+def get_current_weather(city: str) -> str:
+    """
+    Returns the current weather for a specific city.
+    Args:
+        city: The city name, e.g., 'San Francisco' or 'Tokyo'.
+    """
+    city = city.lower()
+    if "boston" in city:
+        return json.dumps({"temperature": "12°C", "conditions": "Partly Cloudy", "wind": "15 kph"})
+    elif "tokyo" in city:
+        return json.dumps({"temperature": "25°C", "conditions": "Sunny", "wind": "8 kph"})
+    else:
+        return json.dumps({"error": "City Not Found", "code": 404})
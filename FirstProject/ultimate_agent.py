@@ -1,75 +1,144 @@
 import os 
-import json 
-import chromadb
+import time
 from google import genai
 from google.genai import types
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding 
+from embedding_cache import CachedEmbedding
+from ingestion import sync_index, index_fingerprint, scan_data_dir, VECTOR_BACKEND
+from hybrid_retrieval import HybridRetriever, sync_keyword_index
+from semantic_cache import SemanticCache
+from query_router import QueryRouter, gather_contexts, ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE
+from tools import get_current_weather
+from tool_executor import ToolExecutor
+from context_cache import ContextCacheManager, GeminiCacheBackend
+from latency_metrics import metrics
 
 #Config 
 Settings.llm = GoogleGenAI(model="gemini-2.5-flash")
-Settings.embed_model = GoogleGenAIEmbedding(model_name="models/embedding-001")
+Settings.embed_model = CachedEmbedding(GoogleGenAIEmbedding(model_name="models/embedding-001"))
 PERSIST_DIR = "./chroma_db"
 DATA_DIR = "./data"
+USE_SEMANTIC_CACHE = False  # opt-in: reuse answers for near-duplicate questions
+USE_CONTEXT_CACHE = True  # reuse a cached-content handle for the static persona/tools(/corpus) prefix
+CACHE_POLICY_CORPUS = True  # put the whole policy corpus in that prefix when it is small enough
+MAX_CACHED_CORPUS_CHARS = 400_000
+CORPUS_TEXT_EXTENSIONS = (".txt", ".md", ".csv", ".json", ".html", ".htm")  # PDFs etc. need the RAG path
+USE_QUERY_ROUTER = True  # skip the policy index for tool-only / general questions (decided locally, no LLM call)
 client = genai.Client()
 
 
-#1
-def get_current_weather(city: str) -> str:
-    """Returns the current weather for a specified city."""
-    city = city.lower()
-    if "boston" in city:
-        return json.dumps({"temperature": "12C", "conditions": "Cloudy"})
-    else:
-        return json.dumps({"error": "City not found", "code": 404})
+#1 get_current_weather comes from tools.py (shared, TTL-cached per city)
 
 #2
 query_engine_rag = None
 
 try: 
-    #2a
-    documents = SimpleDirectoryReader(DATA_DIR).load_data()
-    db = chromadb.PersistentClient(path=PERSIST_DIR)
-    chroma_collection = db.get_or_create_collection("company_policy")
-    index = VectorStoreIndex.from_documents(documents, collection=chroma_collection)
+    #2a Embed only new/changed files, then load the persisted vector index
+    index = sync_index(DATA_DIR, PERSIST_DIR, backend=VECTOR_BACKEND)
 
-    query_engine_rag = index.as_query_engine()
+    #2b BM25 + vector retrieval fused by rank: exact policy terms are found at a small top-k
+    retriever = HybridRetriever(index, sync_keyword_index(index.vector_store, PERSIST_DIR), site="ultimate_agent")
+    query_engine_rag = RetrieverQueryEngine.from_args(retriever)
 
     print("RAG Index successfully loaded")
 except Exception as e:
-    print("RAG Indexing Failed: {e.__class__.__name__}. RAG functionality diabled.")
+    print(f"RAG Indexing Failed: {e.__class__.__name__}. RAG functionality diabled.")
 
 
 #3
 rag_persona = "You are a highly professional Corporate Information Assistant.  You must answer questions using external tools if possible, otherwise rely on your general knowledge.  Maintain a formal, concise tone."
 
-# Register the tool using the Gemini API's expected format
-weather_tool = types.Tool(
-    function=get_current_weather,
-    name="get_current_weather",
-    description="Returns the current weather for a specified city."
-)
-
-config = types.GenerateContentConfig(
-    system_instructions=rag_persona,
-    tools=[weather_tool]
-)
-
-chat = client.chat.create(
+# Tool calls are run by the executor (parallel, per-tool timeouts); automatic function calling is off.
+# The executor's config also registers the tool in the format the API expects.
+tool_executor = ToolExecutor([get_current_weather])
+config = tool_executor.config(system_instruction=rag_persona)
+
+
+def policy_corpus() -> list:
+    """
+    The policy documents as one cacheable user entry, or [] if they cannot be cached whole:
+    a non-text document (PDF, Office) is in the corpus, or the text exceeds MAX_CACHED_CORPUS_CHARS.
+    Sizes are checked from the stat before anything is read, and reading stops at the limit.
+    """
+    files = scan_data_dir(DATA_DIR)
+    if not files or not all(rel_path.lower().endswith(CORPUS_TEXT_EXTENSIONS) for rel_path in files):
+        return []
+    documents, remaining = [], MAX_CACHED_CORPUS_CHARS
+    for rel_path in sorted(files):
+        if files[rel_path].st_size > 4 * remaining:   # UTF-8: at most 4 bytes per character
+            return []
+        with open(os.path.join(DATA_DIR, rel_path), "r", encoding="utf-8", errors="replace") as f:
+            document = f"POLICY DOCUMENT {rel_path}:\n" + f.read(remaining + 1)
+        remaining -= len(document) + 2
+        if remaining < 0:
+            return []
+        documents.append(document)
+    return [types.Content(role="user", parts=[types.Part(text="\n\n".join(documents))])]
+
+
+# Persona, tool declarations and (optionally) the policy corpus are identical on every request:
+# once they reach the model's minimum cacheable size they are sent as one cached-content handle.
+context_cache = ContextCacheManager(GeminiCacheBackend(client)) if USE_CONTEXT_CACHE else None
+corpus_contents = policy_corpus() if USE_CONTEXT_CACHE and CACHE_POLICY_CORPUS else []
+
+
+def turn_config() -> types.GenerateContentConfig:
+    if context_cache is None:
+        return config
+    return context_cache.config_for("gemini-2.5-flash", config, contents=corpus_contents)
+
+
+chat = client.chats.create(
     model="gemini-2.5-flash",
     config=config
 )
 
+# Answers are reused only while the indexed policy corpus is unchanged
+answer_cache = SemanticCache(
+    Settings.embed_model.get_query_embedding,
+    fingerprint_fn=lambda: index_fingerprint(PERSIST_DIR),
+) if USE_SEMANTIC_CACHE else None
+
+# Decides locally whether a prompt needs the policy index at all
+router = QueryRouter(Settings.embed_model, routes=[ROUTE_RAG, ROUTE_TOOL, ROUTE_NONE]) if USE_QUERY_ROUTER else None
+
+
+def query_policy_index(prompt: str) -> str:
+    print("(Agent attempting RAG query.)")
+    with metrics.span("rag", "ultimate_agent"):
+        rag_response = query_engine_rag.query(prompt)
+    return rag_response.response.strip()
+
 #4
 def run_ultimate_query(prompt: str):
+    if answer_cache is not None:
+        hit = answer_cache.lookup(prompt)
+        if hit is not None:
+            print(f"(Semantic cache hit: similarity {hit.similarity:.3f}, saved ~{hit.saved_latency_s:.2f}s.)")
+            return hit.answer
+
+    # Tool-only / general questions go straight to the chat, which still has the weather tool
+    routes = router.route(prompt).routes if router is not None else [ROUTE_RAG]
+    turn = turn_config()
+    if ROUTE_RAG not in routes:
+        response = tool_executor.send_message(chat, prompt, config=turn, site="ultimate_agent")
+        return response.text.strip()
+    start = time.perf_counter()
+    cacheable = True  # answers built on failed/unavailable retrieval are never cached
+
     rag_context = None
-    if query_engine_rag is not None:
-        print("(Agent attempting RAG query.)")
-        rag_response = query_engine_rag.query(prompt)
-        rag_context = rag_response.response.strip()
+    if turn.cached_content is not None and corpus_contents:
+        # The full policy corpus is already in the cached prefix: no vector query needed
+        rag_context = "The complete policy documents are provided in the cached context above."
+    elif query_engine_rag is not None:
+        # Every routed retriever runs concurrently (only the policy index exists in this agent)
+        rag_context = "\n\n".join(gather_contexts({ROUTE_RAG: lambda: query_policy_index(prompt)}, routes).values())
     else:
         rag_context = "RAG CONTEXT UNAVAILABLE. Cannot access internal documents."
+        cacheable = False
         print("Agent skipping RAG: Engine not initialized.")
 
     final_prompt = (
@@ -77,13 +146,29 @@ def run_ultimate_query(prompt: str):
         f"Based ONLY on the CONTEXT and your available tools, answer the user's question: {prompt}"
     )
 
-    response = chat.send_message(final_prompt)
-    return response.text.strip()
+    response = tool_executor.send_message(chat, final_prompt, config=turn, site="ultimate_agent")
+    answer = response.text.strip()
+    if answer_cache is not None and cacheable:
+        answer_cache.store(prompt, answer, time.perf_counter() - start)
+    return answer
 
 
 query_rag = "What is the policy regarding remote work and how much is the mileage reimbursement rate?"
 response_rag = run_ultimate_query(query_rag)
 
 query_tool =  "What are the current weather conditions in Boston?"
-response_tool = chat.send_message(query_tool)
-print(f"\nQuery 2 (Tool + Persona:\nUser: {query_tool}\nAgent: {response_tool.text})")
\ No newline at end of file
+response_tool = run_ultimate_query(query_tool)  # routed to the tool: the policy index is not queried
+print(f"\nQuery 2 (Tool + Persona:\nUser: {query_tool}\nAgent: {response_tool})")
+
+if router is not None:
+    print(f"\nRouter decisions: {router.counts}")
+
+if answer_cache is not None:
+    answer_cache.export_stats()
+    print(f"\nSemantic cache stats: {answer_cache.stats()}")
+
+if context_cache is not None:
+    print(f"\nContext cache stats: {context_cache.stats}")
+    context_cache.close()
+metrics.export()
+print(f"\nLatency metrics written to {metrics.json_path} and {metrics.prom_path}")
@@ -1,7 +1,6 @@
-import os 
-import json
-from urllib import response
+import os
 from google import genai
+from file_registry import FileRegistry
 
 
 #--- SETUP ---
@@ -9,26 +8,18 @@ client = genai.Client()
 FILE_PATH = "report.txt"
 MODEL_NAME = "gemini-2.5-flash"
 
-uploaded_file = None
+# Uploads are keyed by content hash and reused across questions and runs (./cache/file_registry.json)
+registry = FileRegistry(client)
 
 try:
-    print(f"1. Attempted to upload file: {FILE_PATH}...")
-    
-
-    #---2. UPLOAD FILE ---
-    # client.files.upload handles the heavy lifting and returns a file object (reference).
-    # This file object is now the reference token for the document in Gemini's memory.
-
-    uploaded_file = client.files.upload(
-        file = FILE_PATH,
-        config = {
-            "display_name": "Q3-Technical-Report",
-            "mime_type": "text/plain"
-        }
-    )
+    print(f"1. Getting an uploaded reference for: {FILE_PATH}...")
+
 
-    print(f"    Upload successful. File Name: {uploaded_file.name}")
-    print(f"    The file is ready for analysis at URI: {uploaded_file.uri}")
+    #---2. UPLOAD FILE (only if this exact content has no valid upload yet) ---
+    # The file object (name/uri) is the reference token for the document in Gemini's memory.
+    with registry.use([FILE_PATH]) as (uploaded_file,):
+        print(f"    File Name: {uploaded_file.name}")
+        print(f"    The file is ready for analysis at URI: {uploaded_file.uri}")
 
     prompt = (
         "Based *only* on the provided report, what was the primary quantitative "
@@ -37,22 +28,18 @@ try:
     )
 
     print("\n2. Sending complex mutimodal query to the model...")
-    resonse = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=[prompt, uploaded_file]
-    )
+    # Re-uploads transparently if the stored upload expired or was deleted server-side
+    response = registry.generate_content(MODEL_NAME, prompt, [FILE_PATH])
 
     print("\n--- MODEL ANALYSIS (RAG without DB) ---")
     print(response.text)
     print("---------------------------------------")
-    
-except FileNotFoundError: 
+
+except FileNotFoundError:
     print(f"\n[ERROR] File not found. Please ensure '{FILE_PATH}' exists in your directory.")
 except Exception as e:
     print(f"Error Occured {e}")
 
 finally:
-    if uploaded_file:
-        print(f"\n3. Cleaning up: Deleting uploaded file '{uploaded_file.name}' from Gemini storage...")
-        client.files.delete(name=uploaded_file.name)
-        print("    File deleted successfully.")
\ No newline at end of file
+    # No delete per run: unreferenced uploads are removed by LRU eviction once over the registry limits
+    print(f"\n3. File registry stats: {registry.stats}")
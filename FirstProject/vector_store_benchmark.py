@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import resource
+import multiprocessing
+import numpy as np
+from mmap_vector_store import MmapVectorStore, normalize_rows
+
+# --- Configuration ---
+N_VECTORS = 100_000
+DIM = 768                     # models/embedding-001
+N_QUERIES = 500
+TOP_K = 10
+QUERY_BATCH = 100             # queries per call for the batched QPS figure
+N_TOPICS = 1_000              # synthetic vectors are clustered around topics, like real chunk embeddings
+# Optional (N, DIM) .npy of real corpus embeddings; truncated-dimension results are only
+# meaningful on vectors from a Matryoshka-trained model (e.g. gemini-embedding-001).
+VECTORS_FILE = None
+RESULTS_PATH = "./cache/vector_store_benchmark.json"
+
+BACKENDS = {
+    "mmap-float32": {"dtype": "float32"},
+    "mmap-float16": {"dtype": "float16"},
+    "mmap-int8": {"dtype": "int8"},
+    "mmap-float16-256d": {"dtype": "float16", "output_dimensionality": 256},
+    "mmap-float16-ivf": {"dtype": "float16", "ivf": True},
+    "chroma": {},
+}
+
+
+# --- 1. DATA ---
+def make_dataset(data_dir: str, seed: int = 0) -> None:
+    """Corpus, queries and exact float32 ground truth, written as .npy files the workers memory-map."""
+    rng = np.random.default_rng(seed)
+    if VECTORS_FILE:
+        vectors = normalize_rows(np.load(VECTORS_FILE, mmap_mode="r")[:N_VECTORS])
+        queries = normalize_rows(vectors[rng.choice(len(vectors), N_QUERIES)] + rng.normal(
+            scale=0.5 / np.sqrt(vectors.shape[1]), size=(N_QUERIES, vectors.shape[1])))
+    else:
+        topics = normalize_rows(rng.normal(size=(N_TOPICS, DIM)))
+        noise = 0.9 / np.sqrt(DIM)
+        vectors = normalize_rows(topics[rng.integers(N_TOPICS, size=N_VECTORS)] + rng.normal(scale=noise, size=(N_VECTORS, DIM)))
+        queries = normalize_rows(topics[rng.integers(N_TOPICS, size=N_QUERIES)] + rng.normal(scale=noise, size=(N_QUERIES, DIM)))
+    truth = np.concatenate([np.argsort(-(queries[i:i + QUERY_BATCH] @ vectors.T), axis=1)[:, :TOP_K]
+                            for i in range(0, len(queries), QUERY_BATCH)])
+    for name, array in (("vectors", vectors), ("queries", queries), ("truth", truth)):
+        np.save(os.path.join(data_dir, f"{name}.npy"), array)
+
+
+def _memory() -> dict:
+    """
+    RSS and private memory (what this process does not share with other workers) on Linux.
+    Elsewhere only ru_maxrss is available, and that high-water mark survives exec on some systems.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        kb = lambda name: int(fields[name].split()[0])
+        return {"rss_mb": kb("Rss") / 1024, "private_mb": (kb("Private_Clean") + kb("Private_Dirty")) / 1024}
+    except (OSError, KeyError, ValueError):
+        scale = 1 if sys.platform == "darwin" else 1024   # bytes on macOS, KiB on Linux
+        return {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20}
+
+
+def _disk_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files) / 2**20
+
+
+# --- 2. WORKERS (each in a fresh process, so RSS is per backend) ---
+def _build(backend: str, options: dict, data_dir: str, store_dir: str) -> dict:
+    vectors = np.load(os.path.join(data_dir, "vectors.npy"), mmap_mode="r")
+    start = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+
+        client = chromadb.PersistentClient(path=store_dir)
+        collection = client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+        step = client.get_max_batch_size()
+        for i in range(0, len(vectors), step):
+            collection.add(ids=[str(j) for j in range(i, min(i + step, len(vectors)))],
+                           embeddings=np.asarray(vectors[i:i + step]), documents=[f"chunk {j}" for j in range(i, min(i + step, len(vectors)))])
+    else:
+        from llama_index.core.schema import TextNode
+
+        store = MmapVectorStore(store_dir, dtype=options["dtype"], output_dimensionality=options.get("output_dimensionality"),
+                                ivf_min_rows=0 if options.get("ivf") else sys.maxsize)
+        for i in range(0, len(vectors), 5_000):
+            store.add([TextNode(id_=str(j), text=f"chunk {j}", embedding=vectors[j].tolist())
+                       for j in range(i, min(i + 5_000, len(vectors)))])
+    return {"build_s": time.perf_counter() - start, "disk_mb": _disk_mb(store_dir)}
+
+
+def _query(backend: str, options: dict, data_dir: str, store_dir: str) -> dict:
+    queries = np.load(os.path.join(data_dir, "queries.npy"))
+    truth = np.load(os.path.join(data_dir, "truth.npy"))
+    start = time.perf_counter()
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=store_dir).get_collection("bench")
+        search = lambda q: collection.query(query_embeddings=q, n_results=TOP_K, include=["distances"])["ids"]
+    else:
+        store = MmapVectorStore(store_dir, dtype=options["dtype"])
+        search = lambda q: [[node_id for node_id, _ in hits] for hits in store.search(q, TOP_K)]
+    search(queries[:1])   # first query pays for lazy loading in both backends
+    open_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = [search(queries[i:i + 1])[0] for i in range(len(queries))]
+    single_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(0, len(queries), QUERY_BATCH):
+        search(queries[i:i + QUERY_BATCH])
+    batch_s = time.perf_counter() - start
+
+    recall = np.mean([len({int(x) for x in ids} & set(row.tolist())) / TOP_K for ids, row in zip(found, truth)])
+    return {"open_s": open_s, "qps": len(queries) / single_s, "qps_batched": len(queries) / batch_s,
+            f"recall@{TOP_K}": float(recall), **_memory()}
+
+
+def _in_fresh_process(fn, *args) -> dict:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, args)
+
+
+# --- 3. BENCHMARK ---
+def run_benchmark(backends: dict = BACKENDS) -> dict:
+    """Builds every backend from the same vectors, then queries it from a new process (a cold worker)."""
+    work_dir = tempfile.mkdtemp(prefix="vector_bench_")
+    results = {}
+    try:
+        make_dataset(work_dir)
+        for backend, options in backends.items():
+            if backend == "chroma":
+                try:
+                    import chromadb  # noqa: F401
+                except ImportError:
+                    print("(Benchmark: chromadb not installed, skipping Chroma.)")
+                    continue
+            store_dir = os.path.join(work_dir, backend)
+            results[backend] = {**_in_fresh_process(_build, backend, options, work_dir, store_dir),
+                                **_in_fresh_process(_query, backend, options, work_dir, store_dir)}
+            print(f"{backend:>20}: " + ", ".join(f"{k}={v:,.3f}" for k, v in results[backend].items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if os.path.dirname(RESULTS_PATH):
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+        json.dump({"n_vectors": N_VECTORS, "dim": DIM, "n_queries": N_QUERIES, "top_k": TOP_K, "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"Vector store benchmark: {N_VECTORS:,} x {DIM} vectors, {N_QUERIES} queries, top-{TOP_K}.")
+    run_benchmark()
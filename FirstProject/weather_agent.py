@@ -1,22 +1,11 @@
 import os
-import json
 from google import genai
 from google.genai import types
+from tool_executor import ToolExecutor, ToolSpec
+from tools import get_current_weather, registry as tool_registry
 
 # --- 1. DEFINE YOUR TOOL (PYTHON FUNCTION) ---
-def get_current_weather(city: str) -> str:
-    """
-    Returns the current weather for a specific city.
-    Args:
-        city: The city name, e.g., 'San Francisco' or 'Tokyo'.
-    """
-    city = city.lower()
-    if "boston" in city:
-        return json.dumps({"temperature": "12°C", "conditions": "Partly Cloudy", "wind": "15 kph"})
-    elif "tokyo" in city:
-        return json.dumps({"temperature": "25°C", "conditions": "Sunny", "wind": "8 kph"})
-    else:
-        return json.dumps({"error": "City Not Found", "code": 404})
+# get_current_weather is shared by all agents; see tools.py for its TTL cache policy (per normalized city)
 
 
 # --- 2. INITIALIZE CLIENT AND CONFIGURATION ---
@@ -27,11 +16,10 @@ except Exception as e:
     exit()
 
 # FIX: Remove the 'enable_automatic_function_calling' flag, as your SDK version rejects it.
-# We only pass the tools list via the config.
-config = types.GenerateContentConfig(
-    tools=[get_current_weather],
-    # enable_automatic_function_calling=True <--- REMOVED TO FIX ERROR
-)
+# Automatic function calling is turned off instead: the executor runs all calls from one turn
+# (e.g. Boston AND Tokyo) in parallel, so the turn waits for the slowest call, not the sum of them.
+tool_executor = ToolExecutor([ToolSpec(get_current_weather, timeout_s=10)])
+config = tool_executor.config()
 
 
 # --- 3. START THE CHAT SESSION ---
@@ -51,8 +39,10 @@ except Exception as e:
 user_prompt_1 = "What is the weather like in Boston today? And how about Tokyo?"
 print(f"\nUser: {user_prompt_1}")
 
-# Send the message. We rely on the model's default behavior to call the function.
-response_1 = chat.send_message(user_prompt_1)
+# Send the message. The executor answers the model's function calls, then the model replies.
+response_1 = tool_executor.send_message(chat, user_prompt_1)
 
 # The final response is the model's natural language summary of the function's result.
-print(f"\nAgent: {response_1.text}")
\ No newline at end of file
+print(f"\nAgent: {response_1.text}")
+print(f"\nTool latency: {tool_executor.stats()}")
+print(f"Tool cache: {tool_registry.stats()}")
\ No newline at end of file